@@ -0,0 +1,53 @@
+import sys
+import time
+
+import numpy as np
+
+from GameClient.Headless import *
+from GameClient.FighterAI import *
+from GameClient.Profiler import *
+from Benchmark.BenchmarkSuite import idle_script
+
+
+# time_budget, max_decisions, decision_interval
+modes = (('sliced', AI_TIME_BUDGET, AI_MAX_DECISIONS, AI_DECISION_INTERVAL),
+         ('every_frame', None, sys.maxsize, 0.0))
+
+
+def run_mode(enemy_count, frame_count, time_budget, max_decisions, decision_interval):
+    simulation = HeadlessSimulation(ScriptedInput(idle_script), enemy_count=enemy_count)
+    fighter_ai = simulation.game_client.fighter_ai
+    fighter_ai.time_budget = time_budget
+    fighter_ai.max_decisions = max_decisions
+    fighter_ai.decision_interval = decision_interval
+
+    profiler.enabled = True
+    profiler.clear()
+    frame_times = np.zeros(frame_count, dtype=np.float64)
+    latencies = np.zeros(frame_count, dtype=np.float64)
+    for frame in range(frame_count):
+        start_time = time.perf_counter()
+        simulation.step()
+        frame_times[frame] = time.perf_counter() - start_time
+        latencies[frame] = fighter_ai.get_decision_latency()
+    profiler.enabled = False
+    simulation.exit()
+
+    # the first frames wait for every agent to decide once
+    latencies = latencies[np.isfinite(latencies)]
+    ai = profiler.get_statistics()['ai']
+    return (ai['p50'], ai['p99'], np.percentile(frame_times, 50.0) * 1000.0, np.percentile(frame_times, 99.0) * 1000.0,
+            fighter_ai.decision_count / frame_count, latencies.max() * 1000.0 if len(latencies) else 0.0)
+
+
+def run(enemy_counts=(1, 100, 500), frame_count=300):
+    print("frame budget %.1f ms, decision budget %.1f ms per frame" % (FRAME_BUDGET * 1000.0, AI_TIME_BUDGET * 1000.0))
+    print("%8s %12s %10s %10s %12s %12s %16s %14s" % ("enemies", "mode", "ai p50", "ai p99", "frame p50", "frame p99", "decisions/frame", "latency ms"))
+    for enemy_count in enemy_counts:
+        for name, time_budget, max_decisions, decision_interval in modes:
+            ai_p50, ai_p99, frame_p50, frame_p99, decisions, latency = run_mode(enemy_count, frame_count, time_budget, max_decisions, decision_interval)
+            print("%8d %12s %10.3f %10.3f %12.3f %12.3f %16.1f %14.1f" % (enemy_count, name, ai_p50, ai_p99, frame_p50, frame_p99, decisions, latency))
+
+
+if __name__ == '__main__':
+    run(*[tuple(int(arg) for arg in sys.argv[1].split(','))] if 1 < len(sys.argv) else [])
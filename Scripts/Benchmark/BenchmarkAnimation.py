@@ -0,0 +1,230 @@
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from GameClient.Resource import *
+from GameClient.AnimationLibrary import *
+from GameClient.AnimationSampler import *
+from GameClient.AnimationBlender import *
+from GameClient.Input import *
+from GameClient.Headless import *
+
+
+clip_names = ('idle', 'walk', 'punch', 'kick', 'jump')
+
+
+def slerp(q0, q1, t):
+    dot = np.dot(q0, q1)
+    if dot < 0.0:
+        q1 = -q1
+        dot = -dot
+    if 0.9995 < dot:
+        q = q0 + (q1 - q0) * t
+        return q / np.linalg.norm(q)
+    theta = np.arccos(dot)
+    return (np.sin((1.0 - t) * theta) * q0 + np.sin(t * theta) * q1) / np.sin(theta)
+
+
+def sample_keyframes(animation_data, clip_time):
+    # what every skinned fighter does without the tables, a key search, slerp and matrix per bone
+    palette = np.zeros((len(animation_data), 4, 4), dtype=np.float32)
+    for bone_index, bone_animation_data in enumerate(animation_data):
+        times = bone_animation_data['times']
+        index = min(max(0, int(np.searchsorted(times, clip_time, side='right')) - 1), len(times) - 1)
+        next_index = min(index + 1, len(times) - 1)
+        span = times[next_index] - times[index]
+        t = min(1.0, max(0.0, (clip_time - times[index]) / span)) if 0.0 < span else 0.0
+        rotation = slerp(bone_animation_data['rotations'][index].astype(np.float64), bone_animation_data['rotations'][next_index].astype(np.float64), t)
+        location = bone_animation_data['locations'][index] * (1.0 - t) + bone_animation_data['locations'][next_index] * t
+        scale = np.mean(bone_animation_data['scales'][index] * (1.0 - t) + bone_animation_data['scales'][next_index] * t)
+        pose = np.concatenate([rotation, location, [scale]]).astype(np.float32)
+        palette[bone_index] = get_pose_matrices(pose)
+    return palette
+
+
+def generate_fighters(fighter_count, frame_count, seed=0, delta=1.0 / 60.0):
+    # every fighter starts its clip on a frame boundary, the way the state machine switches clips
+    random = np.random.RandomState(seed)
+    clip_indices = random.randint(0, len(clip_names), fighter_count)
+    start_frames = random.randint(0, 120, fighter_count)
+    frames = np.arange(frame_count)[:, np.newaxis] + start_frames
+    return clip_indices, frames * delta
+
+
+def run(fighter_counts=(1, 100, 500), frame_count=30, project_path=PROJECT_PATH):
+    animation_library = AnimationLibrary(project_path=project_path)
+    animation_datas = {}
+    for clip_name in clip_names:
+        clip_mesh_name = animation_library.get_clip_mesh_name(clip_name)
+        animation_datas[clip_mesh_name] = load_resource_data(animation_library.get_filepath(clip_name))['animation_datas'][0]
+
+    start_time = time.perf_counter()
+    pose_tables = {clip_mesh_name: PoseTable(animation_data) for clip_mesh_name, animation_data in animation_datas.items()}
+    bake_time = time.perf_counter() - start_time
+    print("baked %d clips in %.3f ms, %d bytes of pose tables" % (len(pose_tables), bake_time * 1000.0, sum(pose_table.size for pose_table in pose_tables.values())))
+
+    clip_mesh_names = list(animation_datas.keys())
+    print("%10s %16s %16s %10s %12s" % ("fighters", "keyframes (ms)", "palettes (ms)", "shared", "max error"))
+    for fighter_count in fighter_counts:
+        clip_indices, clip_times = generate_fighters(fighter_count, frame_count)
+        fighter_clips = [clip_mesh_names[clip_index] for clip_index in clip_indices]
+        for clip_name, pose_table in zip(clip_mesh_names, pose_tables.values()):
+            clip_times[:, clip_indices == clip_mesh_names.index(clip_name)] %= pose_table.animation_length
+
+        # the keyframe path is slow, a few frames are enough
+        keyframe_frames = max(1, min(frame_count, 3000 // fighter_count))
+        start_time = time.perf_counter()
+        keyframe_palettes = [[sample_keyframes(animation_datas[clip_name], clip_time) for clip_name, clip_time in zip(fighter_clips, clip_times[frame])]
+                             for frame in range(keyframe_frames)]
+        keyframe_time = (time.perf_counter() - start_time) / keyframe_frames
+
+        bone_palettes = BonePaletteCache(pose_tables.__getitem__)
+        shared_count = 0
+        max_error = 0.0
+        start_time = time.perf_counter()
+        for frame in range(frame_count):
+            bone_palettes.clear()
+            palettes = bone_palettes.get_palettes(fighter_clips, clip_times[frame])
+            shared_count += fighter_count - len(bone_palettes.palettes)
+            if frame < keyframe_frames:
+                max_error = max(max_error, max(np.abs(palette - keyframe_palette).max() for palette, keyframe_palette in zip(palettes, keyframe_palettes[frame])))
+        palette_time = (time.perf_counter() - start_time) / frame_count
+        print("%10d %16.3f %16.3f %9.1f%% %12.6f" % (fighter_count, keyframe_time * 1000.0, palette_time * 1000.0, shared_count * 100.0 / (fighter_count * frame_count), max_error))
+
+
+# crossfade which takes a copy of the pose at every transition and samples into new arrays, for comparison
+class AllocatingBlender:
+    def __init__(self, get_pose_table):
+        self.get_pose_table = get_pose_table
+        self.clip = ClipPlayback()
+        self.blend_source = None
+        self.blend_time = 0.0
+        self.blend_elapsed = 0.0
+        self.output = None
+
+    def play(self, clip_name, speed=1.0, loop=True, start_time=0.0, end_time=-1.0, blend_time=0.5):
+        if self.output is not None and 0.0 < blend_time:
+            self.blend_source = self.output.copy()
+            self.blend_time = blend_time
+            self.blend_elapsed = 0.0
+        self.clip.play(clip_name, self.get_pose_table(clip_name), speed, loop, start_time, end_time)
+
+    def update(self, delta):
+        self.clip.update(delta)
+        pose = self.clip.pose_table.sample(self.clip.time)
+        if self.blend_elapsed < self.blend_time:
+            self.blend_elapsed += delta
+            weight = min(1.0, self.blend_elapsed / self.blend_time)
+            pose = self.blend_source * (1.0 - weight) + pose * weight
+            pose[:, 0:4] = normalize_quaternions(pose[:, 0:4])
+        self.output = pose
+
+    def get_palette(self):
+        return get_pose_matrices(self.output)
+
+
+def run_combo_spam(blender_class, pose_tables, fighter_count, frame_count, layer=False, delta=1.0 / 60.0):
+    # every fighter restarts a punch every 6 frames, with layer the punches go to the upper body of a walk
+    blenders = [blender_class(pose_tables.__getitem__) for i in range(fighter_count)]
+    for index, blender in enumerate(blenders):
+        blender.play('walk' if layer else 'idle', blend_time=0.0)
+        blender.update(delta * index)
+
+    transition_count = 0
+    transition_bytes = 0
+    start_time = time.perf_counter()
+    for frame in range(frame_count):
+        if 0 == frame % 6:
+            # the peak over one play is what the transition allocates, freed or kept
+            for blender in blenders:
+                tracemalloc.reset_peak()
+                current_size = tracemalloc.get_traced_memory()[0]
+                if layer:
+                    blender.play_layer('punch', weight=1.0, start_time=0.0, end_time=0.5)
+                else:
+                    blender.play('punch', loop=False, start_time=0.0, end_time=0.5, blend_time=0.1)
+                transition_bytes += tracemalloc.get_traced_memory()[1] - current_size
+            transition_count += fighter_count
+        for blender in blenders:
+            blender.update(delta)
+            blender.get_palette()
+    frame_time = (time.perf_counter() - start_time) / frame_count
+    return frame_time, transition_bytes / transition_count
+
+
+def run_blenders(fighter_count=100, frame_count=120, project_path=PROJECT_PATH):
+    animation_library = AnimationLibrary(project_path=project_path)
+    pose_tables = {clip_name: animation_library.get_clip_pose_table(clip_name) for clip_name in clip_names}
+
+    # tracemalloc slows both down the same way, the frame times are for comparing the two
+    tracemalloc.start()
+    print("%-28s %14s %20s" % ("combo spam, %d fighters" % fighter_count, "frame (ms)", "bytes / transition"))
+    for name, blender_class, layer in (("allocating crossfade", AllocatingBlender, False),
+                                       ("pooled crossfade", AnimationBlender, False),
+                                       ("pooled upper body layer", AnimationBlender, True)):
+        frame_time, transition_bytes = run_combo_spam(blender_class, pose_tables, fighter_count, frame_count, layer)
+        print("%-28s %14.3f %20.1f" % (name, frame_time * 1000.0, transition_bytes))
+    tracemalloc.stop()
+
+
+def run_game(frame_count=600, enemy_count=20, project_path=PROJECT_PATH):
+    # the headless game with bone palettes on, every fighter has to get a palette of its skeleton every frame
+    simulation = HeadlessSimulation(ScriptedInput(walk_and_punch_script), project_path=project_path, enemy_count=enemy_count, bone_palettes=True)
+    game_client = simulation.game_client
+    bone_count = len(game_client.animation_library.get_clip_pose_table('idle').bone_names)
+    request_count = 0
+    palette_count = 0
+    start_time = time.perf_counter()
+    for frame in range(frame_count):
+        for actor in game_client.fighters.actors:
+            actor.bone_palette = None
+        simulation.step()
+        for actor in game_client.fighters.actors:
+            assert actor.bone_palette is not None and actor.bone_palette.shape == (bone_count, 4, 4), "%s has no palette at frame %d" % (actor.name, frame)
+        request_count += game_client.bone_palettes.request_count
+        palette_count += len(game_client.bone_palettes.palettes)
+    frame_time = (time.perf_counter() - start_time) / frame_count
+    simulation.exit()
+    print("game with bone palettes, %d fighters: %.3f ms per frame, %.1f%% of the shared palettes reused" %
+          (len(game_client.fighters.actors), frame_time * 1000.0, (request_count - palette_count) * 100.0 / max(1, request_count)))
+
+
+def get_walk_punch_script(walk):
+    # a punch pressed on frame 30, with or without W held the whole time
+    def script(frame):
+        press_keys = KEY_FLAG_W if walk else KEY_FLAG_NONE
+        return press_keys, get_key_flag(press_keys, punch=30 <= frame < 34)
+    return script
+
+
+def check_upper_body_layer(frame_count=120, project_path=PROJECT_PATH):
+    # a punch while walking goes to the upper body layer over the walk, a punch standing still replaces the clip
+    for walk in (True, False):
+        simulation = HeadlessSimulation(ScriptedInput(get_walk_punch_script(walk)), project_path=project_path, bone_palettes=True)
+        game_client = simulation.game_client
+        animation_blender = game_client.state_manager.animation_blender
+        layer_frames = 0
+        punch_frames = 0
+        for frame in range(frame_count):
+            simulation.step()
+            if STATES.PUNCH == game_client.state_manager.get_state_key():
+                punch_frames += 1
+                if walk:
+                    assert animation_blender.clip.clip_name == 'walk' and animation_blender.layer.clip_name == 'punch', "the punch at frame %d is not layered over the walk" % frame
+                    layer_frames += 1
+                else:
+                    assert animation_blender.clip.clip_name == 'punch' and not animation_blender.has_layer(), "the punch at frame %d is layered" % frame
+            else:
+                assert not animation_blender.has_layer(), "the layer plays on after the punch at frame %d" % frame
+        simulation.exit()
+        assert 0 < punch_frames, "no punch"
+        print("punch %s: %d frames, %d on the upper body layer" % ("walking" if walk else "standing", punch_frames, layer_frames))
+
+
+if __name__ == '__main__':
+    check_upper_body_layer()
+    run(*[tuple(int(arg) for arg in sys.argv[1].split(','))] if 1 < len(sys.argv) else [])
+    run_blenders()
+    run_game()
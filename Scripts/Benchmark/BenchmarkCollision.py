@@ -0,0 +1,112 @@
+import sys
+import time
+
+import numpy as np
+
+from GameClient.Collision import *
+
+
+class BoundBox:
+    def __init__(self, bound_min, bound_max):
+        self.bound_min = bound_min
+        self.bound_max = bound_max
+
+
+def generate_bound_boxes(count, seed=0):
+    # a ground plane and crates scattered over a stage that grows with the box count
+    random = np.random.RandomState(seed)
+    extent = max(10.0, np.sqrt(count) * 4.0)
+    bound_boxes = [BoundBox(np.array([-extent, -1.0, -extent], dtype=np.float32), np.array([extent, 0.0, extent], dtype=np.float32))]
+    for i in range(count - 1):
+        center = random.uniform(-extent, extent, 3).astype(np.float32)
+        center[1] = 0.0
+        half_size = random.uniform(0.25, 2.0, 3).astype(np.float32)
+        bound_boxes.append(BoundBox(center - half_size, center + half_size))
+    return bound_boxes
+
+
+def generate_moves(frame_count, seed=0, delta=1.0 / 60.0):
+    random = np.random.RandomState(seed + 1)
+    positions = random.uniform(-10.0, 10.0, (frame_count, 3)).astype(np.float32)
+    positions[:, 1] = random.uniform(0.0, 3.0, frame_count)
+    velocities = random.uniform(-6.0, 6.0, (frame_count, 3)).astype(np.float32)
+    velocities[:, 1] = random.uniform(-10.0, 10.0, frame_count)
+    return positions, velocities * delta
+
+
+def brute_force(bound_boxes, old_position, move_vector):
+    position = old_position + move_vector
+    on_ground = False
+    for bound_box in bound_boxes:
+        for i in range(3):
+            if compute_collide(i, old_position, position, move_vector, bound_box):
+                on_ground = True
+    return position, on_ground
+
+
+def brute_force_vectorized(collision_grid, old_position, move_vector):
+    position = old_position + move_vector
+    on_ground = solve_collide(old_position, position, move_vector, collision_grid.bound_mins, collision_grid.bound_maxs)
+    return position, on_ground
+
+
+def broad_phase(collision_grid, old_position, move_vector):
+    position = old_position + move_vector
+    on_ground = collision_grid.collide(old_position, position, move_vector, vectorized=False)
+    return position, on_ground
+
+
+def broad_phase_vectorized(collision_grid, old_position, move_vector):
+    position = old_position + move_vector
+    on_ground = collision_grid.collide(old_position, position, move_vector, vectorized=True)
+    return position, on_ground
+
+
+def run_frames(func, target, positions, move_vectors):
+    results = []
+    start_time = time.perf_counter()
+    for old_position, move_vector in zip(positions, move_vectors):
+        results.append(func(target, old_position, move_vector.copy()))
+    return (time.perf_counter() - start_time) / len(positions), results
+
+
+def run(box_counts=(10, 1000, 50000), frame_count=100):
+    print("%10s %12s %12s %12s %12s %12s" % ("boxes", "build (ms)", "brute (ms)", "numpy (ms)", "grid (ms)", "grid+numpy"))
+    for box_count in box_counts:
+        bound_boxes = generate_bound_boxes(box_count)
+        positions, move_vectors = generate_moves(frame_count)
+
+        start_time = time.perf_counter()
+        collision_grid = CollisionGrid(bound_boxes)
+        build_time = time.perf_counter() - start_time
+
+        # brute force gets expensive quickly, a handful of frames is enough to measure it
+        brute_frames = max(1, min(frame_count, 500000 // (box_count * 3)))
+        brute_time, brute_results = run_frames(brute_force, bound_boxes, positions[:brute_frames], move_vectors[:brute_frames])
+        times = [build_time, brute_time]
+        for func in (brute_force_vectorized, broad_phase, broad_phase_vectorized):
+            elapsed_time, results = run_frames(func, collision_grid, positions, move_vectors)
+            for (brute_position, brute_on_ground), (position, on_ground) in zip(brute_results, results):
+                assert np.array_equal(brute_position, position) and brute_on_ground == on_ground
+            times.append(elapsed_time)
+
+        print("%10d %12.3f %12.3f %12.3f %12.3f %12.3f" % (box_count, *[elapsed_time * 1000.0 for elapsed_time in times]))
+
+
+def run_delta_spikes(box_count=1000, fighter_count=100, deltas=(1.0 / 60.0, 0.1, 0.5), repeat=20):
+    # a delta spike is split into substeps, the broad phase still runs once per frame
+    collision_grid = CollisionGrid(generate_bound_boxes(box_count))
+    positions, velocities = generate_moves(fighter_count, delta=1.0)
+    print("%10s %10s %12s" % ("delta", "substeps", "frame (ms)"))
+    for delta in deltas:
+        move_vectors = velocities * delta
+        start_time = time.perf_counter()
+        for i in range(repeat):
+            collision_grid.collide_batch(positions.copy(), positions + move_vectors, move_vectors.copy())
+        elapsed_time = (time.perf_counter() - start_time) / repeat
+        print("%10.3f %10d %12.3f" % (delta, get_step_counts(move_vectors).max(), elapsed_time * 1000.0))
+
+
+if __name__ == '__main__':
+    run(*[tuple(int(arg) for arg in sys.argv[1].split(','))] if 1 < len(sys.argv) else [])
+    run_delta_spikes()
@@ -0,0 +1,110 @@
+import sys
+import time
+
+import numpy as np
+
+from GameClient.Headless import *
+from GameClient.Combat import *
+from Benchmark.BenchmarkSuite import idle_script
+
+
+# the corridor of the stage the spawn is in
+CROWD_MIN = (-1.2, -1.99, -50.0)
+CROWD_MAX = (3.1, -1.99, -8.0)
+
+
+def generate_inputs(frame_count, fighter_count, seed=0):
+    # a crowd which walks around and attacks a lot
+    random = np.random.RandomState(seed)
+    press_keys = random.choice(list(key_map.keys()) + [KEY_FLAG_NONE] * 4, (frame_count, fighter_count)).astype(np.int32)
+    key_flags = np.where(press_keys != KEY_FLAG_NONE, KEY_FLAG.MOVE, KEY_FLAG.NONE)
+    key_flags |= np.where(random.uniform(size=(frame_count, fighter_count)) < 0.02, KEY_FLAG.JUMP, KEY_FLAG.NONE)
+    key_flags |= np.where(random.uniform(size=(frame_count, fighter_count)) < 0.1, KEY_FLAG.PUNCH, KEY_FLAG.NONE)
+    key_flags |= np.where(random.uniform(size=(frame_count, fighter_count)) < 0.05, KEY_FLAG.KICK, KEY_FLAG.NONE)
+    return press_keys, key_flags.astype(np.int32)
+
+
+def add_crowd(simulation, fighter_count):
+    # spread over the corridor at the scale GameClient spawns the player with, teams alternate starting with an opponent
+    game_client = simulation.game_client
+    scene_manager = simulation.core_manager.scene_manager
+    model = simulation.core_manager.resource_manager.get_model('player')
+    random = np.random.RandomState(0)
+    for i in range(fighter_count):
+        pos = random.uniform(CROWD_MIN, CROWD_MAX).astype(np.float32)
+        game_client.fighters.add_fighter(scene_manager.add_object(model=model, pos=pos), pos, yaw=random.uniform(-np.pi, np.pi), scale=0.45, team=(i + 1) % 2)
+
+
+def get_brute_force_defenders(combat, fighters, state_keys):
+    # every attacker against every other fighter one sphere pair at a time, no broad phase
+    count = fighters.count
+    attackers, hitbox_rows = combat.get_attackers(fighters.state_managers, state_keys)
+    clip_indices, times, is_animated = combat.get_animations(fighters.actors)
+    world_positions = get_world_positions(combat.volume_table.get_positions(clip_indices, times),
+                                          fighters.positions[:count], fighters.yaws[:count], fighters.scales[:count])
+    defenders = set()
+    for attacker, hitbox_row in zip(attackers, hitbox_rows):
+        for defender in range(count):
+            if fighters.teams[defender] == fighters.teams[attacker] or not hurtable_table[state_keys[defender]] or not is_animated[defender]:
+                continue
+            for hitbox_bone, hitbox_radius in zip(combat.hitbox_bones[hitbox_row], combat.hitbox_radii[hitbox_row]):
+                if hitbox_radius < 0.0:
+                    continue
+                for hurtbox_bone, hurtbox_radius in zip(combat.hurtbox_bones, combat.hurtbox_radii):
+                    radius = hitbox_radius * fighters.scales[attacker] + hurtbox_radius * fighters.scales[defender]
+                    if np.sum(np.square(world_positions[attacker, hitbox_bone] - world_positions[defender, hurtbox_bone])) <= radius * radius:
+                        defenders.add(defender)
+    return defenders
+
+
+# times the vectorized pass and checks it against the brute force one every check_interval frames
+class CheckedCombatSystem(CombatSystem):
+    def __init__(self, get_pose_table, move_set, check_interval):
+        CombatSystem.__init__(self, get_pose_table, move_set)
+        self.check_interval = check_interval
+        self.frame = 0
+        self.frame_times = []
+        self.mismatch_count = 0
+        self.check_count = 0
+
+    def get_hits(self, fighters, state_keys):
+        start_time = time.perf_counter()
+        hits = CombatSystem.get_hits(self, fighters, state_keys)
+        self.frame_times.append(time.perf_counter() - start_time)
+        if 0 < self.check_interval and 0 == self.frame % self.check_interval:
+            self.check_count += 1
+            if set(hits[0].tolist()) != get_brute_force_defenders(self, fighters, state_keys):
+                self.mismatch_count += 1
+        self.frame += 1
+        return hits
+
+
+def run(fighter_counts=(2, 100, 1000), frame_count=300):
+    print("%10s %14s %14s %14s %10s" % ("fighters", "combat p50 ms", "combat p99 ms", "hits / frame", "checked"))
+    for fighter_count in fighter_counts:
+        simulation = HeadlessSimulation(ScriptedInput(idle_script))
+        game_client = simulation.game_client
+        fighters = game_client.fighters
+        add_crowd(simulation, fighter_count - 1)
+        # the brute force check is quadratic, the big crowd is checked on a few frames only
+        check_interval = 1 if fighter_count <= 100 else 60
+        combat = CheckedCombatSystem(game_client.animation_library.get_pose_table, game_client.state_manager.move_set, check_interval)
+        game_client.combat = combat
+
+        press_keys, key_flags = generate_inputs(frame_count, fighter_count)
+        for frame in range(frame_count):
+            for index in range(1, fighter_count):
+                fighters.set_input(index, press_keys[frame, index], key_flags[frame, index])
+            simulation.step()
+        simulation.exit()
+
+        frame_times = np.array(combat.frame_times) * 1000.0
+        print("%10d %14.3f %14.3f %14.2f %5d/%-4d" % (fighter_count, np.percentile(frame_times, 50.0), np.percentile(frame_times, 99.0),
+                                                  combat.hit_count / frame_count, combat.check_count - combat.mismatch_count, combat.check_count))
+        if combat.mismatch_count:
+            print("%d frames hit other fighters than the brute force pass" % combat.mismatch_count)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    run(*[tuple(int(arg) for arg in sys.argv[1].split(','))] if 1 < len(sys.argv) else [])
@@ -0,0 +1,57 @@
+import sys
+import time
+
+import numpy as np
+
+from PyEngine3D.Utilities import TransformObject
+from GameClient.Collision import *
+from GameClient.Fighter import *
+from Benchmark.BenchmarkCollision import generate_bound_boxes
+
+
+class BenchmarkActor:
+    def __init__(self):
+        self.transform = TransformObject()
+        self.is_animation_end = False
+
+    def set_animation(self, animation_mesh, *args, **kargs):
+        self.is_animation_end = False
+
+
+def generate_inputs(frame_count, fighter_count, seed=0):
+    random = np.random.RandomState(seed)
+    press_keys = random.choice(list(key_map.keys()) + [KEY_FLAG_NONE], (frame_count, fighter_count)).astype(np.int32)
+    key_flags = np.where(press_keys != KEY_FLAG_NONE, KEY_FLAG.MOVE, KEY_FLAG.NONE)
+    key_flags |= np.where(random.uniform(size=(frame_count, fighter_count)) < 0.05, KEY_FLAG.JUMP, KEY_FLAG.NONE)
+    key_flags |= np.where(random.uniform(size=(frame_count, fighter_count)) < 0.05, KEY_FLAG.PUNCH, KEY_FLAG.NONE)
+    return press_keys, key_flags.astype(np.int32)
+
+
+# clip names are all the state machine needs from the animation meshes
+animation_meshes = {key: key for key in ('idle', 'walk', 'jump', 'jump_kick', 'punch', 'kick')}
+
+
+def run(fighter_counts=(1, 100, 1000), frame_count=100, box_count=1000, delta=1.0 / 60.0):
+    collision_grid = CollisionGrid(generate_bound_boxes(box_count))
+    random = np.random.RandomState(0)
+
+    print("%10s %14s %14s" % ("fighters", "frame (ms)", "fighter (us)"))
+    for fighter_count in fighter_counts:
+        fighters = FighterContainer()
+        for i in range(fighter_count):
+            pos = random.uniform(-10.0, 10.0, 3).astype(np.float32)
+            pos[1] = 1.0
+            fighters.add_fighter(BenchmarkActor(), pos)
+
+        press_keys, key_flags = generate_inputs(frame_count, fighter_count)
+        start_time = time.perf_counter()
+        for frame in range(frame_count):
+            fighters.press_keys[:fighter_count] = press_keys[frame]
+            fighters.key_flags[:fighter_count] = key_flags[frame]
+            fighters.update(delta, collision_grid, animation_meshes)
+        frame_time = (time.perf_counter() - start_time) / frame_count
+        print("%10d %14.3f %14.3f" % (fighter_count, frame_time * 1000.0, frame_time * 1000000.0 / fighter_count))
+
+
+if __name__ == '__main__':
+    run(*[tuple(int(arg) for arg in sys.argv[1].split(','))] if 1 < len(sys.argv) else [])
@@ -0,0 +1,77 @@
+import sys
+import math
+import time
+
+import numpy as np
+
+from GameClient.InstanceStore import *
+
+
+def get_view_projection(pos, yaw, fov=60.0, aspect=16.0 / 9.0, near=0.1, far=200.0):
+    # row vector view * projection looking along -z rotated by yaw, like the engine's camera
+    c = math.cos(yaw)
+    s = math.sin(yaw)
+    rotation = np.array([[c, 0.0, s, 0.0], [0.0, 1.0, 0.0, 0.0], [-s, 0.0, c, 0.0], [0.0, 0.0, 0.0, 1.0]], dtype=np.float32)
+    translation = np.eye(4, dtype=np.float32)
+    translation[3, :3] = -np.array(pos, dtype=np.float32)
+    view = np.dot(translation, rotation.T)
+
+    f = 1.0 / math.tan(math.radians(fov) * 0.5)
+    projection = np.zeros((4, 4), dtype=np.float32)
+    projection[0, 0] = f / aspect
+    projection[1, 1] = f
+    projection[2, 2] = (far + near) / (near - far)
+    projection[2, 3] = -1.0
+    projection[3, 2] = 2.0 * far * near / (near - far)
+    return np.dot(view, projection)
+
+
+def generate_store(instance_count, batch_count=20, size=500.0, seed=0):
+    random = np.random.default_rng(seed)
+    store = InstanceStore()
+    for batch_index in range(batch_count):
+        count = instance_count // batch_count
+        matrices = np.tile(np.eye(4, dtype=np.float32), (count, 1, 1))
+        matrices[:, 3, :3] = random.uniform(-size, size, (count, 3))
+        matrices[:, 3, 1] *= 0.05
+        store.add_instances('prop_%d' % batch_index, 0, 'stage_materials.box_01', (0.0, 0.5, 0.0), 0.9, matrices)
+    return store
+
+
+def cull_brute_force(store, view_projection):
+    # one sphere test per instance with python loops, the way per actor culling does it
+    planes = get_frustum_planes(view_projection)
+    visible_count = 0
+    for batch in store.batch_list:
+        center = np.append(batch.bound_center, 1.0)
+        for matrix in batch.matrices[:batch.count]:
+            world_center = np.dot(center, matrix)
+            radius = np.linalg.norm(matrix[:3, :3], axis=1).max() * batch.bound_radius
+            if all(-radius <= np.dot(plane, world_center) for plane in planes):
+                visible_count += 1
+    return visible_count
+
+
+def run(repeat=20):
+    view_projection = get_view_projection((0.0, 2.0, 0.0), 0.3)
+    for instance_count in (1000, 10000, 100000):
+        store = generate_store(instance_count)
+        store.build()
+        visible_count = store.update(view_projection)
+
+        start_time = time.perf_counter()
+        for i in range(repeat):
+            store.update(view_projection)
+        update_time = (time.perf_counter() - start_time) / repeat
+
+        if instance_count <= 10000:
+            start_time = time.perf_counter()
+            assert visible_count == cull_brute_force(store, view_projection)
+            brute_force_text = "per instance %10.3f ms" % ((time.perf_counter() - start_time) * 1000.0)
+        else:
+            brute_force_text = ""
+        print("%8d instances, %7d visible: vectorized %8.3f ms %s" % (instance_count, visible_count, update_time * 1000.0, brute_force_text))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,30 @@
+import os
+import sys
+import time
+
+from GameClient.MeshFormat import *
+
+
+def measure(function, filepath, repeat):
+    # up to every vertex array in memory, the mapped file is read and the pickled lists are converted
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        read_arrays(function(filepath))
+    return (time.perf_counter() - start_time) / repeat
+
+
+def run(repeat=5, project_path=PROJECT_PATH, mesh_names=('player', 'stage')):
+    for mesh_name in mesh_names:
+        filepath = os.path.join(project_path, MESH_PATH, mesh_name + MESH_EXT)
+        binary_filepath = get_mesh_binary_filepath(filepath)
+        if not os.path.exists(binary_filepath):
+            convert_mesh(filepath)
+
+        pickle_time = measure(load_resource_data, filepath, repeat)
+        binary_time = measure(load_mesh_binary, binary_filepath, repeat)
+        print("%-8s gzip+pickle to arrays %10.3f ms (%8d bytes), mmap to arrays %8.3f ms (%8d bytes), %6.1fx" %
+              (mesh_name, pickle_time * 1000.0, os.path.getsize(filepath), binary_time * 1000.0, os.path.getsize(binary_filepath), pickle_time / binary_time))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:2]])
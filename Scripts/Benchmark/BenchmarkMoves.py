@@ -0,0 +1,78 @@
+import sys
+import time
+
+import numpy as np
+
+from GameClient.Headless import *
+from GameClient.Moves import *
+
+
+# frames to settle on the floor before the first punch
+SETTLE_FRAMES = 30
+
+
+def get_punch_script(second_press_frame, hold=False):
+    # punch, then punch again second_press_frame frames later for two frames, or hold the button from the first punch on
+    def script(frame):
+        frame -= SETTLE_FRAMES
+        if hold:
+            punch = 0 <= frame <= second_press_frame
+        else:
+            punch = 0 == frame or second_press_frame <= frame < second_press_frame + 2
+        return KEY_FLAG_NONE, get_key_flag(KEY_FLAG_NONE, punch=punch)
+    return script
+
+
+def run_punch(second_press_frame, hold=False):
+    # the punch state after the second press, whether it started the next combo step and the states on the way
+    simulation = HeadlessSimulation(ScriptedInput(get_punch_script(second_press_frame, hold)))
+    state_manager = simulation.game_client.state_manager
+    simulation.run(SETTLE_FRAMES + 1)
+    punch = state_manager.state_map[STATES.PUNCH]
+    assert STATES.PUNCH == state_manager.get_state_key()
+    move_start_time = punch.move_start_time
+    state_keys = set()
+    for frame in range(second_press_frame + 1):
+        simulation.step()
+        state_keys.add(state_manager.get_state_key())
+    simulation.exit()
+    return state_manager.get_state_key(), punch.combo, punch.move_start_time != move_start_time, state_keys
+
+
+def check_cancel():
+    # a press inside the cancel window of the first punch goes on with the second one without passing idle,
+    # a press outside the window or a button held since the first punch does nothing
+    move_set = get_move_set()
+    move = move_set.moves['punch']
+    cancel_frames = np.flatnonzero(move.cancel_frames[move.frame_offsets[0]:move.frame_offsets[1]])
+    assert move.has_cancel and 0 < len(cancel_frames)
+
+    inside_frame = int(cancel_frames[len(cancel_frames) // 2])
+    outside_frame = int(cancel_frames[0]) - 6
+    state_key, combo, restarted, state_keys = run_punch(inside_frame)
+    assert STATES.PUNCH == state_key and 2 == combo and restarted, "a press inside the cancel window did not cancel"
+    assert {STATES.PUNCH} == state_keys, "the cancel went through another state"
+    state_key, combo, restarted, state_keys = run_punch(outside_frame)
+    assert STATES.PUNCH == state_key and 1 == combo and not restarted, "a press outside the cancel window canceled"
+    state_key, combo, restarted, state_keys = run_punch(int(cancel_frames[-1]), hold=True)
+    assert STATES.PUNCH == state_key and 1 == combo and not restarted, "a held button canceled"
+    print("punch cancel window frames %d-%d: press at frame %d cancels, at frame %d or held does not" %
+          (cancel_frames[0], cancel_frames[-1], inside_frame, outside_frame))
+
+
+def run(repeat=100000):
+    check_cancel()
+
+    move_set = get_move_set()
+    move = move_set.moves['punch']
+    random = np.random.RandomState(0)
+    segments = random.randint(0, move.combo_count, repeat).tolist()
+    move_times = random.uniform(0.0, 0.5, repeat).tolist()
+    start_time = time.perf_counter()
+    for segment, move_time in zip(segments, move_times):
+        move_set.is_cancelable(move, segment, move_time)
+    print("is_cancelable  %10.3f us" % ((time.perf_counter() - start_time) * 1000000.0 / repeat))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
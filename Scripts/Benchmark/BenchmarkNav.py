@@ -0,0 +1,64 @@
+import sys
+import time
+
+import numpy as np
+
+from GameClient.Resource import *
+from GameClient.CollisionFormat import *
+from GameClient.NavGrid import *
+from GameClient.GameClient import ENEMY_SPAWN_MIN, ENEMY_SPAWN_MAX
+from GameClient.Headless import SPAWN_POS
+
+
+def get_path_cost(nav_grid, start, cells):
+    cost = 0.0
+    for cell in cells:
+        cost += nav_grid.get_distance(start, cell)
+        start = cell
+    return cost
+
+
+def get_flow_cells(next_cells, start_cell):
+    cells = []
+    cell = start_cell
+    while next_cells[cell] != cell:
+        cell = int(next_cells[cell])
+        cells.append(cell)
+    return cells
+
+
+def run(enemy_counts=(1, 100, 500), scene_name='stage'):
+    # every enemy walking to the player, one A* search each against one shared flow field
+    collision_data = load_collision(get_collision_filepath(PROJECT_PATH, scene_name))
+    start_time = time.perf_counter()
+    nav_grid = load_nav_grid(PROJECT_PATH, scene_name, collision_data['bound_mins'], collision_data['bound_maxs'])
+    if nav_grid is None:
+        nav_grid = create_nav_grid(bake_nav_grid(collision_data['bound_mins'], collision_data['bound_maxs']))
+    print("%s nav grid %d x %d cells loaded in %.3f ms" % (scene_name, nav_grid.width, nav_grid.depth, (time.perf_counter() - start_time) * 1000.0))
+
+    goal_cell = nav_grid.get_walkable_cell(SPAWN_POS)
+    print("%8s %12s %12s %10s" % ("enemies", "astar ms", "flow ms", "speedup"))
+    for enemy_count in enemy_counts:
+        random = np.random.RandomState(0)
+        starts = random.uniform(ENEMY_SPAWN_MIN, ENEMY_SPAWN_MAX, (enemy_count, 3)).astype(np.float32)
+        start_cells = [nav_grid.get_walkable_cell(start) for start in starts]
+
+        start_time = time.perf_counter()
+        astar_paths = [nav_grid.find_cells(start_cell, goal_cell) for start_cell in start_cells]
+        astar_time = time.perf_counter() - start_time
+
+        start_time = time.perf_counter()
+        next_cells = nav_grid.search_flow_field(goal_cell, NAV_FLOW_RANGE * nav_grid.inv_cell_size)
+        flow_paths = [get_flow_cells(next_cells, start_cell) for start_cell in start_cells]
+        flow_time = time.perf_counter() - start_time
+
+        # both are shortest paths, they may differ but not in length
+        for start_cell, astar_path, flow_path in zip(start_cells, astar_paths, flow_paths):
+            if astar_path is None or abs(get_path_cost(nav_grid, start_cell, astar_path) - get_path_cost(nav_grid, start_cell, flow_path)) > 1e-6:
+                print("the flow field path from cell %d is not a shortest path" % start_cell)
+                sys.exit(1)
+        print("%8d %12.3f %12.3f %9.1fx" % (enemy_count, astar_time * 1000.0, flow_time * 1000.0, astar_time / flow_time))
+
+
+if __name__ == '__main__':
+    run(*[tuple(int(arg) for arg in sys.argv[1].split(','))] if 1 < len(sys.argv) else [])
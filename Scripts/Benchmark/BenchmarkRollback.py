@@ -0,0 +1,80 @@
+import sys
+import time
+
+import numpy as np
+
+from GameClient.Headless import *
+from GameClient.Rollback import *
+
+
+FRAME_BUDGET = 1.0 / 60.0
+
+
+def get_inputs(fighters, frame):
+    inputs = np.zeros((fighters.count, 2), dtype=np.int32)
+    inputs[:] = walk_and_punch_script(frame)
+    return inputs
+
+
+def run(rollback_frames=8, frame_count=600, repeat=100):
+    simulation = HeadlessSimulation(ScriptedInput([]))
+    session = RollbackSession(simulation)
+    fighters = session.fighters
+
+    for frame in range(frame_count):
+        session.advance(get_inputs(fighters, frame))
+
+    # a rollback without corrected inputs has to land on the same state
+    expected_positions = fighters.positions[:fighters.count].copy()
+    expected_velocities = fighters.velocities[:fighters.count].copy()
+    session.rollback(simulation.frame - rollback_frames)
+    assert np.array_equal(expected_positions, fighters.positions[:fighters.count])
+    assert np.array_equal(expected_velocities, fighters.velocities[:fighters.count])
+
+    frame = simulation.frame
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        session.snapshots.save(frame, fighters)
+    save_time = (time.perf_counter() - start_time) / repeat
+
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        session.snapshots.restore(frame, fighters)
+    restore_time = (time.perf_counter() - start_time) / repeat
+
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        session.rollback(simulation.frame - rollback_frames)
+    rollback_time = (time.perf_counter() - start_time) / repeat
+
+    print("snapshot        %10.3f ms" % (save_time * 1000.0))
+    print("restore         %10.3f ms" % (restore_time * 1000.0))
+    print("rollback %2d     %10.3f ms (%.1f%% of a %.1f ms frame)" % (rollback_frames, rollback_time * 1000.0, rollback_time * 100.0 / FRAME_BUDGET, FRAME_BUDGET * 1000.0))
+
+
+def run_enemies(enemy_count=4, frame_count=1500, rollback_interval=25, rollback_frames=8):
+    # the fighter ai drives the enemies, rollbacks without corrected inputs have to end where a run without any does
+    results = []
+    for rollback in (False, True):
+        simulation = HeadlessSimulation(ScriptedInput([]), enemy_count=enemy_count)
+        session = RollbackSession(simulation)
+        fighters = session.fighters
+        rollback_count = 0
+        for frame in range(frame_count):
+            session.advance(get_inputs(fighters, frame))
+            if rollback and 0 == (frame + 1) % rollback_interval:
+                session.rollback(simulation.frame - rollback_frames)
+                rollback_count += 1
+        results.append((fighters.positions[:fighters.count].copy(), fighters.velocities[:fighters.count].copy(),
+                        simulation.game_client.combat.hit_count))
+        simulation.exit()
+
+    (expected_positions, expected_velocities, hit_count), (positions, velocities, rollback_hit_count) = results
+    assert np.array_equal(expected_positions, positions) and np.array_equal(expected_velocities, velocities), \
+        "%d enemies end somewhere else after %d rollbacks" % (enemy_count, rollback_count)
+    print("%d enemies, %d rollbacks of %d frames in %d frames: same state, %d hits" % (enemy_count, rollback_count, rollback_frames, frame_count, hit_count))
+
+
+if __name__ == '__main__':
+    run(*[int(arg) for arg in sys.argv[1:]])
+    run_enemies()
@@ -0,0 +1,196 @@
+import os
+import sys
+import json
+import time
+import zlib
+import platform
+import argparse
+import subprocess
+
+import numpy as np
+
+from GameClient.Headless import *
+from GameClient.Rollback import *
+from GameClient.Profiler import *
+
+
+BENCHMARK_FRAME_COUNT = 600
+BENCHMARK_FIGHTER_COUNT = 100
+# a scenario more than this much slower than the baseline is reported as a regression
+REGRESSION_THRESHOLD = 1.1
+
+# checksums of the scenarios after BENCHMARK_FRAME_COUNT frames, updated together with the behavior change which changes them
+baseline_checksums = dict(idle='adcd2bc3',
+                          walk_into_wall='2af39532',
+                          jump_spam='bd295a9d',
+                          combo='46292bf6',
+                          walk_and_punch='db2fd1d5',
+                          many_fighters='de9fe9c7')
+
+
+def idle_script(frame):
+    return KEY_FLAG_NONE, KEY_FLAG.NONE
+
+
+def walk_into_wall_script(frame):
+    # the stage wall is a few steps ahead of the spawn, the rest of the run pushes against it
+    return KEY_FLAG_A, get_key_flag(KEY_FLAG_A)
+
+
+def jump_spam_script(frame):
+    return KEY_FLAG_NONE, get_key_flag(KEY_FLAG_NONE, jump=True)
+
+
+def combo_script(frame):
+    # three punches inside the combo window, then a kick
+    frame %= 90
+    punch = frame % 20 < 2 and frame < 60
+    kick = 60 <= frame < 62
+    return KEY_FLAG_NONE, get_key_flag(KEY_FLAG_NONE, punch=punch, kick=kick)
+
+
+def get_offset_script(script, offset):
+    return lambda frame: script(frame + offset)
+
+
+# name, player script, additional fighters driven by the same script a few frames apart
+scenarios = (('idle', idle_script, 0),
+             ('walk_into_wall', walk_into_wall_script, 0),
+             ('jump_spam', jump_spam_script, 0),
+             ('combo', combo_script, 0),
+             ('walk_and_punch', walk_and_punch_script, 0),
+             ('many_fighters', walk_and_punch_script, BENCHMARK_FIGHTER_COUNT - 1))
+
+
+def add_fighters(simulation, fighter_count):
+    game_client = simulation.game_client
+    scene_manager = simulation.core_manager.scene_manager
+    model = simulation.core_manager.resource_manager.get_model('player')
+    random = np.random.RandomState(0)
+    # teams alternate starting with an opponent of the player
+    for i in range(fighter_count):
+        pos = np.array(SPAWN_POS, dtype=np.float32)
+        pos[[0, 2]] += random.uniform(-4.0, 4.0, 2).astype(np.float32)
+        game_client.fighters.add_fighter(scene_manager.add_object(model=model, pos=pos), pos, team=(i + 1) % 2)
+
+
+def get_checksum(game_client):
+    # the same inputs have to end in the same state, a changed checksum is a behavior change and not noise.
+    # Everything a rollback restores, states, combo steps, clips and clip times with the positions, and the hits landed.
+    fighters = game_client.fighters
+    snapshots = SnapshotBuffer(fighters.count, ring_size=1)
+    snapshots.save(0, fighters)
+    animation_names = ','.join('' if animation is None else animation.name for animation in snapshots.animations)
+    return '%08x' % zlib.crc32(snapshots.snapshots.tobytes() + animation_names.encode('utf-8') + np.int64(game_client.combat.hit_count).tobytes())
+
+
+def run_scenario(input_source, frame_count, scripts=()):
+    simulation = HeadlessSimulation(input_source)
+    fighters = simulation.game_client.fighters
+    add_fighters(simulation, len(scripts))
+
+    profiler.enabled = True
+    profiler.clear()
+    frame_times = np.zeros(frame_count, dtype=np.float64)
+    for frame in range(frame_count):
+        for index, script in enumerate(scripts, start=1):
+            fighters.set_input(index, *script(frame))
+        start_time = time.perf_counter()
+        simulation.step()
+        frame_times[frame] = time.perf_counter() - start_time
+    profiler.enabled = False
+    checksum = get_checksum(simulation.game_client)
+    simulation.exit()
+
+    return dict(frame_count=frame_count,
+                fighter_count=fighters.count,
+                frames_per_sec=frame_count / frame_times.sum(),
+                frame_ms=dict(p50=float(np.percentile(frame_times, 50.0) * 1000.0),
+                              p99=float(np.percentile(frame_times, 99.0) * 1000.0),
+                              max=float(frame_times.max() * 1000.0)),
+                stages=profiler.get_statistics(),
+                checksum=checksum)
+
+
+def get_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL).decode('utf-8').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(frame_count=BENCHMARK_FRAME_COUNT, names=None, replay=None):
+    results = dict(commit=get_commit(),
+                   python=platform.python_version(),
+                   numpy=np.__version__,
+                   machine=platform.machine(),
+                   processor=platform.processor(),
+                   cpu_count=os.cpu_count(),
+                   scenarios={})
+
+    for name, script, fighter_count in scenarios:
+        if names and name not in names:
+            continue
+        scripts = [get_offset_script(script, 7 * (i + 1)) for i in range(fighter_count)]
+        results['scenarios'][name] = run_scenario(ScriptedInput(script), frame_count, scripts)
+        print_scenario(name, results['scenarios'][name])
+
+    if replay:
+        input_source = ReplayInput(replay)
+        name = 'replay_' + os.path.splitext(os.path.basename(replay))[0]
+        results['scenarios'][name] = run_scenario(input_source, input_source.get_frame_count())
+        print_scenario(name, results['scenarios'][name])
+    return results
+
+
+def print_scenario(name, result):
+    print("%-20s %5d fighters %10.1f frames/sec, frame p50 %7.3f ms p99 %7.3f ms, checksum %s" %
+          (name, result['fighter_count'], result['frames_per_sec'], result['frame_ms']['p50'], result['frame_ms']['p99'], result['checksum']))
+
+
+def compare(results, baseline):
+    # p50 frame time against a previous run, slower and changed checksums are flagged
+    regression_count = 0
+    for name, result in results['scenarios'].items():
+        baseline_result = baseline['scenarios'].get(name)
+        if baseline_result is None:
+            continue
+        ratio = result['frame_ms']['p50'] / baseline_result['frame_ms']['p50']
+        notes = []
+        if REGRESSION_THRESHOLD < ratio:
+            notes.append('slower')
+            regression_count += 1
+        if result['checksum'] != baseline_result['checksum']:
+            notes.append('checksum changed')
+        print("%-20s %7.3f -> %7.3f ms %6.2fx %s" % (name, baseline_result['frame_ms']['p50'], result['frame_ms']['p50'], ratio, ', '.join(notes)))
+    return regression_count
+
+
+def check_checksums(results):
+    changed_count = 0
+    for name, result in results['scenarios'].items():
+        if name in baseline_checksums and result['checksum'] != baseline_checksums[name]:
+            print("%-20s checksum %s, the baseline is %s" % (name, result['checksum'], baseline_checksums[name]))
+            changed_count += 1
+    return changed_count
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--frames', type=int, default=BENCHMARK_FRAME_COUNT)
+    parser.add_argument('--scenarios', help='comma separated scenario names, every scenario by default')
+    parser.add_argument('--replay', help='an input log to run as one more scenario')
+    parser.add_argument('--output', help='write the results to a json file')
+    parser.add_argument('--baseline', help='a json file of an earlier run to compare with')
+    args = parser.parse_args()
+
+    results = run(args.frames, args.scenarios.split(',') if args.scenarios else None, args.replay)
+    failure_count = check_checksums(results) if args.frames == BENCHMARK_FRAME_COUNT else 0
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            baseline = json.load(f)
+        failure_count += compare(results, baseline)
+    sys.exit(1 if failure_count else 0)
@@ -0,0 +1,202 @@
+import numpy as np
+
+from GameClient.AnimationSampler import *
+
+
+# bones of the upper body layer, the root bone and everything below it
+UPPER_BODY_BONE = 'spine'
+
+# slots of the pose pool of a fighter
+POSE_CURRENT = 0
+POSE_FROM = 1
+POSE_LAYER = 2
+POSE_OUTPUT = 3
+POSE_SCRATCH = 4
+POSE_DELTA = 5
+POSE_BASE = 6
+POSE_POOL_SIZE = 7
+
+
+def get_child_bone_names(hierachy, root_bone):
+    # root_bone and every bone below it in the nested {bone: {child: ...}} hierachy
+    for bone_name, children in hierachy.items():
+        if bone_name == root_bone:
+            bone_names = [bone_name]
+            stack = [children]
+            while stack:
+                for child_name, grand_children in stack.pop().items():
+                    bone_names.append(child_name)
+                    stack.append(grand_children)
+            return bone_names
+        bone_names = get_child_bone_names(children, root_bone)
+        if bone_names:
+            return bone_names
+    return []
+
+
+def get_bone_mask(pose_table, root_bone=UPPER_BODY_BONE):
+    bone_names = set(get_child_bone_names(pose_table.hierachy, root_bone))
+    return np.array([[bone_name in bone_names] for bone_name in pose_table.bone_names], dtype=np.float32)
+
+
+def multiply_quaternions(a, b, out):
+    # (w, x, y, z) rows, out must not be a or b
+    aw, ax, ay, az = a[:, 0], a[:, 1], a[:, 2], a[:, 3]
+    bw, bx, by, bz = b[:, 0], b[:, 1], b[:, 2], b[:, 3]
+    out[:, 0] = aw * bw - ax * bx - ay * by - az * bz
+    out[:, 1] = aw * bx + ax * bw + ay * bz - az * by
+    out[:, 2] = aw * by - ax * bz + ay * bw + az * bx
+    out[:, 3] = aw * bz + ax * by - ay * bx + az * bw
+    return out
+
+
+# playback of one clip with the engine's set_animation parameters
+class ClipPlayback:
+    def __init__(self):
+        self.clip_name = None
+        self.pose_table = None
+        self.time = 0.0
+        self.speed = 1.0
+        self.loop = True
+        self.start_time = 0.0
+        self.end_time = 0.0
+        self.weight = 1.0
+
+    def play(self, clip_name, pose_table, speed=1.0, loop=True, start_time=0.0, end_time=-1.0):
+        self.clip_name = clip_name
+        self.pose_table = pose_table
+        self.speed = speed
+        self.loop = loop
+        self.start_time = start_time
+        self.end_time = end_time if 0.0 <= end_time else pose_table.animation_length
+        self.time = start_time
+
+    def stop(self):
+        self.clip_name = None
+        self.pose_table = None
+
+    def update(self, delta):
+        self.time += delta * self.speed
+        if self.end_time <= self.time:
+            if self.loop:
+                length = max(self.end_time - self.start_time, delta)
+                self.time = self.start_time + (self.time - self.end_time) % length
+            else:
+                self.time = self.end_time
+
+
+# crossfades and an additive upper body layer of one fighter in a pool of pose buffers allocated with the first clip,
+# a transition only copies the current output into the blend source, so combo spam never allocates
+class AnimationBlender:
+    def __init__(self, get_pose_table, layer_root_bone=UPPER_BODY_BONE):
+        self.get_pose_table = get_pose_table
+        self.layer_root_bone = layer_root_bone
+        self.clip = ClipPlayback()
+        self.layer = ClipPlayback()
+        self.blend_time = 0.0
+        self.blend_elapsed = 0.0
+        self.pose_pool = None
+        self.weights = None
+        self.layer_mask = None
+        self.palette = None
+        self.transition_count = 0
+
+    def allocate(self, pose_table):
+        bone_count = len(pose_table.bone_names)
+        self.pose_pool = np.zeros((POSE_POOL_SIZE, bone_count, POSE_SIZE), dtype=np.float32)
+        self.weights = np.zeros((bone_count, 1), dtype=np.float32)
+        self.layer_mask = get_bone_mask(pose_table, self.layer_root_bone)
+        self.palette = np.zeros((bone_count, 4, 4), dtype=np.float32)
+
+    def is_playing(self):
+        return self.clip.pose_table is not None
+
+    def is_blending(self):
+        return self.blend_elapsed < self.blend_time
+
+    def has_layer(self):
+        return self.layer.pose_table is not None
+
+    def play(self, clip_name, speed=1.0, loop=True, start_time=0.0, end_time=-1.0, blend_time=0.5, **kargs):
+        pose_table = self.get_pose_table(clip_name)
+        if self.pose_pool is None:
+            self.allocate(pose_table)
+
+        if self.is_playing() and 0.0 < blend_time:
+            # blend from the pose on screen, a restart in the middle of a blend starts from the blended pose
+            np.copyto(self.pose_pool[POSE_FROM], self.pose_pool[POSE_OUTPUT])
+            self.blend_time = blend_time
+            self.blend_elapsed = 0.0
+        else:
+            self.blend_time = 0.0
+        self.clip.play(clip_name, pose_table, speed, loop, start_time, end_time)
+        self.transition_count += 1
+
+    def play_layer(self, clip_name, weight=1.0, speed=1.0, loop=False, start_time=0.0, end_time=-1.0):
+        # the difference of the clip to its first frame is added to the upper body of the full body pose
+        self.layer.play(clip_name, self.get_pose_table(clip_name), speed, loop, start_time, end_time)
+        self.layer.weight = weight
+
+    def stop_layer(self):
+        self.layer.stop()
+
+    def update(self, delta):
+        if not self.is_playing():
+            return None
+
+        pose_pool = self.pose_pool
+        output = pose_pool[POSE_OUTPUT]
+        scratch = pose_pool[POSE_SCRATCH]
+        weights = self.weights
+
+        self.clip.update(delta)
+        self.clip.pose_table.sample_into(self.clip.time, pose_pool[POSE_CURRENT], scratch)
+        if self.is_blending():
+            self.blend_elapsed += delta
+            blend_source = pose_pool[POSE_FROM]
+            # the source takes the hemisphere of the target, so the lerp takes the short way
+            np.sum(np.multiply(blend_source[:, 0:4], pose_pool[POSE_CURRENT][:, 0:4], out=scratch[:, 0:4]), axis=1, keepdims=True, out=weights)
+            np.copysign(1.0, weights, out=weights)
+            np.multiply(blend_source[:, 0:4], weights, out=blend_source[:, 0:4])
+            weight = min(1.0, self.blend_elapsed / self.blend_time)
+            np.multiply(blend_source, 1.0 - weight, out=output)
+            np.multiply(pose_pool[POSE_CURRENT], weight, out=scratch)
+            np.add(output, scratch, out=output)
+        else:
+            np.copyto(output, pose_pool[POSE_CURRENT])
+
+        if self.has_layer():
+            self.layer.update(delta)
+            self.add_layer(output)
+
+        np.sum(np.square(output[:, 0:4], out=scratch[:, 0:4]), axis=1, keepdims=True, out=weights)
+        np.sqrt(weights, out=weights)
+        np.divide(output[:, 0:4], weights, out=output[:, 0:4])
+        return output
+
+    def add_layer(self, output):
+        pose_pool = self.pose_pool
+        layer_pose = pose_pool[POSE_LAYER]
+        delta = pose_pool[POSE_DELTA]
+        scratch = pose_pool[POSE_SCRATCH]
+        weights = self.weights
+        reference = self.layer.pose_table.poses[0]
+
+        self.layer.pose_table.sample_into(self.layer.time, layer_pose, scratch)
+        np.multiply(self.layer_mask, self.layer.weight, out=weights)
+        np.subtract(layer_pose[:, 4:7], reference[:, 4:7], out=scratch[:, 4:7])
+        np.multiply(scratch[:, 4:7], weights, out=scratch[:, 4:7])
+        np.add(output[:, 4:7], scratch[:, 4:7], out=output[:, 4:7])
+
+        # rotation delta = layer * conjugate(reference), moved towards identity by weight * mask
+        np.copyto(scratch[:, 0:4], reference[:, 0:4])
+        np.negative(scratch[:, 1:4], out=scratch[:, 1:4])
+        multiply_quaternions(layer_pose, scratch, out=delta)
+        np.multiply(delta[:, 0:4], weights, out=delta[:, 0:4])
+        np.subtract(delta[:, 0:1], weights, out=delta[:, 0:1])
+        np.add(delta[:, 0:1], 1.0, out=delta[:, 0:1])
+        np.copyto(pose_pool[POSE_BASE], output)
+        multiply_quaternions(delta, pose_pool[POSE_BASE], out=output)
+
+    def get_palette(self):
+        return get_pose_matrices(self.pose_pool[POSE_OUTPUT], self.palette)
@@ -0,0 +1,242 @@
+import os
+import sys
+import time
+from collections import OrderedDict
+from collections.abc import Mapping
+
+import numpy as np
+
+from PyEngine3D.Common import logger
+from GameClient.Resource import *
+from GameClient.AnimationSampler import *
+
+
+ANIMATION_PATH = 'Animations'
+ANIMATION_EXT = '.anim'
+ANIMATION_MEMORY_BUDGET = 4 * 1024 * 1024
+
+animation_list = ['avoid',
+                  'elbow',
+                  'falloff',
+                  'grab_attack',
+                  'grab_attack_hit',
+                  'grab_attack_hit_loop',
+                  'grab_attack_loop',
+                  'heading',
+                  'hit',
+                  'idle',
+                  'jump',
+                  'jump_kick',
+                  'kick',
+                  'punch',
+                  'standup',
+                  'walk',
+                  'lie_down']
+
+
+def get_animation_length(animation_datas):
+    animation_length = 0.0
+    for animation_data in animation_datas:
+        for bone_animation_data in animation_data:
+            animation_length = max(animation_length, bone_animation_data['times'][-1])
+    return animation_length
+
+
+def get_animation_data_size(animation_datas):
+    # every keyframe holds a time and three small ndarrays, the object headers outweigh the float32 payload
+    keyframe_size = 24 + 3 * 112 + (3 + 4 + 3) * 4
+    return sum(len(bone_animation_data['times']) * keyframe_size for animation_data in animation_datas for bone_animation_data in animation_data)
+
+
+def create_animation_mesh(mesh_name, animation_data):
+    # the clip only carries skeleton and keyframes, the skinned geometry comes from the model's own mesh
+    from PyEngine3D.Render import Mesh
+    return Mesh(mesh_name,
+                geometry_datas=[],
+                skeleton_datas=animation_data['skeleton_datas'],
+                animation_datas=animation_data['animation_datas'])
+
+
+def create_pose_table(animation_data):
+    skeleton_datas = animation_data.get('skeleton_datas')
+    if not skeleton_datas:
+        return PoseTable(animation_data['animation_datas'][0])
+
+    # the bind positions in the order of the animated bones
+    skeleton_data = skeleton_datas[0]
+    bind_matrices = np.linalg.inv(np.array(skeleton_data['inv_bind_matrices'], dtype=np.float64))
+    bone_indices = {bone_name: index for index, bone_name in enumerate(skeleton_data['bone_names'])}
+    bind_positions = np.array([bind_matrices[bone_indices[bone_animation_data['target']], 3, 0:3] for bone_animation_data in animation_data['animation_datas'][0]], dtype=np.float32)
+    return PoseTable(animation_data['animation_datas'][0], hierachy=skeleton_data['hierachy'], bind_positions=bind_positions.reshape(-1, 3))
+
+
+# animation clips of a character stored without a copy of the character geometry
+class AnimationLibrary:
+    def __init__(self, create_animation_mesh=create_animation_mesh, get_mesh=None, mesh_name='player', project_path=PROJECT_PATH):
+        self.create_animation_mesh = create_animation_mesh
+        self.get_mesh = get_mesh
+        self.mesh_name = mesh_name
+        self.project_path = project_path
+        # baked when a clip is loaded, kept when the cache drops the clip since they are a fraction of its size
+        self.pose_tables = {}
+
+    def get_clip_mesh_name(self, clip_name):
+        return self.mesh_name + '_' + clip_name
+
+    def get_filepath(self, clip_name):
+        return os.path.join(self.project_path, ANIMATION_PATH, self.get_clip_mesh_name(clip_name) + ANIMATION_EXT)
+
+    def load(self, clip_name):
+        return self.load_with_size(clip_name)[0]
+
+    def has_clip_file(self, clip_name):
+        return os.path.exists(self.get_filepath(clip_name))
+
+    def decode_clip(self, filepath):
+        # runs on the streamer's workers, the pose table is baked there too
+        animation_data = load_resource_data(filepath)
+        animation_data['pose_table'] = create_pose_table(animation_data)
+        return animation_data
+
+    def create_clip(self, clip_name, animation_data):
+        clip_mesh_name = self.get_clip_mesh_name(clip_name)
+        if 'pose_table' in animation_data:
+            self.pose_tables[clip_mesh_name] = animation_data['pose_table']
+        animation_mesh = self.create_animation_mesh(clip_mesh_name, animation_data)
+        return animation_mesh, get_animation_data_size(animation_data['animation_datas'])
+
+    def get_pose_table(self, clip_mesh_name):
+        if clip_mesh_name not in self.pose_tables:
+            filepath = os.path.join(self.project_path, ANIMATION_PATH, clip_mesh_name + ANIMATION_EXT)
+            if not os.path.exists(filepath):
+                filepath = os.path.join(self.project_path, 'Meshes', clip_mesh_name + '.mesh')
+            self.pose_tables[clip_mesh_name] = create_pose_table(load_resource_data(filepath))
+        return self.pose_tables[clip_mesh_name]
+
+    def get_clip_pose_table(self, clip_name):
+        return self.get_pose_table(self.get_clip_mesh_name(clip_name))
+
+    def load_with_size(self, clip_name):
+        filepath = self.get_filepath(clip_name)
+        if os.path.exists(filepath):
+            return self.create_clip(clip_name, self.decode_clip(filepath))
+
+        # not converted yet, the full mesh still has the clip
+        logger.warn("%s is missing, run GameClient.AnimationLibrary to convert the animation meshes" % filepath)
+        return self.get_mesh(self.get_clip_mesh_name(clip_name)), 0
+
+
+# animation_meshes mapping which loads a clip on first use and drops the least recently used clips over the memory budget
+class AnimationCache(Mapping):
+    def __init__(self, animation_library, clip_names=animation_list, memory_budget=ANIMATION_MEMORY_BUDGET):
+        self.animation_library = animation_library
+        self.clip_names = list(clip_names)
+        self.memory_budget = memory_budget
+        self.memory_size = 0
+        self.animation_meshes = OrderedDict()
+        self.animation_sizes = {}
+        self.pinned_clips = set()
+        self.pending_clips = set()
+        self.streamer = None
+        self.load_count = 0
+        self.evict_count = 0
+
+    def __getitem__(self, clip_name):
+        if clip_name not in self.animation_meshes:
+            if clip_name not in self.clip_names:
+                raise KeyError(clip_name)
+            self.load(clip_name, self.pinned_clips)
+        self.animation_meshes.move_to_end(clip_name)
+        return self.animation_meshes[clip_name]
+
+    def __contains__(self, clip_name):
+        return clip_name in self.clip_names
+
+    def __iter__(self):
+        return iter(self.clip_names)
+
+    def __len__(self):
+        return len(self.clip_names)
+
+    def is_loaded(self, clip_name):
+        return clip_name in self.animation_meshes
+
+    def load(self, clip_name, protected_clips=()):
+        self.add(clip_name, *self.animation_library.load_with_size(clip_name), protected_clips=protected_clips)
+
+    def request(self, clip_name):
+        # decode on the streamer's workers, the clip shows up once the main thread finalizes it
+        if clip_name in self.pending_clips:
+            return
+        self.pending_clips.add(clip_name)
+
+        def finalize(animation_data):
+            self.pending_clips.discard(clip_name)
+            if clip_name not in self.animation_meshes:
+                self.add(clip_name, *self.animation_library.create_clip(clip_name, animation_data), protected_clips=self.pinned_clips)
+
+        self.streamer.request(clip_name, self.animation_library.get_filepath(clip_name), finalize, decode=self.animation_library.decode_clip)
+
+    def add(self, clip_name, animation_mesh, size, protected_clips=()):
+        self.animation_meshes[clip_name] = animation_mesh
+        self.animation_sizes[clip_name] = size
+        self.memory_size += size
+        self.load_count += 1
+        self.evict(set(protected_clips) | {clip_name})
+
+    def prefetch(self, clip_names):
+        # prefetching never evicts the other clips it is asked for, it stops at the budget instead
+        protected_clips = set(clip_names)
+        self.evict(protected_clips)
+        for clip_name in clip_names:
+            if clip_name not in self.animation_meshes:
+                if self.memory_budget <= self.memory_size:
+                    break
+                if self.streamer is not None and self.animation_library.has_clip_file(clip_name):
+                    self.request(clip_name)
+                else:
+                    self.load(clip_name, protected_clips)
+
+    def pin(self, clip_names):
+        # clips of the current states are never evicted
+        self.pinned_clips = set(clip_names)
+
+    def evict(self, protected_clips=()):
+        for clip_name in list(self.animation_meshes.keys()):
+            if self.memory_size <= self.memory_budget:
+                break
+            if clip_name not in self.pinned_clips and clip_name not in protected_clips:
+                self.animation_meshes.pop(clip_name)
+                self.memory_size -= self.animation_sizes.pop(clip_name)
+                self.evict_count += 1
+
+
+def convert_animation_mesh(project_path, mesh_name, clip_name):
+    mesh_data = load_resource_data(os.path.join(project_path, 'Meshes', mesh_name + '.mesh'))
+    clip_data = load_resource_data(os.path.join(project_path, 'Meshes', mesh_name + '_' + clip_name + '.mesh'))
+
+    bone_names = mesh_data['skeleton_datas'][0]['bone_names']
+    for skeleton_data in clip_data['skeleton_datas']:
+        if skeleton_data['bone_names'] != bone_names:
+            raise ValueError("%s_%s does not share the skeleton of %s" % (mesh_name, clip_name, mesh_name))
+
+    animation_data = dict(mesh=mesh_name,
+                          skeleton_datas=clip_data['skeleton_datas'],
+                          animation_datas=clip_data['animation_datas'])
+    filepath = os.path.join(project_path, ANIMATION_PATH, mesh_name + '_' + clip_name + ANIMATION_EXT)
+    save_resource_data(filepath, animation_data)
+    return filepath
+
+
+def convert_animation_meshes(project_path=PROJECT_PATH, mesh_name='player', clip_names=animation_list):
+    os.makedirs(os.path.join(project_path, ANIMATION_PATH), exist_ok=True)
+    for clip_name in clip_names:
+        filepath = convert_animation_mesh(project_path, mesh_name, clip_name)
+        source_size = os.path.getsize(os.path.join(project_path, 'Meshes', mesh_name + '_' + clip_name + '.mesh'))
+        print("%-44s %10d -> %8d bytes" % (os.path.relpath(filepath, project_path), source_size, os.path.getsize(filepath)))
+
+
+if __name__ == '__main__':
+    start_time = time.perf_counter()
+    convert_animation_meshes(*sys.argv[1:2])
+    print("done in %.3f sec" % (time.perf_counter() - start_time))
@@ -0,0 +1,147 @@
+import math
+
+import numpy as np
+
+
+# the rate the clips are exported with, the table frames land on the keyframes
+POSE_FRAME_RATE = 30.0
+# palettes are shared between fighters whose clip time rounds to the same step
+PALETTE_TIME_STEPS = 240.0
+# rotation (w, x, y, z), translation (x, y, z), uniform scale
+POSE_SIZE = 8
+
+
+def interpolate_keys(times, values, sample_times):
+    # linear interpolation of every component, clamped to the first and last key
+    indices = np.clip(np.searchsorted(times, sample_times, side='right') - 1, 0, len(times) - 1)
+    next_indices = np.minimum(indices + 1, len(times) - 1)
+    spans = times[next_indices] - times[indices]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        weights = np.where(0.0 < spans, (sample_times - times[indices]) / spans, 0.0)
+    weights = np.clip(weights, 0.0, 1.0)[:, np.newaxis]
+    return values[indices] * (1.0 - weights) + values[next_indices] * weights
+
+
+def align_quaternions(rotations):
+    # every rotation in the hemisphere of the one before it, so a lerp between neighbours takes the short way
+    rotations = rotations.copy()
+    for index in range(1, len(rotations)):
+        if np.dot(rotations[index - 1], rotations[index]) < 0.0:
+            rotations[index] = -rotations[index]
+    return rotations
+
+
+def normalize_quaternions(rotations):
+    return rotations / np.linalg.norm(rotations, axis=-1, keepdims=True)
+
+
+# animation_datas of a clip resampled at a fixed rate into (frame, bone, POSE_SIZE) float32
+class PoseTable:
+    def __init__(self, animation_data, frame_rate=POSE_FRAME_RATE, hierachy=None, bind_positions=None):
+        self.frame_rate = frame_rate
+        self.bone_names = [bone_animation_data['target'] for bone_animation_data in animation_data]
+        self.hierachy = hierachy or {}
+        # model space position of every bone in the bind pose
+        self.bind_positions = np.zeros((len(self.bone_names), 3), dtype=np.float32) if bind_positions is None else bind_positions
+        self.animation_length = max([bone_animation_data['times'][-1] for bone_animation_data in animation_data if 0 < len(bone_animation_data['times'])] + [0.0])
+        self.frame_count = int(math.ceil(self.animation_length * frame_rate - 1e-4)) + 1
+        self.poses = np.zeros((self.frame_count, len(animation_data), POSE_SIZE), dtype=np.float32)
+        self.poses[:, :, 0] = 1.0
+        self.poses[:, :, 7] = 1.0
+
+        sample_times = np.minimum(np.arange(self.frame_count, dtype=np.float64) / frame_rate, self.animation_length)
+        for bone_index, bone_animation_data in enumerate(animation_data):
+            times = np.array(bone_animation_data['times'], dtype=np.float64)
+            if 0 == len(times):
+                continue
+            # nlerp of keys in one hemisphere, keys this dense are as good as the engine's slerp
+            rotations = align_quaternions(np.array(bone_animation_data['rotations'], dtype=np.float64))
+            self.poses[:, bone_index, 0:4] = normalize_quaternions(interpolate_keys(times, rotations, sample_times))
+            self.poses[:, bone_index, 4:7] = interpolate_keys(times, np.array(bone_animation_data['locations'], dtype=np.float64), sample_times)
+            scales = np.array(bone_animation_data['scales'], dtype=np.float64)
+            self.poses[:, bone_index, 7] = interpolate_keys(times, scales.mean(axis=1, keepdims=True), sample_times)[:, 0]
+
+    @property
+    def size(self):
+        return self.poses.nbytes
+
+    def sample(self, times):
+        # indexed lerp of the two table frames around each time, times past the end hold the last frame
+        frames = np.clip(np.asarray(times, dtype=np.float64) * self.frame_rate, 0.0, self.frame_count - 1)
+        indices = np.minimum(frames.astype(np.intp), self.frame_count - 1)
+        next_indices = np.minimum(indices + 1, self.frame_count - 1)
+        weights = (frames - indices).astype(np.float32)[..., np.newaxis, np.newaxis]
+        poses = self.poses[indices] * (1.0 - weights) + self.poses[next_indices] * weights
+        poses[..., 0:4] = normalize_quaternions(poses[..., 0:4])
+        return poses
+
+    def sample_into(self, time, poses, scratch):
+        # one time into preallocated (bone, POSE_SIZE) buffers, the quaternions are left for the caller to normalize
+        frame = min(max(0.0, time * self.frame_rate), self.frame_count - 1)
+        index = min(int(frame), self.frame_count - 1)
+        next_index = min(index + 1, self.frame_count - 1)
+        weight = frame - index
+        np.multiply(self.poses[index], 1.0 - weight, out=poses)
+        np.multiply(self.poses[next_index], weight, out=scratch)
+        np.add(poses, scratch, out=poses)
+        return poses
+
+    def get_bone_positions(self, bone_indices):
+        # model space positions of the bones at every table frame, the bone matrices move the bind positions
+        matrices = get_pose_matrices(self.poses[:, bone_indices])
+        return np.einsum('bi,fbij->fbj', self.bind_positions[bone_indices], matrices[..., 0:3, 0:3]) + matrices[..., 3, 0:3]
+
+
+def get_pose_matrices(poses, matrices=None):
+    # row vector bone matrices, scale * rotation * translation like the engine's transforms
+    w, x, y, z = poses[..., 0], poses[..., 1], poses[..., 2], poses[..., 3]
+    scale = poses[..., 7]
+    if matrices is None:
+        matrices = np.zeros(poses.shape[:-1] + (4, 4), dtype=np.float32)
+    else:
+        matrices[..., 0:3, 3] = 0.0
+    matrices[..., 0, 0] = (1.0 - 2.0 * (y * y + z * z)) * scale
+    matrices[..., 0, 1] = 2.0 * (x * y + w * z) * scale
+    matrices[..., 0, 2] = 2.0 * (x * z - w * y) * scale
+    matrices[..., 1, 0] = 2.0 * (x * y - w * z) * scale
+    matrices[..., 1, 1] = (1.0 - 2.0 * (x * x + z * z)) * scale
+    matrices[..., 1, 2] = 2.0 * (y * z + w * x) * scale
+    matrices[..., 2, 0] = 2.0 * (x * z + w * y) * scale
+    matrices[..., 2, 1] = 2.0 * (y * z - w * x) * scale
+    matrices[..., 2, 2] = (1.0 - 2.0 * (x * x + y * y)) * scale
+    matrices[..., 3, 0:3] = poses[..., 4:7]
+    matrices[..., 3, 3] = 1.0
+    return matrices
+
+
+# float32 bone palettes of the current frame, one per (clip, rounded clip time) no matter how many fighters play it
+class BonePaletteCache:
+    def __init__(self, get_pose_table, time_steps=PALETTE_TIME_STEPS):
+        self.get_pose_table = get_pose_table
+        self.time_steps = time_steps
+        self.palettes = {}
+        self.request_count = 0
+
+    def clear(self):
+        # the palettes of the last frame are handed out until the next clear
+        self.palettes = {}
+        self.request_count = 0
+
+    def get_key(self, clip_name, time):
+        return clip_name, int(time * self.time_steps + 0.5)
+
+    def get_palettes(self, clip_names, times):
+        keys = [self.get_key(clip_name, time) for clip_name, time in zip(clip_names, times)]
+        self.request_count += len(keys)
+
+        # the missing palettes of each clip in one sample and one matrix build
+        missing_keys = {}
+        for key in keys:
+            if key not in self.palettes:
+                missing_keys.setdefault(key[0], set()).add(key[1])
+        for clip_name, steps in missing_keys.items():
+            steps = sorted(steps)
+            matrices = get_pose_matrices(self.get_pose_table(clip_name).sample(np.array(steps, dtype=np.float64) / self.time_steps))
+            for step, palette in zip(steps, matrices):
+                self.palettes[(clip_name, step)] = palette
+        return [self.palettes[key] for key in keys]
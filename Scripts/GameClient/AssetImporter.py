@@ -0,0 +1,223 @@
+import os
+import json
+import time
+import hashlib
+import argparse
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from GameClient.Resource import *
+from GameClient.MeshFormat import *
+from GameClient.TextureCompressor import *
+from GameClient.CollisionFormat import *
+from GameClient.NavGrid import *
+
+
+EXTERNAL_PATH = 'Externals'
+EXTERNAL_SOURCE_PATHS = ('Textures', 'Meshes')
+IMPORT_DATABASE = os.path.join('Cache', 'import_database.json')
+# bump when an importer output changes, every source is imported again
+IMPORTER_VERSION = 1
+
+mesh_source_exts = ('.dae', '.obj')
+texture_source_exts = ('.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp', '.tga')
+
+
+def import_mesh(source_filepath, filepath):
+    # the engine's own loaders, imported in the worker process
+    ext = os.path.splitext(source_filepath)[1].lower()
+    if ext == '.obj':
+        from PyEngine3D.ResourceManager.ObjLoader import OBJ
+        mesh_data = OBJ(source_filepath, 1, True).get_mesh_data()
+    else:
+        from PyEngine3D.ResourceManager.ColladaLoader import Collada
+        mesh_data = Collada(source_filepath).get_mesh_data()
+    save_resource_data(filepath, mesh_data)
+
+
+def import_texture(source_filepath, filepath):
+    from PIL import Image
+    from OpenGL.GL import GL_RGB, GL_RGBA, GL_RGB8, GL_RGBA8, GL_UNSIGNED_BYTE, GL_LINEAR_MIPMAP_LINEAR, GL_LINEAR, GL_REPEAT
+
+    image = Image.open(source_filepath)
+    image_mode = 'RGBA' if image.mode in ('RGBA', 'LA', 'PA') or 'transparency' in image.info else 'RGB'
+    # textures are stored bottom row first
+    image = image.convert(image_mode).transpose(Image.FLIP_TOP_BOTTOM)
+    is_rgba = image_mode == 'RGBA'
+    texture_data = dict(texture_type='Texture2D',
+                        width=image.width,
+                        height=image.height,
+                        depth=1,
+                        image_mode=image_mode,
+                        internal_format=GL_RGBA8 if is_rgba else GL_RGB8,
+                        texture_format=GL_RGBA if is_rgba else GL_RGB,
+                        data_type=GL_UNSIGNED_BYTE,
+                        min_filter=GL_LINEAR_MIPMAP_LINEAR,
+                        mag_filter=GL_LINEAR,
+                        wrap=GL_REPEAT,
+                        wrap_s=None,
+                        wrap_t=None,
+                        wrap_r=None,
+                        data=np.asarray(image, dtype=np.uint8).reshape(-1))
+    save_resource_data(filepath, texture_data)
+
+
+def import_asset(project_path, source, output):
+    # runs in a worker process, returns the time spent so the report can show the slow ones
+    start_time = time.perf_counter()
+    source_filepath = os.path.join(project_path, source)
+    filepath = os.path.join(project_path, output)
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    if os.path.splitext(source)[1].lower() in mesh_source_exts:
+        import_mesh(source_filepath, filepath)
+    else:
+        import_texture(source_filepath, filepath)
+    return time.perf_counter() - start_time
+
+
+def get_file_hash(filepath):
+    sha1 = hashlib.sha1()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def get_output(relative_filepath):
+    name, ext = os.path.splitext(relative_filepath)
+    ext = ext.lower()
+    if ext in mesh_source_exts:
+        return os.path.join(MESH_PATH, name + MESH_EXT)
+    elif ext in texture_source_exts:
+        return os.path.join(TEXTURE_PATH, name + TEXTURE_EXT)
+    return None
+
+
+def collect_sources(project_path=PROJECT_PATH):
+    # source to output, a texture exported next to the meshes loses against the one in Externals/Textures
+    sources = {}
+    outputs = set()
+    for source_path in EXTERNAL_SOURCE_PATHS:
+        root_path = os.path.join(project_path, EXTERNAL_PATH, source_path)
+        for dirpath, dirnames, filenames in os.walk(root_path):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                source_filepath = os.path.join(dirpath, filename)
+                output = get_output(os.path.relpath(source_filepath, root_path))
+                if output is None or output in outputs:
+                    continue
+                outputs.add(output)
+                sources[os.path.relpath(source_filepath, project_path)] = output
+    return sources
+
+
+# content hash of every source and the outputs imported from it, kept in Cache/ next to the texture cache
+class ImportDatabase:
+    def __init__(self, project_path=PROJECT_PATH):
+        self.project_path = project_path
+        self.filepath = os.path.join(project_path, IMPORT_DATABASE)
+        self.entries = {}
+        if os.path.exists(self.filepath):
+            with open(self.filepath, 'r') as f:
+                self.entries = json.load(f)
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.filepath), exist_ok=True)
+        with open(self.filepath + '.tmp', 'w') as f:
+            json.dump(self.entries, f, indent=1, sort_keys=True)
+        os.replace(self.filepath + '.tmp', self.filepath)
+
+    def get_source_hash(self, source):
+        # only sources whose size or mtime changed are hashed again
+        stat = os.stat(os.path.join(self.project_path, source))
+        entry = self.entries.get(source)
+        if entry is not None and entry['source_size'] == stat.st_size and entry['source_mtime'] == stat.st_mtime:
+            return entry['source_hash'], stat
+        return get_file_hash(os.path.join(self.project_path, source)), stat
+
+    def is_stale(self, source, output, source_hash):
+        entry = self.entries.get(source)
+        return entry is None or \
+            entry['source_hash'] != source_hash or \
+            entry['importer_version'] != IMPORTER_VERSION or \
+            entry['output'] != output or \
+            not os.path.exists(os.path.join(self.project_path, output))
+
+    def update(self, source, output, source_hash, stat):
+        self.entries[source] = dict(source_hash=source_hash,
+                                    source_size=stat.st_size,
+                                    source_mtime=stat.st_mtime,
+                                    importer_version=IMPORTER_VERSION,
+                                    output=output)
+
+
+def update_derived_assets(project_path, output):
+    # converted meshes and animation clips follow the mesh they came from
+    name, ext = os.path.splitext(os.path.relpath(output, MESH_PATH))
+    if ext != MESH_EXT:
+        return
+    filepath = os.path.join(project_path, output)
+    if os.path.exists(get_mesh_binary_filepath(filepath)):
+        convert_mesh(filepath)
+
+    from GameClient.AnimationLibrary import ANIMATION_PATH, animation_list, convert_animation_mesh
+    for clip_name in animation_list:
+        if name == 'player_' + clip_name:
+            os.makedirs(os.path.join(project_path, ANIMATION_PATH), exist_ok=True)
+            convert_animation_mesh(project_path, 'player', clip_name)
+
+
+def import_assets(project_path=PROJECT_PATH, max_workers=None, force=False, adopt=False):
+    database = ImportDatabase(project_path)
+    jobs = {}
+    for source, output in collect_sources(project_path).items():
+        source_hash, stat = database.get_source_hash(source)
+        if adopt and os.path.exists(os.path.join(project_path, output)):
+            # take the outputs already on disk as built from the current sources, the missing ones are imported
+            database.update(source, output, source_hash, stat)
+        elif force or database.is_stale(source, output, source_hash):
+            jobs[source] = (output, source_hash, stat)
+        elif database.entries[source]['source_mtime'] != stat.st_mtime:
+            # touched without a change
+            database.update(source, output, source_hash, stat)
+    database.save()
+
+    if 0 == len(jobs):
+        print("%d assets are up to date" % len(database.entries))
+        bake_collisions(project_path)
+        bake_nav_grids(project_path)
+        return
+
+    print("importing %d assets" % len(jobs))
+    start_time = time.perf_counter()
+    failed_count = 0
+    with ProcessPoolExecutor(max_workers=max_workers or os.cpu_count()) as executor:
+        futures = {executor.submit(import_asset, project_path, source, output): source for source, (output, source_hash, stat) in jobs.items()}
+        for future in as_completed(futures):
+            source = futures[future]
+            output, source_hash, stat = jobs[source]
+            try:
+                import_time = future.result()
+                update_derived_assets(project_path, output)
+            except Exception as e:
+                failed_count += 1
+                print("%-56s failed: %s" % (source, e))
+                continue
+            database.update(source, output, source_hash, stat)
+            database.save()
+            print("%-56s -> %-40s %8.3f sec" % (source, output, import_time))
+    print("imported %d assets, %d failed in %.3f sec" % (len(jobs) - failed_count, failed_count, time.perf_counter() - start_time))
+    # scenes whose collision meshes changed are baked again
+    bake_collisions(project_path)
+    bake_nav_grids(project_path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('project_path', nargs='?', default=PROJECT_PATH)
+    parser.add_argument('--workers', type=int, help='import processes, every core by default')
+    parser.add_argument('--force', action='store_true', help='import every source again')
+    parser.add_argument('--adopt', action='store_true', help='record the existing outputs as up to date, import only the missing ones')
+    args = parser.parse_args()
+    import_assets(args.project_path, args.workers, args.force, args.adopt)
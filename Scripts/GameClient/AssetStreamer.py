@@ -0,0 +1,179 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from PyEngine3D.Common import logger
+from GameClient.Resource import *
+from GameClient.MeshFormat import *
+from GameClient.TextureCompressor import *
+from GameClient.SceneFormat import *
+
+
+# main thread time per frame spent on finishing loaded assets
+STREAMING_TIME_BUDGET = 0.004
+MATERIAL_INSTANCE_PATH = 'MaterialInstances'
+MATERIAL_INSTANCE_EXT = '.matinst'
+# the engine's loader of every kind of resource the streamer installs
+resource_loader_names = {TEXTURE_EXT: 'texture_loader',
+                         MESH_EXT: 'mesh_loader',
+                         MATERIAL_INSTANCE_EXT: 'material_instance_loader'}
+
+
+class AssetLoadError(Exception):
+    pass
+
+
+class AssetJob:
+    def __init__(self, name, future, finalize, required):
+        self.name = name
+        self.future = future
+        self.finalize = finalize
+        self.required = required
+
+
+def load_asset_data(filepath):
+    # .mesh, .texture and .anim are gzip pickles, .bmesh, .ctex and .bscene are mapped, .matinst, .model and .scene are text
+    ext = os.path.splitext(filepath)[1]
+    if ext == MESH_EXT:
+        return load_mesh_data(filepath)
+    elif ext == MESH_BINARY_EXT:
+        return load_mesh_binary(filepath)
+    elif ext == COMPRESSED_TEXTURE_EXT:
+        return load_compressed_texture_data(filepath)
+    elif ext == SCENE_EXT:
+        return load_scene(filepath)
+    elif ext == SCENE_BINARY_EXT:
+        return load_scene_binary(filepath)
+    elif ext in (MATERIAL_INSTANCE_EXT, '.model'):
+        with open(filepath, 'r') as f:
+            return f.read()
+    return load_resource_data(filepath)
+
+
+def get_resource_filepath(project_path, resource_path, resource_name, ext):
+    # the engine names a resource after its path below the resource folder, with dots between the folders
+    return os.path.join(project_path, resource_path, *resource_name.split('.')) + ext
+
+
+def collect_scene_resources(scene_filepath, project_path=PROJECT_PATH, model_names=()):
+    # meshes and material instances of the models in the scene and the textures of those material instances,
+    # only the ones with a file, the engine makes the others (e.g. common.flat_white) itself
+    scene_data = load_scene(scene_filepath)
+    model_names = list(model_names)
+    for key in ('static_actors', 'skeleton_actors', 'collision_actors'):
+        model_names.extend(actor_data['model'] for actor_data in scene_data.get(key, []))
+
+    textures = {}
+    meshes = {}
+    material_instances = {}
+    for model_name in dict.fromkeys(model_names):
+        model_filepath = os.path.join(project_path, 'Models', model_name + '.model')
+        if not os.path.exists(model_filepath):
+            continue
+        model_data = load_text_data(model_filepath)
+        mesh_filepath = get_resource_filepath(project_path, MESH_PATH, model_data['mesh'], MESH_EXT)
+        if os.path.exists(mesh_filepath):
+            meshes[model_data['mesh']] = mesh_filepath
+        for material_instance_name in model_data.get('material_instances', []):
+            filepath = get_resource_filepath(project_path, MATERIAL_INSTANCE_PATH, material_instance_name, MATERIAL_INSTANCE_EXT)
+            if material_instance_name in material_instances or not os.path.exists(filepath):
+                continue
+            with open(filepath, 'r') as f:
+                material_instance_data = parse_scene_text(f.read())
+            material_instances[material_instance_name] = material_instance_data
+            for value in material_instance_data.get('uniform_datas', {}).values():
+                if isinstance(value, str) and value not in textures:
+                    texture_filepath = get_resource_filepath(project_path, TEXTURE_PATH, value, TEXTURE_EXT)
+                    if os.path.exists(texture_filepath):
+                        textures[value] = texture_filepath
+    return textures, meshes, material_instances
+
+
+def create_engine_resource(resource_name, ext, data):
+    # what the engine's loaders build from the same data in load_resource
+    if ext == TEXTURE_EXT:
+        from PyEngine3D.OpenGLContext import CreateTexture
+        return CreateTexture(name=resource_name, **data)
+    elif ext == MESH_EXT:
+        from PyEngine3D.Render import Mesh
+        return Mesh(resource_name, **data)
+    from PyEngine3D.Render import MaterialInstance
+    return MaterialInstance(resource_name, **data)
+
+
+def install_resource(resource_manager, resource_name, ext, resource):
+    # every resource file is registered when the engine starts, one with data counts as loaded and the
+    # loader's get_resource returns it instead of reading the file again
+    registered_resource = getattr(resource_manager, resource_loader_names[ext]).resources.get(resource_name)
+    if registered_resource is None:
+        raise KeyError("%s is not registered" % resource_name)
+    registered_resource.set_data(resource)
+
+
+# decompresses and unpickles assets on a worker pool, the main thread only runs the finalize step (GL uploads,
+# scene registration) in request order and within a time budget per frame
+class AssetStreamer:
+    def __init__(self, max_workers=None, progress_callback=None):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers or min(8, os.cpu_count() or 1))
+        self.progress_callback = progress_callback
+        self.jobs = deque()
+        self.request_count = 0
+        self.finish_count = 0
+        self.failed_names = []
+        self.error = None
+
+    def request(self, name, filepath, finalize, decode=load_asset_data, required=False):
+        future = self.executor.submit(decode, filepath)
+        self.jobs.append(AssetJob(name, future, finalize, required))
+        self.request_count += 1
+
+    def request_main_thread(self, name, function, required=True):
+        # work which has to stay on the main thread, e.g. engine calls, runs in order with the loaded assets
+        self.jobs.append(AssetJob(name, None, function, required))
+        self.request_count += 1
+
+    def is_done(self):
+        return 0 == len(self.jobs)
+
+    def get_progress(self):
+        return self.finish_count, self.request_count
+
+    def update(self, time_budget=STREAMING_TIME_BUDGET):
+        if self.error is not None:
+            raise self.error
+        start_time = time.perf_counter()
+        while self.jobs:
+            job = self.jobs[0]
+            if job.future is not None and not job.future.done() and time_budget is not None:
+                break
+
+            try:
+                if job.future is None:
+                    job.finalize()
+                else:
+                    job.finalize(job.future.result())
+            except Exception as e:
+                # the jobs behind a required one depend on it, it stays queued and every later update raises again
+                if job.required:
+                    self.error = AssetLoadError("failed to load %s: %s" % (job.name, e))
+                    raise self.error from e
+                logger.error("failed to load %s: %s" % (job.name, e))
+                self.failed_names.append(job.name)
+            self.jobs.popleft()
+
+            self.finish_count += 1
+            if self.progress_callback is not None:
+                self.progress_callback(job.name, self.finish_count, self.request_count)
+
+            if time_budget is not None and time_budget <= (time.perf_counter() - start_time):
+                break
+        return self.is_done()
+
+    def wait(self):
+        while not self.update(time_budget=None):
+            pass
+
+    def shutdown(self):
+        self.jobs.clear()
+        self.executor.shutdown(wait=False)
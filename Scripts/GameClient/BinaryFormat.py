@@ -0,0 +1,157 @@
+import json
+import math
+import mmap
+import struct
+from numbers import Number
+
+import numpy as np
+
+
+BINARY_VERSION = 1
+BINARY_ALIGNMENT = 16
+# magic, version, header size
+BINARY_PREFIX = struct.Struct('<4sII')
+ARRAY_KEY = '__array__'
+TUPLE_KEY = '__tuple__'
+
+
+def get_aligned_size(size, alignment=BINARY_ALIGNMENT):
+    return (size + alignment - 1) // alignment * alignment
+
+
+def get_int_dtype(values):
+    min_value, max_value = np.min(values), np.max(values)
+    if 0 <= min_value and max_value <= 0xffff:
+        return np.uint16
+    elif 0 <= min_value and max_value <= 0xffffffff:
+        return np.uint32
+    return np.int32
+
+
+def is_number_list(value):
+    return 0 < len(value) and all(isinstance(item, Number) and not isinstance(item, bool) for item in value)
+
+
+def to_array(value, int_array=False):
+    # lists of numbers, of number lists or of ndarrays become one contiguous float32 or compact int array, int ndarrays
+    # keep their type. Lists of python ints only become an array with int_array, the key says they are indices and not
+    # floats written without a fraction, otherwise they stay lists.
+    if isinstance(value, np.ndarray):
+        array = value
+    elif not isinstance(value, list) or 0 == len(value):
+        return None
+    elif is_number_list(value):
+        array = np.array(value)
+    elif all(isinstance(item, np.ndarray) for item in value) and 1 == len(set(item.shape for item in value)):
+        array = np.stack(value)
+    elif all(isinstance(item, list) and is_number_list(item) for item in value) and 1 == len(set(len(item) for item in value)):
+        array = np.array(value)
+    else:
+        return None
+
+    if array.dtype.kind == 'f':
+        return np.ascontiguousarray(array, dtype=np.float32)
+    elif array.dtype.kind in 'iu':
+        if isinstance(value, np.ndarray) and array.dtype.itemsize <= 4:
+            return np.ascontiguousarray(array)
+        if not int_array and not isinstance(value, np.ndarray) and not isinstance(value[0], np.ndarray):
+            return None
+        return np.ascontiguousarray(array, dtype=get_int_dtype(array) if 0 < array.size else np.uint16)
+    return None
+
+
+def read_arrays(value):
+    # a copy of every array in value, lists as to_array stores them, what a load costs until the data is in memory
+    # and not only mapped
+    if isinstance(value, dict):
+        return [array for item in value.values() for array in read_arrays(item)]
+    elif isinstance(value, np.ndarray):
+        return [np.array(value)]
+    elif isinstance(value, (list, tuple)):
+        array = to_array(value, True) if isinstance(value, list) else None
+        if array is not None:
+            return [array]
+        return [array for item in value for array in read_arrays(item)]
+    return []
+
+
+def pack_data(value, arrays, path='data', pack_lists=True, int_keys=(), int_array=False):
+    # without pack_lists only ndarrays are stored as arrays and keep their type, everything else stays as it is.
+    # The int lists of the keys in int_keys are stored as arrays too, see to_array.
+    if pack_lists:
+        array = to_array(value, int_array)
+    else:
+        array = np.ascontiguousarray(value) if isinstance(value, np.ndarray) else None
+
+    if array is not None:
+        arrays.append((path, array))
+        return {ARRAY_KEY: len(arrays) - 1}
+    elif isinstance(value, dict):
+        return {key: pack_data(item, arrays, path + '.' + str(key), pack_lists, int_keys, key in int_keys) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [pack_data(item, arrays, '%s[%d]' % (path, i), pack_lists, int_keys, int_array) for i, item in enumerate(value)]
+    elif isinstance(value, tuple):
+        return {TUPLE_KEY: [pack_data(item, arrays, '%s[%d]' % (path, i), pack_lists, int_keys, int_array) for i, item in enumerate(value)]}
+    elif isinstance(value, np.generic):
+        return value.item()
+    return value
+
+
+def unpack_data(value, arrays):
+    if isinstance(value, dict):
+        if ARRAY_KEY in value:
+            return arrays[value[ARRAY_KEY]]
+        elif TUPLE_KEY in value:
+            return tuple(unpack_data(item, arrays) for item in value[TUPLE_KEY])
+        return {key: unpack_data(item, arrays) for key, item in value.items()}
+    elif isinstance(value, list):
+        return [unpack_data(item, arrays) for item in value]
+    return value
+
+
+# small json header followed by aligned raw arrays, loaded through mmap without copying
+def save_binary_data(filepath, magic, data, pack_lists=True, int_keys=()):
+    arrays = []
+    packed_data = pack_data(data, arrays, pack_lists=pack_lists, int_keys=int_keys)
+
+    array_infos = []
+    offset = 0
+    for name, array in arrays:
+        array_infos.append(dict(name=name, dtype=array.dtype.str, shape=array.shape, offset=offset))
+        offset = get_aligned_size(offset + array.nbytes)
+
+    header = json.dumps(dict(data=packed_data, arrays=array_infos), separators=(',', ':')).encode('utf-8')
+    header_size = get_aligned_size(BINARY_PREFIX.size + len(header)) - BINARY_PREFIX.size
+
+    with open(filepath, 'wb') as f:
+        f.write(BINARY_PREFIX.pack(magic, BINARY_VERSION, header_size))
+        f.write(header.ljust(header_size, b' '))
+        data_offset = BINARY_PREFIX.size + header_size
+        for (name, array), array_info in zip(arrays, array_infos):
+            f.seek(data_offset + array_info['offset'])
+            f.write(array.tobytes())
+
+
+def load_binary_data(filepath, magic):
+    with open(filepath, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    file_magic, version, header_size = BINARY_PREFIX.unpack_from(buffer)
+    if file_magic != magic or version != BINARY_VERSION:
+        raise ValueError("%s is not a %s file of version %d" % (filepath, magic, BINARY_VERSION))
+
+    header = json.loads(bytes(buffer[BINARY_PREFIX.size:BINARY_PREFIX.size + header_size]).decode('utf-8'))
+    data_offset = BINARY_PREFIX.size + header_size
+    arrays = []
+    for array_info in header['arrays']:
+        dtype = np.dtype(array_info['dtype'])
+        shape = tuple(array_info['shape'])
+        count = math.prod(shape)
+        if 0 == count:
+            # empty arrays at the end of the file point past it
+            arrays.append(np.zeros(shape, dtype=dtype))
+            continue
+        # the arrays keep the mapping alive, they are read only views into the file
+        array = np.frombuffer(buffer, dtype=dtype, count=count, offset=data_offset + array_info['offset'])
+        arrays.append(array.reshape(shape))
+    return unpack_data(header['data'], arrays)
@@ -0,0 +1,316 @@
+import sys
+import math
+
+import numpy as np
+
+
+BOUND_BOX_OFFSET = 0.1
+EPSILON = sys.float_info.epsilon
+MAX_CELLS_PER_BOX = 64
+# boxes per leaf of the collision bvh
+BVH_LEAF_SIZE = 4
+# below this many (fighter, box) pairs the scalar loop beats the NumPy call overhead
+MIN_VECTORIZED_PAIRS = 48
+# longest move solved in one step, a longer move of a delta spike is split into substeps
+MAX_STEP_LENGTH = 0.5
+MAX_SUBSTEPS = 16
+
+
+def compute_collide(i, old_position, position, move_vector, bound_box):
+    j = (i + 1) % 3
+    k = (i + 2) % 3
+
+    def is_in_plane(index, ratio):
+        if index == 1:
+            return bound_box.bound_min[index] < (old_position[index] + move_vector[index] * ratio + BOUND_BOX_OFFSET) < bound_box.bound_max[index]
+        else:
+            return bound_box.bound_min[index] < (old_position[index] + move_vector[index] * ratio) < bound_box.bound_max[index]
+
+    if move_vector[i] < 0.0 and position[i] <= bound_box.bound_max[i] <= old_position[i]:
+        ratio = abs((bound_box.bound_max[i] - old_position[i]) / move_vector[i])
+        if is_in_plane(j, ratio) and is_in_plane(k, ratio):
+            position[i] = bound_box.bound_max[i] + EPSILON
+            move_vector[i] = position[i] - old_position[i]
+            # landed on the top face
+            return 1 == i
+    elif 0.0 < move_vector[i] and old_position[i] <= bound_box.bound_min[i] <= position[i]:
+        ratio = abs((bound_box.bound_min[i] - old_position[i]) / move_vector[i])
+        if is_in_plane(j, ratio) and is_in_plane(k, ratio):
+            position[i] = bound_box.bound_min[i] - EPSILON
+            move_vector[i] = position[i] - old_position[i]
+    return False
+
+
+def collect_bound_boxes(collision_actors):
+    bound_boxes = []
+    for collision_actor in collision_actors:
+        bound_boxes.extend(collision_actor.get_geometry_bound_boxes())
+    return bound_boxes
+
+
+class BoundBox:
+    def __init__(self, bound_min, bound_max):
+        self.bound_min = bound_min
+        self.bound_max = bound_max
+
+
+def get_swept_bound(old_position, position):
+    # conservative bound of every point compute_collide can test while moving from old_position to position
+    bound_min = np.minimum(old_position, position)
+    bound_max = np.maximum(old_position, position)
+    bound_max[..., 1] += BOUND_BOX_OFFSET
+    return bound_min, bound_max
+
+
+# static uniform grid over the collision bound boxes, built once per scene
+class CollisionGrid:
+    def __init__(self, bound_boxes, cell_size=None):
+        self.bound_boxes = list(bound_boxes)
+        self.cells = {}
+        self.large_boxes = []
+
+        count = len(self.bound_boxes)
+        self.bound_mins = np.zeros((count, 3), dtype=np.float32)
+        self.bound_maxs = np.zeros((count, 3), dtype=np.float32)
+        for index, bound_box in enumerate(self.bound_boxes):
+            self.bound_mins[index][...] = bound_box.bound_min
+            self.bound_maxs[index][...] = bound_box.bound_max
+
+        if cell_size is None:
+            cell_size = float(np.median(self.bound_maxs - self.bound_mins)) * 2.0 if 0 < count else 1.0
+        self.cell_size = max(1.0, cell_size)
+        self.inv_cell_size = 1.0 / self.cell_size
+
+        for index in range(count):
+            cell_min, cell_max = self.get_cell_range(self.bound_mins[index], self.bound_maxs[index])
+            cell_count = (cell_max[0] - cell_min[0] + 1) * (cell_max[1] - cell_min[1] + 1) * (cell_max[2] - cell_min[2] + 1)
+            if MAX_CELLS_PER_BOX < cell_count:
+                # floors and walls of the whole stage are tested every frame anyway
+                self.large_boxes.append(index)
+                continue
+            for cell in self.iterate_cells(cell_min, cell_max):
+                self.cells.setdefault(cell, []).append(index)
+
+    def get_cell_range(self, bound_min, bound_max):
+        inv_cell_size = self.inv_cell_size
+        cell_min = [math.floor(bound_min[i] * inv_cell_size) for i in range(3)]
+        cell_max = [math.floor(bound_max[i] * inv_cell_size) for i in range(3)]
+        return cell_min, cell_max
+
+    @staticmethod
+    def iterate_cells(cell_min, cell_max):
+        for x in range(cell_min[0], cell_max[0] + 1):
+            for y in range(cell_min[1], cell_max[1] + 1):
+                for z in range(cell_min[2], cell_max[2] + 1):
+                    yield (x, y, z)
+
+    def query(self, bound_min, bound_max):
+        cell_min, cell_max = self.get_cell_range(bound_min, bound_max)
+        cell_count = (cell_max[0] - cell_min[0] + 1) * (cell_max[1] - cell_min[1] + 1) * (cell_max[2] - cell_min[2] + 1)
+        if len(self.cells) < cell_count:
+            return list(range(len(self.bound_boxes)))
+
+        indices = set(self.large_boxes)
+        cells = self.cells
+        for cell in self.iterate_cells(cell_min, cell_max):
+            if cell in cells:
+                indices.update(cells[cell])
+        # keep the brute force order, the clamping of compute_collide is order dependent
+        return sorted(indices)
+
+    def collide(self, old_position, position, move_vector, vectorized=True):
+        indices = self.query(*get_swept_bound(old_position, position))
+        if vectorized:
+            return solve_collide(old_position, position, move_vector, self.bound_mins[indices], self.bound_maxs[indices])
+
+        on_ground = False
+        bound_boxes = self.bound_boxes
+        for index in indices:
+            for i in range(3):
+                if compute_collide(i, old_position, position, move_vector, bound_boxes[index]):
+                    on_ground = True
+        return on_ground
+
+    def query_batch(self, old_positions, positions):
+        pair_fighters = []
+        pair_boxes = []
+        for fighter, (bound_min, bound_max) in enumerate(zip(*get_swept_bound(old_positions, positions))):
+            indices = self.query(bound_min, bound_max)
+            pair_fighters.extend([fighter] * len(indices))
+            pair_boxes.extend(indices)
+        return pair_fighters, pair_boxes
+
+    def solve_pairs(self, old_positions, positions, move_vectors, pair_fighters, pair_boxes, vectorized=True):
+        if vectorized and MIN_VECTORIZED_PAIRS <= len(pair_fighters):
+            pair_fighters = np.asarray(pair_fighters, dtype=np.intp)
+            pair_boxes = np.asarray(pair_boxes, dtype=np.intp)
+            return solve_collide_batch(old_positions, positions, move_vectors, pair_fighters, self.bound_mins[pair_boxes], self.bound_maxs[pair_boxes])
+
+        on_grounds = np.zeros(len(positions), dtype=np.bool_)
+        bound_boxes = self.bound_boxes
+        for fighter, index in zip(pair_fighters, pair_boxes):
+            for i in range(3):
+                if compute_collide(i, old_positions[fighter], positions[fighter], move_vectors[fighter], bound_boxes[index]):
+                    on_grounds[fighter] = True
+        return on_grounds
+
+    def collide_batch(self, old_positions, positions, move_vectors, vectorized=True, max_step_length=MAX_STEP_LENGTH):
+        # the broad phase runs once over the swept bound of the whole move, substeps stay inside it and only rerun the narrow phase
+        pair_fighters, pair_boxes = self.query_batch(old_positions, positions)
+        if 0 == len(move_vectors) or np.einsum('ij,ij->i', move_vectors, move_vectors).max() <= max_step_length * max_step_length:
+            return self.solve_pairs(old_positions, positions, move_vectors, pair_fighters, pair_boxes, vectorized)
+
+        step_counts = get_step_counts(move_vectors, max_step_length)
+        step_count = int(step_counts.max())
+        # a fighter with fewer substeps than the others stands still in the remaining ones, which never hits anything
+        step_vectors = move_vectors / step_counts[:, np.newaxis].astype(np.float32)
+        on_grounds = np.zeros(len(positions), dtype=np.bool_)
+        positions[...] = old_positions
+        for step in range(step_count):
+            step_old_positions = positions.copy()
+            step_move_vectors = np.where((step < step_counts)[:, np.newaxis], step_vectors, np.float32(0.0))
+            positions += step_move_vectors
+            on_grounds |= self.solve_pairs(step_old_positions, positions, step_move_vectors, pair_fighters, pair_boxes, vectorized)
+        move_vectors[...] = positions - old_positions
+        return on_grounds
+
+
+def build_bvh(bound_mins, bound_maxs, leaf_size=BVH_LEAF_SIZE):
+    # median split along the longest axis of the box centers, nodes in depth first order.
+    # a node is followed by its first child, node_skips is the node after its whole subtree, leaves have a box range
+    centers = (bound_mins + bound_maxs) * 0.5
+    box_indices = np.arange(len(bound_mins), dtype=np.int32)
+    node_mins = []
+    node_maxs = []
+    node_skips = []
+    node_starts = []
+    node_counts = []
+
+    def build_node(start, end):
+        node = len(node_mins)
+        indices = box_indices[start:end]
+        node_mins.append(bound_mins[indices].min(axis=0))
+        node_maxs.append(bound_maxs[indices].max(axis=0))
+        node_skips.append(0)
+        node_starts.append(start)
+        node_counts.append(end - start)
+        if leaf_size < end - start:
+            axis = int(np.argmax(centers[indices].max(axis=0) - centers[indices].min(axis=0)))
+            # stable, so equal centers keep the scene order
+            box_indices[start:end] = indices[np.argsort(centers[indices, axis], kind='stable')]
+            middle = (start + end) // 2
+            node_counts[node] = 0
+            build_node(start, middle)
+            build_node(middle, end)
+        node_skips[node] = len(node_mins)
+
+    if 0 < len(bound_mins):
+        build_node(0, len(bound_mins))
+    return dict(node_mins=np.array(node_mins, dtype=np.float32).reshape(-1, 3),
+                node_maxs=np.array(node_maxs, dtype=np.float32).reshape(-1, 3),
+                node_skips=np.array(node_skips, dtype=np.int32),
+                node_starts=np.array(node_starts, dtype=np.int32),
+                node_counts=np.array(node_counts, dtype=np.int32),
+                box_indices=box_indices)
+
+
+# the same narrow phase as the grid over a bvh baked offline, see CollisionFormat
+class CollisionBVH(CollisionGrid):
+    def __init__(self, bound_mins, bound_maxs, bvh):
+        self.bound_mins = np.asarray(bound_mins, dtype=np.float32)
+        self.bound_maxs = np.asarray(bound_maxs, dtype=np.float32)
+        self.bound_boxes = [BoundBox(bound_min, bound_max) for bound_min, bound_max in zip(self.bound_mins, self.bound_maxs)]
+        # python lists, the traversal compares a handful of floats per node
+        self.nodes = list(zip(bvh['node_mins'].tolist(), bvh['node_maxs'].tolist(), bvh['node_skips'].tolist(),
+                              bvh['node_starts'].tolist(), bvh['node_counts'].tolist()))
+        self.box_indices = bvh['box_indices'].tolist()
+
+    def query(self, bound_min, bound_max):
+        min_x, min_y, min_z = bound_min.tolist()
+        max_x, max_y, max_z = bound_max.tolist()
+        nodes = self.nodes
+        node_count = len(nodes)
+        indices = []
+        node = 0
+        while node < node_count:
+            node_min, node_max, skip, start, count = nodes[node]
+            if node_max[0] < min_x or max_x < node_min[0] or node_max[1] < min_y or max_y < node_min[1] or node_max[2] < min_z or max_z < node_min[2]:
+                node = skip
+            elif 0 < count:
+                indices.extend(self.box_indices[start:start + count])
+                node = skip
+            else:
+                node += 1
+        # keep the brute force order, the clamping of compute_collide is order dependent
+        indices.sort()
+        return indices
+
+
+def get_step_counts(move_vectors, max_step_length=MAX_STEP_LENGTH):
+    # the face tests find every crossing of a long move, but contacts are resolved in box order and not in time order,
+    # short steps keep the first contact in time the one that is resolved
+    lengths = np.sqrt(np.sum(np.square(move_vectors), axis=1))
+    return np.clip(np.ceil(lengths / max_step_length), 1, MAX_SUBSTEPS).astype(np.intp)
+
+
+def solve_collide(old_position, position, move_vector, bound_mins, bound_maxs):
+    pair_fighters = np.zeros(len(bound_mins), dtype=np.intp)
+    on_grounds = solve_collide_batch(old_position.reshape(1, 3), position.reshape(1, 3), move_vector.reshape(1, 3), pair_fighters, bound_mins, bound_maxs)
+    return bool(on_grounds[0])
+
+
+def solve_collide_batch(old_positions, positions, move_vectors, pair_fighters, bound_mins, bound_maxs):
+    # batched compute_collide over (fighter, box) pairs grouped by fighter in scene box order, returns on_ground per fighter.
+    # The scalar loop visits (box, axis) pairs in order and every clamp changes position and move_vector for the
+    # pairs after it, so evaluate all remaining pairs at once, apply the first hit of each fighter and continue after it.
+    on_grounds = np.zeros(len(positions), dtype=np.bool_)
+    starts = np.zeros(len(positions), dtype=np.intp)
+    active = np.arange(len(pair_fighters))
+    axes = np.arange(3)
+
+    while 0 < len(active):
+        fighters = pair_fighters[active]
+        old_position = old_positions[fighters]
+        position = positions[fighters]
+        move_vector = move_vectors[fighters]
+        bound_min = bound_mins[active]
+        bound_max = bound_maxs[active]
+        hits = np.zeros((len(active), 3), dtype=np.bool_)
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for i in range(3):
+                negative = move_vector[:, i] < 0.0
+                positive = 0.0 < move_vector[:, i]
+                bound = np.where(negative, bound_max[:, i], bound_min[:, i])
+                hit = (negative & (position[:, i] <= bound) & (bound <= old_position[:, i])) | \
+                      (positive & (old_position[:, i] <= bound) & (bound <= position[:, i]))
+
+                ratio = np.abs((bound - old_position[:, i]) / move_vector[:, i])
+                for index in ((i + 1) % 3, (i + 2) % 3):
+                    plane = old_position[:, index] + move_vector[:, index] * ratio
+                    if index == 1:
+                        plane = plane + BOUND_BOX_OFFSET
+                    hit &= (bound_min[:, index] < plane) & (plane < bound_max[:, index])
+                hits[:, i] = hit
+
+        hits &= starts[fighters][:, np.newaxis] <= (active[:, np.newaxis] * 3 + axes)
+        hit_rows, hit_axes = np.nonzero(hits)
+        if 0 == len(hit_rows):
+            break
+
+        # nonzero is in event order, so the first row of each fighter is its next clamp
+        hit_fighters, first = np.unique(fighters[hit_rows], return_index=True)
+        hit_pairs = active[hit_rows[first]]
+        hit_axes = hit_axes[first]
+
+        negative = move_vectors[hit_fighters, hit_axes] < 0.0
+        positions[hit_fighters, hit_axes] = np.where(negative, bound_maxs[hit_pairs, hit_axes] + EPSILON, bound_mins[hit_pairs, hit_axes] - EPSILON)
+        move_vectors[hit_fighters, hit_axes] = positions[hit_fighters, hit_axes] - old_positions[hit_fighters, hit_axes]
+        # landed on the top face
+        on_grounds[hit_fighters] |= negative & (hit_axes == 1)
+        starts[hit_fighters] = hit_pairs * 3 + hit_axes + 1
+
+        # fighters without a hit are done, the others continue after their clamp
+        active = active[np.isin(pair_fighters[active], hit_fighters)]
+        active = active[starts[pair_fighters[active]] <= active * 3 + 2]
+    return on_grounds
@@ -0,0 +1,205 @@
+import os
+import sys
+import time
+import argparse
+
+import numpy as np
+
+from PyEngine3D.Utilities import TransformObject
+from GameClient.Resource import *
+from GameClient.BinaryFormat import *
+from GameClient.MeshFormat import *
+from GameClient.SceneFormat import *
+from GameClient.Collision import *
+
+
+COLLISION_EXT = '.collision'
+COLLISION_BINARY_MAGIC = b'FGTC'
+# baked and live boxes further apart than this fail the validation
+COLLISION_TOLERANCE = 1e-4
+
+
+def get_collision_filepath(project_path, scene_name):
+    # baked next to the scene it comes from
+    return os.path.join(project_path, SCENE_PATH, scene_name + COLLISION_EXT)
+
+
+def get_world_bound_boxes(actor_data, mesh_data):
+    # world space bound of the 8 corners of every geometry bound, with the engine's transform conventions
+    transform = TransformObject()
+    transform.set_pos(actor_data['pos'])
+    transform.set_rotation(actor_data['rot'])
+    transform.set_scale(actor_data['scale'])
+    transform.update_transform()
+    matrix = transform.matrix
+
+    bound_mins = []
+    bound_maxs = []
+    for geometry_data in mesh_data['geometry_datas']:
+        bound_min = geometry_data['bound_min']
+        bound_max = geometry_data['bound_max']
+        corners = np.array([[x, y, z] for x in (bound_min[0], bound_max[0]) for y in (bound_min[1], bound_max[1]) for z in (bound_min[2], bound_max[2])], dtype=np.float32)
+        corners = np.dot(corners, matrix[:3, :3]) + matrix[3, :3]
+        bound_mins.append(np.min(corners, axis=0).astype(np.float32))
+        bound_maxs.append(np.max(corners, axis=0).astype(np.float32))
+    return bound_mins, bound_maxs
+
+
+def bake_collision(project_path, scene_name):
+    # collision actors in scene order, the same box order collect_bound_boxes gives the live actors
+    scene_filepath = os.path.join(project_path, SCENE_PATH, scene_name + SCENE_EXT)
+    scene_data = load_scene(scene_filepath)
+    sources = [os.path.relpath(scene_filepath, project_path)]
+    bound_mins = []
+    bound_maxs = []
+    for actor_data in scene_data.get('collision_actors', []):
+        model_filepath = os.path.join(project_path, 'Models', actor_data['model'] + '.model')
+        model_data = load_text_data(model_filepath)
+        mesh_filepath = os.path.join(project_path, MESH_PATH, model_data['mesh'] + MESH_EXT)
+        actor_bound_mins, actor_bound_maxs = get_world_bound_boxes(actor_data, load_mesh_data(mesh_filepath))
+        bound_mins.extend(actor_bound_mins)
+        bound_maxs.extend(actor_bound_maxs)
+        for filepath in (model_filepath, mesh_filepath):
+            source = os.path.relpath(filepath, project_path)
+            if source not in sources:
+                sources.append(source)
+
+    bound_mins = np.array(bound_mins, dtype=np.float32).reshape(-1, 3)
+    bound_maxs = np.array(bound_maxs, dtype=np.float32).reshape(-1, 3)
+    return dict(sources=sources, bound_mins=bound_mins, bound_maxs=bound_maxs, bvh=build_bvh(bound_mins, bound_maxs))
+
+
+def save_collision(filepath, collision_data):
+    save_binary_data(filepath, COLLISION_BINARY_MAGIC, collision_data, pack_lists=False)
+
+
+def load_collision(filepath):
+    return load_binary_data(filepath, COLLISION_BINARY_MAGIC)
+
+
+def is_collision_stale(project_path, filepath, collision_data=None):
+    if not os.path.exists(filepath):
+        return True
+    if collision_data is None:
+        collision_data = load_collision(filepath)
+    mtime = os.path.getmtime(filepath)
+    for source in collision_data['sources']:
+        source_filepath = os.path.join(project_path, source)
+        # the converted mesh counts as the mesh
+        if os.path.splitext(source)[1] == MESH_EXT and not os.path.exists(source_filepath):
+            source_filepath = get_mesh_binary_filepath(source_filepath)
+        if not os.path.exists(source_filepath) or mtime < os.path.getmtime(source_filepath):
+            return True
+    return False
+
+
+def load_collision_bvh(project_path, scene_name):
+    # None when there is nothing baked for the scene or it is older than a source, the caller falls back to the live boxes
+    filepath = get_collision_filepath(project_path, scene_name)
+    if not os.path.exists(filepath):
+        return None
+    collision_data = load_collision(filepath)
+    if is_collision_stale(project_path, filepath, collision_data):
+        return None
+    return CollisionBVH(collision_data['bound_mins'], collision_data['bound_maxs'], collision_data['bvh'])
+
+
+def bake_collisions(project_path=PROJECT_PATH, force=False):
+    scene_path = os.path.join(project_path, SCENE_PATH)
+    for filename in sorted(os.listdir(scene_path)):
+        scene_name, ext = os.path.splitext(filename)
+        if ext != SCENE_EXT:
+            continue
+        filepath = get_collision_filepath(project_path, scene_name)
+        if not force and not is_collision_stale(project_path, filepath):
+            continue
+        collision_data = bake_collision(project_path, scene_name)
+        save_collision(filepath, collision_data)
+        print("%-40s %6d boxes %6d nodes" % (os.path.relpath(filepath, project_path), len(collision_data['bound_mins']), len(collision_data['bvh']['node_skips'])))
+
+
+def validate_bvh(bound_mins, bound_maxs, bvh):
+    # every box in exactly one leaf and inside the bound of every node on its path
+    errors = []
+    node_mins = bvh['node_mins']
+    node_maxs = bvh['node_maxs']
+    node_skips = bvh['node_skips']
+    box_indices = bvh['box_indices']
+    leaf_boxes = []
+    for node in range(len(node_skips)):
+        start = bvh['node_starts'][node]
+        end = node_skips[node]
+        if 0 < bvh['node_counts'][node]:
+            leaf_boxes.extend(box_indices[start:start + bvh['node_counts'][node]].tolist())
+        subtree_boxes = [box_indices[other_start:other_start + count] for other_start, count in zip(bvh['node_starts'][node:end], bvh['node_counts'][node:end])]
+        subtree_boxes = np.concatenate(subtree_boxes) if subtree_boxes else np.zeros(0, dtype=np.int32)
+        if np.any(bound_mins[subtree_boxes] < node_mins[node]) or np.any(node_maxs[node] < bound_maxs[subtree_boxes]):
+            errors.append("node %d does not contain its boxes" % node)
+    if sorted(leaf_boxes) != list(range(len(bound_mins))):
+        errors.append("the leaves do not hold every box once")
+    return errors
+
+
+def validate_collision(project_path, scene_name, live_bound_boxes=None):
+    # live_bound_boxes are the boxes of the collision actors of the running scene, the scene and meshes on disk otherwise
+    filepath = get_collision_filepath(project_path, scene_name)
+    if not os.path.exists(filepath):
+        return ["%s is not baked" % filepath]
+    collision_data = load_collision(filepath)
+    bound_mins = collision_data['bound_mins']
+    bound_maxs = collision_data['bound_maxs']
+    if live_bound_boxes is None:
+        live_data = bake_collision(project_path, scene_name)
+        live_bound_mins = live_data['bound_mins']
+        live_bound_maxs = live_data['bound_maxs']
+    else:
+        live_bound_mins = np.array([bound_box.bound_min for bound_box in live_bound_boxes], dtype=np.float32).reshape(-1, 3)
+        live_bound_maxs = np.array([bound_box.bound_max for bound_box in live_bound_boxes], dtype=np.float32).reshape(-1, 3)
+
+    errors = validate_bvh(bound_mins, bound_maxs, collision_data['bvh'])
+    if len(live_bound_mins) != len(bound_mins):
+        errors.append("%d baked boxes, %d live boxes" % (len(bound_mins), len(live_bound_mins)))
+        return errors
+    differences = np.maximum(np.abs(live_bound_mins - bound_mins), np.abs(live_bound_maxs - bound_maxs)).max(axis=1)
+    for index in np.flatnonzero(COLLISION_TOLERANCE < differences):
+        errors.append("box %d is %f off: baked %s %s, live %s %s" % (index, differences[index], bound_mins[index], bound_maxs[index], live_bound_mins[index], live_bound_maxs[index]))
+
+    # the bvh has to find at least every box the brute force overlap test finds
+    collision_bvh = CollisionBVH(bound_mins, bound_maxs, collision_data['bvh'])
+    random = np.random.RandomState(0)
+    extent_min = bound_mins.min(axis=0) if 0 < len(bound_mins) else np.zeros(3, dtype=np.float32)
+    extent_max = bound_maxs.max(axis=0) if 0 < len(bound_maxs) else np.ones(3, dtype=np.float32)
+    for i in range(1000):
+        center = random.uniform(extent_min, extent_max).astype(np.float32)
+        half_size = random.uniform(0.0, 2.0, 3).astype(np.float32)
+        query_min = center - half_size
+        query_max = center + half_size
+        expected = np.flatnonzero(np.all(bound_mins <= query_max, axis=1) & np.all(query_min <= bound_maxs, axis=1))
+        if not set(expected.tolist()).issubset(collision_bvh.query(query_min, query_max)):
+            errors.append("the bvh misses boxes overlapping %s %s" % (query_min, query_max))
+            break
+    return errors
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('project_path', nargs='?', default=PROJECT_PATH)
+    parser.add_argument('--force', action='store_true', help='bake every scene again')
+    parser.add_argument('--validate', action='store_true', help='check the baked boxes and bvh against the scene and meshes')
+    args = parser.parse_args()
+
+    if args.validate:
+        error_count = 0
+        for filename in sorted(os.listdir(os.path.join(args.project_path, SCENE_PATH))):
+            scene_name, ext = os.path.splitext(filename)
+            if ext == SCENE_EXT:
+                errors = validate_collision(args.project_path, scene_name)
+                error_count += len(errors)
+                for error in errors:
+                    print("%s: %s" % (scene_name, error))
+                print("%s: %s" % (scene_name, "failed" if errors else "ok"))
+        sys.exit(1 if error_count else 0)
+
+    start_time = time.perf_counter()
+    bake_collisions(args.project_path, args.force)
+    print("done in %.3f sec" % (time.perf_counter() - start_time))
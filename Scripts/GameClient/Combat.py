@@ -0,0 +1,210 @@
+import numpy as np
+
+from GameClient.GameState import *
+from GameClient.AnimationSampler import *
+
+
+# model space positions of the volume bones at every frame of every clip in one array,
+# the volumes of any number of fighters come out of one gather
+class BoneVolumeTable:
+    def __init__(self, get_pose_table, bone_names):
+        self.get_pose_table = get_pose_table
+        self.bone_names = list(bone_names)
+        self.clip_indices = {}
+        self.offsets = np.zeros(0, dtype=np.intp)
+        self.frame_counts = np.zeros(0, dtype=np.intp)
+        self.frame_rates = np.zeros(0, dtype=np.float64)
+        self.positions = np.zeros((0, len(self.bone_names), 3), dtype=np.float32)
+        # (clip, bone) the furthest the bone gets from the root in the horizontal plane
+        self.extents = np.zeros((0, len(self.bone_names)), dtype=np.float32)
+
+    def get_clip_index(self, clip_name):
+        # a clip is baked the first time a fighter plays it
+        clip_index = self.clip_indices.get(clip_name)
+        if clip_index is None:
+            pose_table = self.get_pose_table(clip_name)
+            bone_indices = [pose_table.bone_names.index(bone_name) for bone_name in self.bone_names]
+            positions = pose_table.get_bone_positions(bone_indices).astype(np.float32)
+            clip_index = len(self.clip_indices)
+            self.clip_indices[clip_name] = clip_index
+            self.offsets = np.append(self.offsets, len(self.positions))
+            self.frame_counts = np.append(self.frame_counts, len(positions))
+            self.frame_rates = np.append(self.frame_rates, pose_table.frame_rate)
+            self.positions = np.concatenate([self.positions, positions])
+            extents = np.sqrt(np.max(np.square(positions[..., 0]) + np.square(positions[..., 2]), axis=0))
+            self.extents = np.concatenate([self.extents, extents[np.newaxis, :]])
+        return clip_index
+
+    def get_positions(self, clip_indices, times):
+        # (fighter, bone, 3) lerp of the two table frames around each clip time
+        frame_counts = self.frame_counts[clip_indices]
+        frames = np.clip(times * self.frame_rates[clip_indices], 0.0, frame_counts - 1)
+        indices = frames.astype(np.intp)
+        next_indices = np.minimum(indices + 1, frame_counts - 1)
+        weights = (frames - indices).astype(np.float32)[:, np.newaxis, np.newaxis]
+        offsets = self.offsets[clip_indices]
+        return self.positions[offsets + indices] * (1.0 - weights) + self.positions[offsets + next_indices] * weights
+
+
+def get_world_positions(local_positions, positions, yaws, scales):
+    # (fighter, bone, 3) model space to world space with the fighter's yaw, scale and position
+    cos = np.cos(yaws)[:, np.newaxis]
+    sin = np.sin(yaws)[:, np.newaxis]
+    world_positions = np.empty_like(local_positions)
+    world_positions[..., 0] = local_positions[..., 0] * cos + local_positions[..., 2] * sin
+    world_positions[..., 1] = local_positions[..., 1]
+    world_positions[..., 2] = local_positions[..., 2] * cos - local_positions[..., 0] * sin
+    world_positions *= scales[:, np.newaxis, np.newaxis]
+    world_positions += positions[:, np.newaxis, :]
+    return world_positions
+
+
+def get_sweep_pairs(positions, indices, reach):
+    # (index, other) pairs closer than reach along the horizontal axis the fighters spread most on,
+    # a sort and a binary search instead of every pair
+    axis = 0 if np.ptp(positions[:, 2]) <= np.ptp(positions[:, 0]) else 2
+    order = np.argsort(positions[:, axis], kind='stable')
+    sorted_values = positions[order, axis]
+    starts = np.searchsorted(sorted_values, positions[indices, axis] - reach, side='left')
+    ends = np.searchsorted(sorted_values, positions[indices, axis] + reach, side='right')
+    pair_counts = ends - starts
+    pair_offsets = np.arange(pair_counts.sum()) - np.repeat(np.cumsum(pair_counts) - pair_counts, pair_counts)
+    return np.repeat(np.arange(len(indices)), pair_counts), order[np.repeat(starts, pair_counts) + pair_offsets]
+
+
+# hitboxes and hurtboxes are spheres on skeleton bones in model units, posed by the clip each fighter plays.
+# The attackers in the active frames of a move are tested against every fighter in reach in one pass per frame,
+# a hit switches the defender to the hit reaction of the move segment.
+class CombatSystem:
+    def __init__(self, get_pose_table, move_set):
+        self.move_set = move_set
+        self.volume_table = BoneVolumeTable(get_pose_table, move_set.get_volume_bone_names())
+        bone_indices = {bone_name: index for index, bone_name in enumerate(self.volume_table.bone_names)}
+        self.hurtbox_bones = np.array([bone_indices[bone_name] for bone_name, radius in move_set.hurtboxes], dtype=np.intp)
+        self.hurtbox_radii = np.array([radius for bone_name, radius in move_set.hurtboxes], dtype=np.float32)
+
+        # hitboxes of every move segment padded to the same count, a padded slot has a negative radius,
+        # and the active frames of every segment in one array
+        self.hitbox_rows = {}
+        segments = []
+        active_frames = []
+        for move in move_set.moves.values():
+            for segment, hitboxes in enumerate(move.hitboxes):
+                self.hitbox_rows[(move.name, segment)] = len(segments)
+                segments.append((hitboxes, move.knockdowns[segment]))
+                active_frames.append(move.active_frames[move.frame_offsets[segment]:move.frame_offsets[segment + 1]])
+        self.active_frames = np.concatenate(active_frames) if active_frames else np.zeros(0, dtype=np.bool_)
+        self.active_frame_counts = np.array([len(frames) for frames in active_frames], dtype=np.intp)
+        self.active_frame_offsets = np.cumsum(self.active_frame_counts) - self.active_frame_counts
+        hitbox_count = max([len(hitboxes) for hitboxes, knockdown in segments] + [1])
+        self.hitbox_bones = np.zeros((len(segments), hitbox_count), dtype=np.intp)
+        self.hitbox_radii = np.full((len(segments), hitbox_count), -1.0, dtype=np.float32)
+        self.knockdowns = np.zeros(len(segments), dtype=np.bool_)
+        for row, (hitboxes, knockdown) in enumerate(segments):
+            for column, (bone_name, radius) in enumerate(hitboxes):
+                self.hitbox_bones[row, column] = bone_indices[bone_name]
+                self.hitbox_radii[row, column] = radius
+            self.knockdowns[row] = knockdown
+        self.hit_count = 0
+
+    def get_attackers(self, state_managers, state_keys):
+        # fighters in the active frames of a move and the hitbox row of the move segment, StateAttack.is_active for all at once
+        indices = np.flatnonzero(attack_state_table[state_keys])
+        states = [state_managers[index].state for index in indices]
+        hitbox_rows = np.fromiter((self.hitbox_rows[(state.move_name, state.get_segment())] for state in states), dtype=np.intp, count=len(states))
+        move_times = np.fromiter((state.get_move_time(state.state_manager.state_info) for state in states), dtype=np.float64, count=len(states))
+        frames = np.clip((move_times * self.move_set.frame_rate).astype(np.intp), 0, self.active_frame_counts[hitbox_rows] - 1)
+        is_active = self.active_frames[self.active_frame_offsets[hitbox_rows] + frames]
+        return indices[is_active], hitbox_rows[is_active]
+
+    def get_animations(self, actors):
+        # clip and clip time of every fighter, fighters without a clip have no volumes
+        count = len(actors)
+        clip_names = [None if actor.animation is None else actor.animation.name for actor in actors]
+        table_clip_indices = self.volume_table.clip_indices
+        for clip_name in set(clip_names).difference(table_clip_indices):
+            if clip_name is not None:
+                self.volume_table.get_clip_index(clip_name)
+        clip_indices = np.fromiter((table_clip_indices.get(clip_name, -1) for clip_name in clip_names), dtype=np.intp, count=count)
+        times = np.fromiter((actor.animation_time for actor in actors), dtype=np.float64, count=count)
+        is_animated = 0 <= clip_indices
+        clip_indices[~is_animated] = 0
+        return clip_indices, times, is_animated
+
+    def get_reaches(self, clip_indices, hitbox_rows=None):
+        # how far the hurtboxes, or the hitboxes of the rows, get from the root in the clips, in model units
+        extents = self.volume_table.extents[clip_indices]
+        if hitbox_rows is None:
+            return np.max(extents[:, self.hurtbox_bones] + self.hurtbox_radii, axis=1)
+        bone_extents = np.take_along_axis(extents, self.hitbox_bones[hitbox_rows], axis=1)
+        return np.max(np.where(0.0 <= self.hitbox_radii[hitbox_rows], bone_extents + self.hitbox_radii[hitbox_rows], 0.0), axis=1)
+
+    def get_hits(self, fighters, state_keys):
+        # (defender, attacker, hitbox row) of every fighter hit this frame, the lowest attacker index wins a defender,
+        # fighters of the same team do not hit each other
+        count = fighters.count
+        no_hits = (np.zeros(0, dtype=np.intp), ) * 3
+        attackers, hitbox_rows = self.get_attackers(fighters.state_managers, state_keys)
+        if 0 == len(attackers):
+            return no_hits
+
+        positions = fighters.positions[:count]
+        scales = fighters.scales[:count]
+        clip_indices, times, is_animated = self.get_animations(fighters.actors)
+
+        # broad phase on the fighter roots in the horizontal plane, no volume gets further from its root than the reach
+        hurt_reaches = self.get_reaches(clip_indices) * scales
+        hit_reaches = self.get_reaches(clip_indices[attackers], hitbox_rows) * scales[attackers]
+        pair_attackers, pair_defenders = get_sweep_pairs(positions, attackers, float(hit_reaches.max() + hurt_reaches[is_animated].max(initial=0.0)))
+        attacker_indices = attackers[pair_attackers]
+        offsets = positions[pair_defenders] - positions[attacker_indices]
+        distances = np.square(offsets[:, 0]) + np.square(offsets[:, 2])
+        candidates = (fighters.teams[pair_defenders] != fighters.teams[attacker_indices]) & hurtable_table[state_keys[pair_defenders]] & is_animated[pair_defenders] & \
+            (distances <= np.square(hit_reaches[pair_attackers] + hurt_reaches[pair_defenders]))
+        pair_attackers = pair_attackers[candidates]
+        pair_defenders = pair_defenders[candidates]
+        if 0 == len(pair_defenders):
+            return no_hits
+
+        # volumes of the fighters in the candidate pairs only
+        involved = np.unique(np.concatenate([attackers, pair_defenders]))
+        world_positions = get_world_positions(self.volume_table.get_positions(clip_indices[involved], times[involved]),
+                                              positions[involved], fighters.yaws[involved], scales[involved])
+        attacker_indices = attackers[pair_attackers]
+        attacker_rows = np.searchsorted(involved, attacker_indices)
+        defender_rows = np.searchsorted(involved, pair_defenders)
+        pair_hitbox_rows = hitbox_rows[pair_attackers]
+
+        # every hitbox of the attacker against every hurtbox of the defender, (pair, hitbox, hurtbox)
+        hit_centers = world_positions[attacker_rows[:, np.newaxis], self.hitbox_bones[pair_hitbox_rows]]
+        hurt_centers = world_positions[defender_rows[:, np.newaxis], self.hurtbox_bones[np.newaxis, :]]
+        distances = np.sum(np.square(hit_centers[:, :, np.newaxis, :] - hurt_centers[:, np.newaxis, :, :]), axis=-1)
+        hit_radii = self.hitbox_radii[pair_hitbox_rows] * scales[attacker_indices][:, np.newaxis]
+        hurt_radii = self.hurtbox_radii[np.newaxis, :] * scales[pair_defenders][:, np.newaxis]
+        radii = hit_radii[:, :, np.newaxis] + hurt_radii[:, np.newaxis, :]
+        overlaps = np.any((0.0 <= hit_radii[:, :, np.newaxis]) & (distances <= np.square(radii)), axis=(1, 2))
+
+        # pairs are in attacker order, the first pair of a defender is its lowest attacker
+        hit_pairs = np.flatnonzero(overlaps)
+        defenders, first_pairs = np.unique(pair_defenders[hit_pairs], return_index=True)
+        hit_pairs = hit_pairs[first_pairs]
+        return defenders, attacker_indices[hit_pairs], pair_hitbox_rows[hit_pairs]
+
+    def update(self, delta, fighters, animation_meshes):
+        if fighters.count < 2:
+            return 0
+
+        state_keys = get_state_keys(fighters.state_managers)
+        defenders, attackers, hitbox_rows = self.get_hits(fighters, state_keys)
+        if 0 == len(defenders):
+            return 0
+
+        # the defender turns to the attacker, a knockdown falls away from it
+        directions = fighters.positions[attackers] - fighters.positions[defenders]
+        fighters.yaws[defenders] = np.arctan2(directions[:, 0], directions[:, 2])
+        for defender, knockdown in zip(defenders, self.knockdowns[hitbox_rows]):
+            state_manager = fighters.state_managers[defender]
+            state_manager.state_info.set_info(delta, fighters.actors[defender], animation_meshes, bool(fighters.on_grounds[defender]), int(fighters.key_flags[defender]))
+            state_manager.set_state(hit_states[int(knockdown)], state_manager.state_info)
+        self.hit_count += len(defenders)
+        return len(defenders)
@@ -0,0 +1,135 @@
+import numpy as np
+
+from GameClient.GameState import *
+from GameClient.Profiler import *
+
+
+GRAVITY = 20.0
+JUMP_SPEED = 10.0
+MOVE_SPEED = 6.0
+
+KEY_FLAG_NONE = 0
+KEY_FLAG_W = 1 << 0
+KEY_FLAG_S = 1 << 1
+KEY_FLAG_A = 1 << 2
+KEY_FLAG_D = 1 << 3
+
+key_map = dict()
+key_map[KEY_FLAG_W] = -1.57079
+key_map[KEY_FLAG_S] = 1.57079
+key_map[KEY_FLAG_A] = 0.0
+key_map[KEY_FLAG_D] = 3.141592
+key_map[KEY_FLAG_W | KEY_FLAG_A] = -0.785395
+key_map[KEY_FLAG_W | KEY_FLAG_D] = 3.926987
+key_map[KEY_FLAG_S | KEY_FLAG_A] = 0.785395
+key_map[KEY_FLAG_S | KEY_FLAG_D] = 2.356191
+
+# key_map as a table indexed by press_keys
+yaw_table = np.zeros(KEY_FLAG_D << 1, dtype=np.float32)
+for press_keys, yaw in key_map.items():
+    yaw_table[press_keys] = yaw
+
+
+# structure of arrays storage for every fighter on the stage, the player is just one of the rows
+class FighterContainer:
+    def __init__(self, capacity=16):
+        self.count = 0
+        self.actors = []
+        self.state_managers = []
+        self.positions = np.zeros((capacity, 3), dtype=np.float32)
+        self.velocities = np.zeros((capacity, 3), dtype=np.float32)
+        self.yaws = np.zeros(capacity, dtype=np.float32)
+        self.scales = np.ones(capacity, dtype=np.float32)
+        self.teams = np.zeros(capacity, dtype=np.int32)
+        self.on_grounds = np.zeros(capacity, dtype=np.bool_)
+        self.press_keys = np.zeros(capacity, dtype=np.int32)
+        self.key_flags = np.zeros(capacity, dtype=np.int32)
+        # key flags of the frame before, a button not held then is a press
+        self.last_key_flags = np.zeros(capacity, dtype=np.int32)
+
+    def get_capacity(self):
+        return len(self.positions)
+
+    def reserve(self, capacity):
+        if capacity <= self.get_capacity():
+            return
+
+        for key in ('positions', 'velocities', 'yaws', 'scales', 'teams', 'on_grounds', 'press_keys', 'key_flags', 'last_key_flags'):
+            old_array = getattr(self, key)
+            new_array = np.zeros((capacity, ) + old_array.shape[1:], dtype=old_array.dtype)
+            new_array[:self.count] = old_array[:self.count]
+            setattr(self, key, new_array)
+
+    def add_fighter(self, actor, pos, yaw=0.0, state_manager=None, scale=1.0, team=0):
+        if self.get_capacity() <= self.count:
+            self.reserve(max(16, self.get_capacity() * 2))
+
+        index = self.count
+        self.count += 1
+        self.actors.append(actor)
+        self.state_managers.append(state_manager or GameStateManager())
+        self.positions[index] = pos
+        self.velocities[index] = 0.0
+        self.yaws[index] = yaw
+        self.scales[index] = scale
+        self.teams[index] = team
+        self.on_grounds[index] = False
+        self.press_keys[index] = KEY_FLAG_NONE
+        self.key_flags[index] = KEY_FLAG.NONE
+        self.last_key_flags[index] = KEY_FLAG.NONE
+        return index
+
+    def set_input(self, index, press_keys, key_flag):
+        self.press_keys[index] = press_keys
+        self.key_flags[index] = key_flag
+
+    def update(self, delta, collision_grid, animation_meshes, vectorized_collision=True, combat=None):
+        count = self.count
+        if 0 == count:
+            return
+
+        positions = self.positions[:count]
+        velocities = self.velocities[:count]
+        yaws = self.yaws[:count]
+        on_grounds = self.on_grounds[:count]
+        press_keys = self.press_keys[:count]
+        key_flags = self.key_flags[:count]
+        last_key_flags = self.last_key_flags[:count]
+
+        with profiler.scope('movement'):
+            state_keys = get_state_keys(self.state_managers)
+
+            move = (key_flags & KEY_FLAG.MOVE) != 0
+            rotate = move & enable_rotation_table[state_keys]
+            yaws[rotate] = yaw_table[press_keys[rotate]]
+
+            # on ground, jump and walk along the facing direction
+            jump = on_grounds & ((key_flags & KEY_FLAG.JUMP) != 0) & enable_jump_table[state_keys]
+            velocities[jump, 1] = JUMP_SPEED
+            walk = on_grounds & move & enable_move_table[state_keys]
+            velocities[walk, 0] = np.sin(yaws[walk]) * MOVE_SPEED
+            velocities[walk, 2] = np.cos(yaws[walk]) * MOVE_SPEED
+            stop = on_grounds & np.logical_not(walk)
+            velocities[stop, 0] = 0.0
+            velocities[stop, 2] = 0.0
+
+            velocities[:, 1] -= GRAVITY * delta
+
+        with profiler.scope('collision'):
+            old_positions = positions.copy()
+            move_vectors = velocities * delta
+            positions += move_vectors
+
+            on_grounds[...] = collision_grid.collide_batch(old_positions, positions, move_vectors, vectorized_collision)
+            velocities[on_grounds, 1] = 0.0
+
+        with profiler.scope('state'):
+            update_states(delta, self.state_managers, self.actors, animation_meshes, on_grounds, key_flags, key_flags & ~last_key_flags, state_keys)
+            last_key_flags[...] = key_flags
+        if combat is not None:
+            with profiler.scope('combat'):
+                combat.update(delta, self, animation_meshes)
+        with profiler.scope('transform'):
+            for index, actor in enumerate(self.actors):
+                actor.transform.set_yaw(yaws[index])
+                actor.transform.set_pos(positions[index])
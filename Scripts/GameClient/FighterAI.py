@@ -0,0 +1,249 @@
+import math
+import time
+from collections import deque
+
+import numpy as np
+
+from GameClient.GameState import *
+from GameClient.Fighter import *
+from GameClient.NavGrid import NAV_PATH_PENDING
+
+
+# main thread time per frame spent on target selection and pathing
+AI_TIME_BUDGET = 0.002
+# decisions and path queries per frame without a time budget, the headless runs have to give the same inputs on every machine
+AI_MAX_DECISIONS = 8
+# cells a path search goes through per frame without a time budget
+AI_MAX_PATH_CELLS = 256
+# a fighter decides again once this much time passed since its last decision and the budget allows it
+AI_DECISION_INTERVAL = 0.5
+AI_SIGHT_RANGE = 30.0
+# in model units, scaled with the fighter like the hitboxes
+AI_ATTACK_RANGE = 3.0
+AI_FACING_ANGLE = 0.785395
+AI_WAYPOINT_RADIUS = 0.5
+AI_ATTACK_COOLDOWN = (0.4, 1.2)
+AI_KICK_CHANCE = 0.3
+
+TEAM_PLAYER = 0
+TEAM_ENEMY = 1
+
+# the directions of key_map, a steering direction snaps to the nearest one
+direction_press_keys = np.array(list(key_map.keys()), dtype=np.int32)
+direction_yaws = np.array(list(key_map.values()), dtype=np.float32)
+
+
+def get_yaw_differences(yaws, other_yaws):
+    return (yaws - other_yaws + math.pi) % (2.0 * math.pi) - math.pi
+
+
+def get_direction_press_keys(yaws):
+    return direction_press_keys[np.argmin(np.abs(get_yaw_differences(yaws[:, np.newaxis], direction_yaws[np.newaxis, :])), axis=1)]
+
+
+# press_keys and key_flag of the fighters nobody plays, the same input update_player reads from the keyboard.
+# Target selection and path queries run for a few fighters per frame within one time budget, the
+# steering to the decided goal and the attacks run for every fighter every frame.
+class FighterAI:
+    def __init__(self, find_path=None, time_budget=AI_TIME_BUDGET, max_decisions=AI_MAX_DECISIONS, decision_interval=AI_DECISION_INTERVAL, seed=0, capacity=16,
+                 max_path_cells=AI_MAX_PATH_CELLS):
+        # called with (start, goal, deadline, max_cells), returns the waypoints after start, None to walk straight at
+        # the goal or NAV_PATH_PENDING to be asked again next frame, see NavGrid.find_path
+        self.find_path = find_path
+        self.time_budget = time_budget
+        self.max_decisions = max_decisions
+        self.max_path_cells = max_path_cells
+        self.decision_interval = decision_interval
+        self.random = np.random.RandomState(seed)
+        self.elapsed_time = 0.0
+        self.count = 0
+        self.fighter_indices = np.zeros(capacity, dtype=np.intp)
+        self.targets = np.zeros(capacity, dtype=np.intp)
+        self.decision_times = np.zeros(capacity, dtype=np.float64)
+        self.attack_cooldowns = np.zeros(capacity, dtype=np.float32)
+        self.waypoints = np.zeros((capacity, 3), dtype=np.float32)
+        self.has_waypoints = np.zeros(capacity, dtype=np.bool_)
+        self.path_pendings = np.zeros(capacity, dtype=np.bool_)
+        self.paths = []
+        self.path_indices = []
+        # agents in the order they decide, the one which waited longest first
+        self.decision_queue = deque()
+        # agents waiting for a path in the order they asked
+        self.path_queue = deque()
+        self.decision_count = 0
+
+    def get_capacity(self):
+        return len(self.fighter_indices)
+
+    def reserve(self, capacity):
+        if capacity <= self.get_capacity():
+            return
+
+        for key in ('fighter_indices', 'targets', 'decision_times', 'attack_cooldowns', 'waypoints', 'has_waypoints', 'path_pendings'):
+            old_array = getattr(self, key)
+            new_array = np.zeros((capacity, ) + old_array.shape[1:], dtype=old_array.dtype)
+            new_array[:self.count] = old_array[:self.count]
+            setattr(self, key, new_array)
+
+    def add_fighter(self, fighter_index):
+        if self.get_capacity() <= self.count:
+            self.reserve(max(16, self.get_capacity() * 2))
+
+        agent = self.count
+        self.count += 1
+        self.fighter_indices[agent] = fighter_index
+        self.targets[agent] = -1
+        self.decision_times[agent] = -np.inf
+        self.attack_cooldowns[agent] = 0.0
+        self.has_waypoints[agent] = False
+        self.path_pendings[agent] = False
+        self.paths.append(None)
+        self.path_indices.append(0)
+        self.decision_queue.append(agent)
+        return agent
+
+    def get_decision_latency(self):
+        # how long the agent which waits longest has waited for its next decision
+        if 0 == self.count:
+            return 0.0
+        return self.elapsed_time - float(np.min(self.decision_times[:self.count]))
+
+    def set_path(self, agent, path):
+        self.paths[agent] = path
+        self.path_indices[agent] = 0
+        self.has_waypoints[agent] = bool(path)
+        if path:
+            self.waypoints[agent] = path[0]
+
+    def decide(self, agent, fighters):
+        # the nearest fighter of another team in sight, the way to it is queried later
+        index = self.fighter_indices[agent]
+        count = fighters.count
+        positions = fighters.positions[:count]
+        offsets = positions - positions[index]
+        distances = np.einsum('ij,ij->i', offsets, offsets)
+        candidates = (fighters.teams[:count] != fighters.teams[index]) & (distances <= AI_SIGHT_RANGE * AI_SIGHT_RANGE)
+        target = int(np.argmin(np.where(candidates, distances, np.inf))) if np.any(candidates) else -1
+        self.targets[agent] = target
+        self.set_path(agent, None)
+        if 0 <= target and self.find_path is not None and not self.path_pendings[agent]:
+            self.path_pendings[agent] = True
+            self.path_queue.append(agent)
+        self.decision_times[agent] = self.elapsed_time
+
+    def is_over_budget(self, deadline, count):
+        if deadline is None:
+            return self.max_decisions <= count
+        return deadline <= time.perf_counter()
+
+    def update_paths(self, fighters, deadline):
+        # the budget is looked at before every query and the query itself stops at the deadline,
+        # an agent whose path is still searched stays at the front for the next frame
+        query_count = 0
+        while self.path_queue and not self.is_over_budget(deadline, query_count):
+            agent = self.path_queue[0]
+            target = self.targets[agent]
+            if 0 <= target:
+                index = self.fighter_indices[agent]
+                path = self.find_path(fighters.positions[index], fighters.positions[target], deadline, self.max_path_cells if deadline is None else None)
+                if path is NAV_PATH_PENDING:
+                    break
+                self.set_path(agent, path)
+            self.path_queue.popleft()
+            self.path_pendings[agent] = False
+            query_count += 1
+
+    def update_decisions(self, fighters, deadline):
+        decision_count = 0
+        # every agent decides once per frame at most
+        while decision_count < self.count and not self.is_over_budget(deadline, decision_count):
+            agent = self.decision_queue[0]
+            if self.elapsed_time - self.decision_times[agent] < self.decision_interval:
+                break
+
+            self.decision_queue.rotate(-1)
+            self.decide(agent, fighters)
+            decision_count += 1
+        self.decision_count += decision_count
+        return decision_count
+
+    def update_waypoints(self, positions):
+        # the next waypoint of every agent which reached its current one
+        offsets = self.waypoints[:self.count] - positions
+        reached = self.has_waypoints[:self.count] & (np.square(offsets[:, 0]) + np.square(offsets[:, 2]) <= AI_WAYPOINT_RADIUS * AI_WAYPOINT_RADIUS)
+        for agent in np.flatnonzero(reached):
+            path = self.paths[agent]
+            self.path_indices[agent] += 1
+            if self.path_indices[agent] < len(path):
+                self.waypoints[agent] = path[self.path_indices[agent]]
+            else:
+                self.has_waypoints[agent] = False
+
+    def update_inputs(self, delta, fighters):
+        # walk to the waypoint, or the target itself, turn to the target in range and attack it when the cooldown is over
+        count = self.count
+        indices = self.fighter_indices[:count]
+        targets = self.targets[:count]
+        has_targets = 0 <= targets
+        positions = fighters.positions[indices]
+        self.update_waypoints(positions)
+
+        target_offsets = fighters.positions[np.maximum(targets, 0)] - positions
+        goals = np.where(self.has_waypoints[:count, np.newaxis], self.waypoints[:count] - positions, target_offsets)
+        goal_yaws = np.arctan2(goals[:, 0], goals[:, 2])
+        target_yaws = np.arctan2(target_offsets[:, 0], target_offsets[:, 2])
+        target_distances = np.square(target_offsets[:, 0]) + np.square(target_offsets[:, 2])
+        attack_ranges = AI_ATTACK_RANGE * fighters.scales[indices]
+        in_range = has_targets & np.logical_not(self.has_waypoints[:count]) & (target_distances <= np.square(attack_ranges))
+        facing = np.abs(get_yaw_differences(target_yaws, fighters.yaws[indices])) <= AI_FACING_ANGLE
+
+        # a step towards the target turns a fighter in range to it
+        move = has_targets & np.logical_not(in_range & facing)
+        press_keys = np.where(move, get_direction_press_keys(np.where(in_range, target_yaws, goal_yaws)), KEY_FLAG_NONE)
+        key_flags = np.where(move, KEY_FLAG.MOVE, KEY_FLAG.NONE)
+
+        cooldowns = self.attack_cooldowns[:count]
+        cooldowns -= delta
+        attack = in_range & facing & (cooldowns <= 0.0)
+        kick = attack & (self.random.uniform(size=count) < AI_KICK_CHANCE)
+        key_flags |= np.where(kick, KEY_FLAG.KICK, np.where(attack, KEY_FLAG.PUNCH, KEY_FLAG.NONE))
+        cooldowns[attack] = self.random.uniform(AI_ATTACK_COOLDOWN[0], AI_ATTACK_COOLDOWN[1], int(np.count_nonzero(attack)))
+
+        fighters.press_keys[indices] = press_keys
+        fighters.key_flags[indices] = key_flags
+
+    def update(self, delta, fighters):
+        self.elapsed_time += delta
+        if 0 == self.count:
+            return
+        # the paths asked for on earlier frames first, decisions get what is left of the budget
+        deadline = None if self.time_budget is None else time.perf_counter() + self.time_budget
+        self.update_paths(fighters, deadline)
+        self.update_decisions(fighters, deadline)
+        self.update_inputs(delta, fighters)
+
+    def get_state(self):
+        # everything the inputs of a later frame depend on, for the rollback snapshots. The paths are never
+        # changed in place, the lists are copied but not the waypoints in them.
+        count = self.count
+        return (self.elapsed_time, self.random.get_state(),
+                self.targets[:count].copy(), self.decision_times[:count].copy(), self.attack_cooldowns[:count].copy(),
+                self.waypoints[:count].copy(), self.has_waypoints[:count].copy(), self.path_pendings[:count].copy(),
+                list(self.paths), list(self.path_indices), list(self.decision_queue), list(self.path_queue))
+
+    def set_state(self, state):
+        # the agents are the same as when the state was taken
+        count = self.count
+        (self.elapsed_time, random_state, targets, decision_times, attack_cooldowns, waypoints, has_waypoints, path_pendings,
+         paths, path_indices, decision_queue, path_queue) = state
+        self.random.set_state(random_state)
+        self.targets[:count] = targets
+        self.decision_times[:count] = decision_times
+        self.attack_cooldowns[:count] = attack_cooldowns
+        self.waypoints[:count] = waypoints
+        self.has_waypoints[:count] = has_waypoints
+        self.path_pendings[:count] = path_pendings
+        self.paths = list(paths)
+        self.path_indices = list(path_indices)
+        self.decision_queue = deque(decision_queue)
+        self.path_queue = deque(path_queue)
@@ -1,33 +1,29 @@
-import sys
+import os
+from functools import partial
+
 import numpy as np
 
-from PyEngine3D.App.GameBackend import Keyboard
 from PyEngine3D.Common import logger
 from PyEngine3D.Utilities import Singleton, StateMachine, StateItem, Float3
 from GameClient.GameState import *
-
-
-GRAVITY = 20.0
-JUMP_SPEED = 10.0
-MOVE_SPEED = 6.0
-BOUND_BOX_OFFSET = 0.1
-EPSILON = sys.float_info.epsilon
-
-KEY_FLAG_NONE = 0
-KEY_FLAG_W = 1 << 0
-KEY_FLAG_S = 1 << 1
-KEY_FLAG_A = 1 << 2
-KEY_FLAG_D = 1 << 3
-
-key_map = dict()
-key_map[KEY_FLAG_W] = -1.57079
-key_map[KEY_FLAG_S] = 1.57079
-key_map[KEY_FLAG_A] = 0.0
-key_map[KEY_FLAG_D] = 3.141592
-key_map[KEY_FLAG_W | KEY_FLAG_A] = -0.785395
-key_map[KEY_FLAG_W | KEY_FLAG_D] = 3.926987
-key_map[KEY_FLAG_S | KEY_FLAG_A] = 0.785395
-key_map[KEY_FLAG_S | KEY_FLAG_D] = 2.356191
+from GameClient.Collision import *
+from GameClient.Fighter import *
+from GameClient.Input import *
+from GameClient.AnimationLibrary import *
+from GameClient.AssetStreamer import *
+from GameClient.SceneFormat import *
+from GameClient.InstanceStore import *
+from GameClient.CollisionFormat import *
+from GameClient.AnimationBlender import *
+from GameClient.Combat import *
+from GameClient.FighterAI import *
+from GameClient.NavGrid import *
+from GameClient.Profiler import *
+
+
+# the corridor of the stage down from the spawn
+ENEMY_SPAWN_MIN = (-0.8, -1.99, -40.0)
+ENEMY_SPAWN_MAX = (2.8, -1.99, -16.0)
 
 
 class GameClient(Singleton):
@@ -38,11 +34,45 @@ class GameClient(Singleton):
         self.scene_manager = None
         self.player = None
         self.enemy = None
+        self.enemies = []
+        self.enemy_count = 1
+        self.fighter_ai = None
+        self.input = None
+        self.player_index = 0
         self.key_flag = KEY_FLAG.NONE
-        self.on_ground = False
-        self.velocity = Float3(0.0, 0.0, 0.0)
+        self.fighters = FighterContainer()
+        self.collision_grid = None
+        self.nav_grid = None
+        self.validate_collision = False
+        self.vectorized_collision = True
+        self.combat = None
+        self.animation_library = None
+        self.animation_memory_budget = ANIMATION_MEMORY_BUDGET
         self.animation_meshes = {}
+        self.bone_palettes = None
+        # opt in, the fighters are skinned from the pose tables and the player's clips are crossfaded by an
+        # AnimationBlender instead of the engine sampling the keyframes of every actor
+        self.use_bone_palettes = False
+        # called with (actor, palette) for every fighter, the palette is shared by every fighter in the same pose
+        self.upload_bone_palette = None
+        self.asset_streamer = None
+        # the stage resources decoded on the streamer's workers and installed before the scene opens
+        self.streamed_resource_exts = (TEXTURE_EXT, MESH_EXT, MATERIAL_INSTANCE_EXT)
+        self.create_resource = create_engine_resource
+        self.loading_progress_callback = None
+        self.is_loading = False
         self.state_manager = GameStateManager()
+        self.project_path = PROJECT_PATH
+        # built and culled only with an instance_store.upload_instances hook, nothing draws from it otherwise
+        self.instance_store = InstanceStore()
+
+    @property
+    def velocity(self):
+        return self.fighters.velocities[self.player_index]
+
+    @property
+    def on_ground(self):
+        return bool(self.fighters.on_grounds[self.player_index])
 
     def initialize(self, core_manager):
         logger.info("GameClient::initialize")
@@ -52,144 +82,207 @@ class GameClient(Singleton):
         self.resource_manager = core_manager.resource_manager
         self.scene_manager = core_manager.scene_manager
 
+        if self.input is None:
+            self.input = BackendInput(self.game_backend)
+
+        if self.animation_library is None:
+            self.animation_library = AnimationLibrary(get_mesh=self.resource_manager.get_mesh)
+        self.animation_meshes = AnimationCache(self.animation_library, memory_budget=self.animation_memory_budget)
+        self.bone_palettes = BonePaletteCache(self.animation_library.get_pose_table)
+        self.combat = CombatSystem(self.animation_library.get_pose_table, self.state_manager.move_set)
+        if self.fighter_ai is None:
+            self.fighter_ai = FighterAI()
+        if self.use_bone_palettes and self.upload_bone_palette is None:
+            raise ValueError("use_bone_palettes needs an upload_bone_palette hook")
+
+        # initialize returns right away, update finishes the loading within a time budget per frame
+        self.asset_streamer = AssetStreamer(progress_callback=self.loading_progress_callback)
+        self.animation_meshes.streamer = self.asset_streamer
+        project_path = self.project_path
+        self.asset_streamer.request('stage resources',
+                                    os.path.join(project_path, SCENE_PATH, 'stage' + SCENE_EXT),
+                                    self.request_stage,
+                                    decode=lambda filepath: collect_scene_resources(filepath, project_path, model_names=['player']),
+                                    required=True)
+        self.animation_meshes.prefetch(['idle'])
+        self.is_loading = True
+
+    def request_stage(self, scene_resources):
+        # textures before the material instances which use them, open_scene then finds every resource loaded
+        textures, meshes, material_instances = scene_resources
+        for resource_name, filepath in list(textures.items()) + list(meshes.items()):
+            ext = os.path.splitext(filepath)[1]
+            if ext in self.streamed_resource_exts:
+                self.asset_streamer.request(resource_name, filepath, self.get_install_resource(resource_name, ext))
+        if MATERIAL_INSTANCE_EXT in self.streamed_resource_exts:
+            for resource_name, material_instance_data in material_instances.items():
+                install = self.get_install_resource(resource_name, MATERIAL_INSTANCE_EXT)
+                self.asset_streamer.request_main_thread(resource_name, partial(install, material_instance_data), required=False)
+        self.asset_streamer.request_main_thread('stage', self.open_stage)
+        self.asset_streamer.request_main_thread('player', self.spawn_player)
+
+    def get_install_resource(self, resource_name, ext):
+        # a failed install is only logged, the engine loads that resource itself when the scene opens
+        def install(data):
+            install_resource(self.resource_manager, resource_name, ext, self.create_resource(resource_name, ext, data))
+        return install
+
+    def open_stage(self):
         self.resource_manager.open_scene('stage')
-
-        animation_list = ['avoid',
-                          'elbow',
-                          'falloff',
-                          'grab_attack',
-                          'grab_attack_hit',
-                          'grab_attack_hit_loop',
-                          'grab_attack_loop',
-                          'heading',
-                          'hit',
-                          'idle',
-                          'jump',
-                          'jump_kick',
-                          'kick',
-                          'punch',
-                          'standup',
-                          'walk',
-                          'lie_down']
-
-        for key in animation_list:
-            self.animation_meshes[key] = self.resource_manager.get_mesh("player_" + key)
-
+        # the baked bvh when it is up to date, the boxes of the collision actors otherwise
+        self.collision_grid = load_collision_bvh(self.project_path, 'stage')
+        if self.collision_grid is None:
+            logger.info("GameClient::open_stage the baked collision of stage is missing or stale")
+            self.collision_grid = CollisionGrid(collect_bound_boxes(self.scene_manager.collision_actors))
+        elif self.validate_collision:
+            for error in validate_collision(self.project_path, 'stage', collect_bound_boxes(self.scene_manager.collision_actors)):
+                logger.warn("GameClient::open_stage %s" % error)
+        # rebaked only when the collision set changed, the fighter ai shares its flow fields
+        collision_grid = self.collision_grid
+        self.nav_grid = load_nav_grid(self.project_path, 'stage', collision_grid.bound_mins, collision_grid.bound_maxs)
+        if self.nav_grid is None:
+            logger.info("GameClient::open_stage the baked nav grid of stage is missing or stale")
+            nav_data = bake_nav_grid(collision_grid.bound_mins, collision_grid.bound_maxs)
+            # kept for the next run, the .nav files are not committed
+            try:
+                save_nav_grid(get_nav_filepath(self.project_path, 'stage'), nav_data)
+            except OSError as e:
+                logger.warn("GameClient::open_stage the nav grid of stage is not saved: %s" % e)
+            self.nav_grid = create_nav_grid(nav_data)
+        self.fighter_ai.find_path = self.nav_grid.find_path
+        self.instance_store.clear()
+        if self.instance_store.upload_instances is not None:
+            self.instance_store.add_scene(load_scene(os.path.join(self.project_path, SCENE_PATH, 'stage' + SCENE_EXT)), self.project_path)
+
+    def spawn_player(self):
         main_camera = self.scene_manager.main_camera
         pos = main_camera.transform.pos - main_camera.transform.front * 5.0
         player_model = self.resource_manager.get_model("player")
         self.player = self.scene_manager.add_object(model=player_model, pos=pos)
-        # self.enemy = self.scene_manager.add_object(model=player_model, pos=pos)
         # self.player.transform.set_pos([0.0, -1.99, -11.0])
         self.player.transform.set_yaw(3.141592)
         self.player.transform.set_scale(0.45)
-        self.velocity[...] = Float3(0.0, 0.0, 0.0)
-
-        # self.enemy.transform.set_pos([0.0, -1.99, -11.0])
-        # self.enemy.transform.set_yaw(3.141592)
-        # self.enemy.transform.set_scale(0.45)
+        self.player_index = self.fighters.add_fighter(self.player, pos, yaw=3.141592, state_manager=self.state_manager, scale=0.45)
+        if self.use_bone_palettes:
+            self.state_manager.animation_blender = AnimationBlender(self.animation_library.get_clip_pose_table)
+        self.spawn_enemies(player_model, self.enemy_count)
 
         # fix camera rotation
         main_camera.transform.set_rotation((0.0, 1.57079, 0.0))
 
+    def spawn_enemies(self, player_model, enemy_count, seed=0):
+        # spread down the corridor in front of the spawn, facing the player
+        random = np.random.RandomState(seed)
+        for i in range(enemy_count):
+            pos = random.uniform(ENEMY_SPAWN_MIN, ENEMY_SPAWN_MAX).astype(np.float32)
+            enemy = self.scene_manager.add_object(model=player_model, pos=pos)
+            enemy.transform.set_yaw(3.141592)
+            enemy.transform.set_scale(0.45)
+            index = self.fighters.add_fighter(enemy, pos, yaw=3.141592, scale=0.45, team=TEAM_ENEMY)
+            self.fighter_ai.add_fighter(index)
+            self.enemies.append(enemy)
+        self.enemy = self.enemies[0] if self.enemies else None
+
     def exit(self):
         logger.info("GameClient::exit")
-        self.scene_manager.delete_object(self.player.name)
+        self.stop_recording()
+        if self.asset_streamer is not None:
+            self.asset_streamer.shutdown()
+        if self.player is not None:
+            self.scene_manager.delete_object(self.player.name)
+        for enemy in self.enemies:
+            self.scene_manager.delete_object(enemy.name)
 
     def update_player(self, delta):
-        keydown = self.game_backend.get_keyboard_pressed()
-        mouse_delta = self.game_backend.mouse_delta
-        btn_left, btn_middle, btn_right = self.game_backend.get_mouse_pressed()
         camera = self.scene_manager.main_camera
 
-        press_keys = 0
-
-        if keydown[Keyboard.W]:
-            press_keys |= KEY_FLAG_W
-        elif keydown[Keyboard.S]:
-            press_keys |= KEY_FLAG_S
-
-        if keydown[Keyboard.A]:
-            press_keys |= KEY_FLAG_A
-        elif keydown[Keyboard.D]:
-            press_keys |= KEY_FLAG_D
-
-        self.key_flag = KEY_FLAG.NONE
-
-        if press_keys in key_map:
-            self.key_flag |= KEY_FLAG.MOVE
-
-        if keydown[Keyboard.SPACE]:
-            self.key_flag |= KEY_FLAG.JUMP
-
-        if btn_left:
-            self.key_flag |= KEY_FLAG.PUNCH
-
-        if btn_right:
-            self.key_flag |= KEY_FLAG.KICK
-
-        state = self.state_manager.get_state()
-
-        if (self.key_flag & KEY_FLAG.MOVE) and state.enable_rotation:
-            self.player.transform.set_yaw(key_map[press_keys])
-
-        if self.on_ground:
-            if (self.key_flag & KEY_FLAG.JUMP) and state.enable_jump:
-                self.on_ground = False
-                self.velocity[1] = JUMP_SPEED
-
-            if (self.key_flag & KEY_FLAG.MOVE) and state.enable_move:
-                self.velocity[0] = self.player.transform.front[0] * MOVE_SPEED
-                self.velocity[2] = self.player.transform.front[2] * MOVE_SPEED
+        with profiler.scope('input'):
+            press_keys, self.key_flag = self.input.get_input(delta)
+            self.fighters.set_input(self.player_index, press_keys, self.key_flag)
+
+        if self.fighter_ai is not None:
+            with profiler.scope('ai'):
+                self.fighter_ai.update(delta, self.fighters)
+
+        self.fighters.update(delta, self.collision_grid, self.animation_meshes, self.vectorized_collision, self.combat)
+
+        with profiler.scope('camera'):
+            player_pos = self.fighters.positions[self.player_index]
+            camera.transform.set_pos(player_pos)
+            camera.transform.move_up(5.0)
+            camera.transform.move_front(10.0)
+
+    def start_recording(self, filepath):
+        self.stop_recording()
+        self.input = InputRecorder(self.input, filepath)
+
+    def stop_recording(self):
+        if isinstance(self.input, InputRecorder):
+            self.input.close()
+            self.input = self.input.input_source
+
+    def update_animations(self):
+        state_keys = set(state_manager.get_state_key() for state_manager in self.fighters.state_managers)
+        current_animations = set()
+        reachable_animations = set()
+        for state_key in state_keys:
+            current_animations.update(self.state_manager.state_map[state_key].animations)
+            reachable_animations.update(self.state_manager.get_reachable_animations(state_key))
+        self.animation_meshes.pin(current_animations)
+        self.animation_meshes.prefetch(reachable_animations)
+
+    @staticmethod
+    def get_actor_animation(actor):
+        # clip mesh name and clip time of the actor, None while nothing plays
+        if actor.animation is None:
+            return None
+        return actor.animation.name, actor.animation_time
+
+    def update_bone_palettes(self, delta):
+        # blending fighters get their own palette, the others share one per pose
+        self.bone_palettes.clear()
+        actors = []
+        clip_names = []
+        times = []
+        for actor, state_manager in zip(self.fighters.actors, self.fighters.state_managers):
+            animation_blender = state_manager.animation_blender
+            if animation_blender is not None and animation_blender.is_playing():
+                animation_blender.update(delta)
+                if animation_blender.is_blending() or animation_blender.has_layer():
+                    self.upload_bone_palette(actor, animation_blender.get_palette())
+                    continue
+                animation = (self.animation_library.get_clip_mesh_name(animation_blender.clip.clip_name), animation_blender.clip.time)
             else:
-                self.velocity[0] = 0.0
-                self.velocity[2] = 0.0
-
-        self.velocity[1] -= GRAVITY * delta
-
-        old_player_pos = self.player.transform.get_pos().copy()
-        move_vector = self.velocity * delta
-        player_pos = old_player_pos + move_vector
-
-        self.on_ground = False
-
-        def compute_collide(i, old_position, position, move_vector, bound_box):
-            j = (i + 1) % 3
-            k = (i + 2) % 3
-
-            def is_in_plane(index, ratio):
-                if index == 1:
-                    return bound_box.bound_min[index] < (old_position[index] + move_vector[index] * ratio + BOUND_BOX_OFFSET) < bound_box.bound_max[index]
-                else:
-                    return bound_box.bound_min[index] < (old_position[index] + move_vector[index] * ratio) < bound_box.bound_max[index]
-
-            if move_vector[i] < 0.0 and position[i] <= bound_box.bound_max[i] <= old_position[i]:
-                ratio = abs((bound_box.bound_max[i] - old_position[i]) / move_vector[i])
-                if is_in_plane(j, ratio) and is_in_plane(k, ratio):
-                    position[i] = bound_box.bound_max[i] + EPSILON
-                    move_vector[i] = position[i] - old_position[i]
-                    if 1 == i:
-                        self.on_ground = True
-            elif 0.0 < move_vector[i] and old_position[i] <= bound_box.bound_min[i] <= position[i]:
-                ratio = abs((bound_box.bound_min[i] - old_position[i]) / move_vector[i])
-                if is_in_plane(j, ratio) and is_in_plane(k, ratio):
-                    position[i] = bound_box.bound_min[i] - EPSILON
-                    move_vector[i] = position[i] - old_position[i]
-
-        for collision_actor in self.scene_manager.collision_actors:
-            for geometry_bound_box in collision_actor.get_geometry_bound_boxes():
-                for i in range(3):
-                    compute_collide(i, old_player_pos, player_pos, move_vector, geometry_bound_box)
-
-        if self.on_ground:
-            self.velocity[1] = 0.0
-
-        self.state_manager.update_state(delta, self.player, self.animation_meshes, self.on_ground, self.key_flag)
-
-        self.player.transform.set_pos(player_pos)
-        camera.transform.set_pos(player_pos)
-        camera.transform.move_up(5.0)
-        camera.transform.move_front(10.0)
+                animation = self.get_actor_animation(actor)
+            if animation is not None:
+                actors.append(actor)
+                clip_names.append(animation[0])
+                times.append(animation[1])
+        for actor, palette in zip(actors, self.bone_palettes.get_palettes(clip_names, times)):
+            self.upload_bone_palette(actor, palette)
+
+    def update_loading(self, time_budget=STREAMING_TIME_BUDGET):
+        self.is_loading = not self.asset_streamer.update(time_budget)
+        return self.is_loading
+
+    def wait_loading(self):
+        self.asset_streamer.wait()
+        self.is_loading = False
 
     def update(self, delta):
+        if self.is_loading:
+            with profiler.scope('loading'):
+                if self.update_loading():
+                    return
+
+        delta = self.input.get_delta(delta)
         self.update_player(delta)
+        if 0 < self.instance_store.instance_count:
+            with profiler.scope('instances'):
+                self.instance_store.update(self.scene_manager.main_camera.view_projection)
+        with profiler.scope('animations'):
+            self.update_animations()
+            if self.use_bone_palettes:
+                self.update_bone_palettes(delta)
+        with profiler.scope('streaming'):
+            self.asset_streamer.update()
@@ -1,6 +1,9 @@
 from enum import Enum
 
+import numpy as np
+
 from PyEngine3D.Utilities import StateMachine, StateItem
+from GameClient.Moves import *
 
 
 class KEY_FLAG:
@@ -9,6 +12,7 @@ class KEY_FLAG:
     JUMP = 1 << 1
     PUNCH = 1 << 2
     KICK = 1 << 3
+    MASK = (1 << 4) - 1
 
 
 class STATES:
@@ -19,6 +23,11 @@ class STATES:
     JUMP_KICK = 4
     PUNCH = 5
     KICK = 6
+    HIT = 7
+    FALLOFF = 8
+    LIE_DOWN = 9
+    STANDUP = 10
+    COUNT = 11
 
 
 class StateInfo:
@@ -38,17 +47,58 @@ class StateInfo:
         self.key_flag = key_flag
 
 
+# transition conditions, called with (on_ground, key_flag, is_animation_end, is_canceled) when the table is compiled
+def always(on_ground, key_flag, is_animation_end, is_canceled):
+    return True
+
+
+def in_air(on_ground, key_flag, is_animation_end, is_canceled):
+    return not on_ground
+
+
+def landed(on_ground, key_flag, is_animation_end, is_canceled):
+    return on_ground
+
+
+def animation_ended(on_ground, key_flag, is_animation_end, is_canceled):
+    return is_animation_end
+
+
+# the button of the move was pressed again inside the cancel window of the current step, see StateAttack.is_cancelable
+def canceled(on_ground, key_flag, is_animation_end, is_canceled):
+    return is_canceled
+
+
+def pressed(flag):
+    return lambda on_ground, key_flag, is_animation_end, is_canceled: 0 != (key_flag & flag)
+
+
+def released(flag):
+    return lambda on_ground, key_flag, is_animation_end, is_canceled: 0 == (key_flag & flag)
+
+
 class StateBase(StateItem):
     enable_rotation = False
     enable_jump = False
     enable_move = False
     enable_punch = False
     enable_kick = False
+    # a hit switches the fighter to a hit reaction, see Combat
+    hurtable = True
+    # clips played by the state, used to prefetch animations
+    animations = ()
+    # (condition, next state) in priority order, the first condition which holds switches the state,
+    # a rule to the state itself enters it again
+    transition_rules = ()
+
+    def set_animation(self, state_info, animation_name, **kargs):
+        state_info.player.set_animation(state_info.animation_meshes[animation_name], **kargs)
+        if self.state_manager.animation_blender is not None:
+            self.state_manager.animation_blender.play(animation_name, **kargs)
 
 
 class StateNone(StateBase):
-    def on_update(self, state_info=None):
-        self.state_manager.set_state(STATES.IDLE, state_info)
+    transition_rules = ((always, STATES.IDLE), )
 
 
 class StateIdle(StateBase):
@@ -58,19 +108,15 @@ class StateIdle(StateBase):
     enable_punch = True
     enable_kick = True
 
+    animations = ('idle', )
+    transition_rules = ((in_air, STATES.JUMP),
+                        (pressed(KEY_FLAG.MOVE), STATES.MOVE),
+                        (pressed(KEY_FLAG.PUNCH), STATES.PUNCH),
+                        (pressed(KEY_FLAG.KICK), STATES.KICK))
+
     def on_enter(self, state_info=None):
         if state_info is not None:
-            state_info.player.set_animation(state_info.animation_meshes['idle'], loop=True, speed=0.3, blend_time=0.1)
-
-    def on_update(self, state_info=None):
-        if not state_info.on_ground:
-            self.state_manager.set_state(STATES.JUMP, state_info)
-        elif state_info.key_flag & KEY_FLAG.MOVE:
-            self.state_manager.set_state(STATES.MOVE, state_info)
-        elif state_info.key_flag & KEY_FLAG.PUNCH:
-            self.state_manager.set_state(STATES.PUNCH, state_info)
-        elif state_info.key_flag & KEY_FLAG.KICK:
-            self.state_manager.set_state(STATES.KICK, state_info)
+            self.set_animation(state_info, 'idle', loop=True, speed=0.3, blend_time=0.1)
 
 
 class StateMove(StateBase):
@@ -80,19 +126,15 @@ class StateMove(StateBase):
     enable_punch = True
     enable_kick = True
 
+    animations = ('walk', )
+    transition_rules = ((in_air, STATES.JUMP),
+                        (released(KEY_FLAG.MOVE), STATES.IDLE),
+                        (pressed(KEY_FLAG.PUNCH), STATES.PUNCH),
+                        (pressed(KEY_FLAG.KICK), STATES.KICK))
+
     def on_enter(self, state_info=None):
         if state_info is not None:
-            state_info.player.set_animation(state_info.animation_meshes['walk'], loop=True, blend_time=0.1)
-
-    def on_update(self, state_info=None):
-        if not state_info.on_ground:
-            self.state_manager.set_state(STATES.JUMP, state_info)
-        elif not (state_info.key_flag & KEY_FLAG.MOVE):
-            self.state_manager.set_state(STATES.IDLE, state_info)
-        elif state_info.key_flag & KEY_FLAG.PUNCH:
-            self.state_manager.set_state(STATES.PUNCH, state_info)
-        elif state_info.key_flag & KEY_FLAG.KICK:
-            self.state_manager.set_state(STATES.KICK, state_info)
+            self.set_animation(state_info, 'walk', loop=True, blend_time=0.1)
 
 
 class StateJump(StateBase):
@@ -101,102 +143,257 @@ class StateJump(StateBase):
     enable_punch = True
     enable_kick = True
 
-    def on_enter(self, state_info=None):
-        if state_info is not None:
-            state_info.player.set_animation(state_info.animation_meshes['jump'], loop=False, speed=1.0, blend_time=0.1)
-
-    def on_update(self, state_info=None):
-        if state_info.on_ground:
-            self.state_manager.set_state(STATES.IDLE, state_info)
-        elif state_info.key_flag & KEY_FLAG.PUNCH or state_info.key_flag & KEY_FLAG.KICK:
-            self.state_manager.set_state(STATES.JUMP_KICK, state_info)
+    animations = ('jump', )
+    transition_rules = ((landed, STATES.IDLE),
+                        (pressed(KEY_FLAG.PUNCH | KEY_FLAG.KICK), STATES.JUMP_KICK))
 
-
-class StateJumpKick(StateBase):
     def on_enter(self, state_info=None):
         if state_info is not None:
-            state_info.player.set_animation(state_info.animation_meshes['jump_kick'], loop=False, speed=1.0, blend_time=0.1)
-
-    def on_update(self, state_info=None):
-        if state_info.on_ground:
-            self.state_manager.set_state(STATES.IDLE, state_info)
+            self.set_animation(state_info, 'jump', loop=False, speed=1.0, blend_time=0.1)
 
 
-class StatePunch(StateBase):
-    combo_count = 3
-    combo_reset_time = 0.2
+# a move of the state manager's move set, the clip slice of each combo step comes from the move data
+class StateAttack(StateBase):
+    move_name = None
+    # the move is played on the upper body layer while the fighter walks, the legs keep walking
+    upper_body = False
 
     def __init__(self, *args, **kargs):
         StateBase.__init__(self, *args, **kargs)
         self.combo = 0
         self.combo_end_time = 0.0
+        self.move_start_time = 0.0
+
+    def get_move(self):
+        return self.state_manager.move_set.moves[self.move_name]
+
+    def get_segment(self):
+        # combo already points at the next step
+        return (self.combo - 1) % self.get_move().combo_count
+
+    def get_move_time(self, state_info):
+        return (state_info.elapsed_time - self.move_start_time) * self.get_move().speed
+
+    def is_active(self, state_info):
+        return self.state_manager.move_set.is_active(self.get_move(), self.get_segment(), self.get_move_time(state_info))
+
+    def is_cancelable(self, state_info, press_flag):
+        # press_flag holds the buttons pressed this frame, not the held ones
+        move = self.get_move()
+        return move.has_cancel and 0 != (press_flag & getattr(KEY_FLAG, move.button)) and \
+            self.state_manager.move_set.is_cancelable(move, self.get_segment(), self.get_move_time(state_info))
 
     def on_enter(self, state_info=None):
         if state_info is not None:
-            if 0.2 < (state_info.elapsed_time - self.combo_end_time):
+            move = self.get_move()
+            if move.combo_window < (state_info.elapsed_time - self.combo_end_time):
                 self.combo = 0
 
-            if self.combo == 0:
-                state_info.player.set_animation(state_info.animation_meshes['punch'], start_time=0.0, end_time=0.5, loop=False, speed=1.0, blend_time=0.1)
-            elif self.combo == 1:
-                state_info.player.set_animation(state_info.animation_meshes['punch'], start_time=0.5, end_time=1.0, loop=False, speed=1.0, blend_time=0.1)
-            elif self.combo == 2:
-                state_info.player.set_animation(state_info.animation_meshes['punch'], start_time=1.0, loop=False, speed=1.0, blend_time=0.1)
-            self.combo = (self.combo + 1) % self.combo_count
-
-    def on_update(self, state_info=None):
-        if state_info.player.is_animation_end:
-            self.state_manager.set_state(STATES.IDLE, state_info)
+            self.set_animation(state_info, move.animation,
+                               start_time=float(move.start_times[self.combo]),
+                               end_time=float(move.end_times[self.combo]),
+                               loop=False,
+                               speed=move.speed,
+                               blend_time=move.blend_time)
+            self.combo = (self.combo + 1) % move.combo_count
+            self.move_start_time = state_info.elapsed_time
+
+    def set_animation(self, state_info, animation_name, blend_time=0.5, **kargs):
+        animation_blender = self.state_manager.animation_blender
+        if not self.upper_body or animation_blender is None or not animation_blender.is_playing() or 0 == (state_info.key_flag & KEY_FLAG.MOVE):
+            StateBase.set_animation(self, state_info, animation_name, blend_time=blend_time, **kargs)
+            return
+        # the actor still plays the whole clip, its end is what ends the state
+        state_info.player.set_animation(state_info.animation_meshes[animation_name], blend_time=blend_time, **kargs)
+        animation_blender.play_layer(animation_name, **kargs)
 
     def on_exit(self, state_info=None):
         self.combo_end_time = state_info.elapsed_time
+        if self.state_manager.animation_blender is not None:
+            self.state_manager.animation_blender.stop_layer()
 
 
-class StateKick(StateBase):
-    combo_count = 2
-    combo_reset_time = 0.2
+# a cancel goes on with the next combo step from the current one
+class StatePunch(StateAttack):
+    move_name = 'punch'
+    upper_body = True
+    animations = ('punch', )
+    transition_rules = ((canceled, STATES.PUNCH),
+                        (animation_ended, STATES.IDLE))
 
-    def __init__(self, *args, **kargs):
-        StateBase.__init__(self, *args, **kargs)
-        self.combo = 0
-        self.combo_end_time = 0.0
+
+class StateKick(StateAttack):
+    move_name = 'kick'
+    upper_body = True
+    animations = ('kick', )
+    transition_rules = ((canceled, STATES.KICK),
+                        (animation_ended, STATES.IDLE))
+
+
+class StateJumpKick(StateAttack):
+    move_name = 'jump_kick'
+    animations = ('jump_kick', )
+    transition_rules = ((landed, STATES.IDLE), )
+
+
+# hit reactions, a fighter on its way down or on the floor can not be hit again
+class StateHit(StateBase):
+    hurtable = False
+    animations = ('hit', )
+    transition_rules = ((animation_ended, STATES.IDLE), )
 
     def on_enter(self, state_info=None):
         if state_info is not None:
-            if 0.2 < (state_info.elapsed_time - self.combo_end_time):
-                self.combo = 0
+            self.set_animation(state_info, 'hit', loop=False, speed=1.0, blend_time=0.05)
 
-            if self.combo == 0:
-                state_info.player.set_animation(state_info.animation_meshes['kick'], start_time=0.0, end_time=0.5, loop=False, speed=1.0, blend_time=0.1)
-            elif self.combo == 1:
-                state_info.player.set_animation(state_info.animation_meshes['kick'], start_time=0.5, loop=False, speed=1.0, blend_time=0.1)
-            self.combo = (self.combo + 1) % self.combo_count
 
-    def on_update(self, state_info=None):
-        if state_info.player.is_animation_end:
-            self.state_manager.set_state(STATES.IDLE, state_info)
+class StateFalloff(StateBase):
+    hurtable = False
+    animations = ('falloff', )
+    transition_rules = ((animation_ended, STATES.LIE_DOWN), )
+
+    def on_enter(self, state_info=None):
+        if state_info is not None:
+            self.set_animation(state_info, 'falloff', loop=False, speed=1.0, blend_time=0.05)
+
+
+class StateLieDown(StateBase):
+    hurtable = False
+    animations = ('lie_down', )
+    transition_rules = ((animation_ended, STATES.STANDUP), )
+
+    def on_enter(self, state_info=None):
+        if state_info is not None:
+            self.set_animation(state_info, 'lie_down', loop=False, speed=0.5, blend_time=0.0)
 
-    def on_exit(self, state_info=None):
-        self.combo_end_time = state_info.elapsed_time
+
+class StateStandup(StateBase):
+    hurtable = False
+    animations = ('standup', )
+    transition_rules = ((animation_ended, STATES.IDLE), )
+
+    def on_enter(self, state_info=None):
+        if state_info is not None:
+            self.set_animation(state_info, 'standup', loop=False, speed=1.0, blend_time=0.0)
+
+
+state_classes = {STATES.NONE: StateNone,
+                 STATES.IDLE: StateIdle,
+                 STATES.MOVE: StateMove,
+                 STATES.JUMP: StateJump,
+                 STATES.JUMP_KICK: StateJumpKick,
+                 STATES.PUNCH: StatePunch,
+                 STATES.KICK: StateKick,
+                 STATES.HIT: StateHit,
+                 STATES.FALLOFF: StateFalloff,
+                 STATES.LIE_DOWN: StateLieDown,
+                 STATES.STANDUP: StateStandup}
+
+# states a hit switches to, by knockdown
+hit_states = (STATES.HIT, STATES.FALLOFF)
+
+
+def compile_transition_table(state_classes):
+    # next state indexed by (state, on_ground, key_flag, is_animation_end, is_canceled), the state itself when nothing
+    # matches, and whether a rule matched which enters the state again
+    shape = (STATES.COUNT, 2, KEY_FLAG.MASK + 1, 2, 2)
+    transition_table = np.zeros(shape, dtype=np.intp)
+    reenter_table = np.zeros(shape, dtype=np.bool_)
+    for key, state_class in state_classes.items():
+        for on_ground in (False, True):
+            for key_flag in range(KEY_FLAG.MASK + 1):
+                for is_animation_end in (False, True):
+                    for is_canceled in (False, True):
+                        next_state = key
+                        reenter = False
+                        for condition, transition in state_class.transition_rules:
+                            if condition(on_ground, key_flag, is_animation_end, is_canceled):
+                                next_state = transition
+                                reenter = transition == key
+                                break
+                        index = (key, int(on_ground), key_flag, int(is_animation_end), int(is_canceled))
+                        transition_table[index] = next_state
+                        reenter_table[index] = reenter
+    return transition_table, reenter_table
+
+
+def compile_state_table(state_classes, name):
+    state_table = np.zeros(STATES.COUNT, dtype=np.bool_)
+    for key, state_class in state_classes.items():
+        state_table[key] = getattr(state_class, name)
+    return state_table
+
+
+transition_table, reenter_table = compile_transition_table(state_classes)
+enable_rotation_table = compile_state_table(state_classes, 'enable_rotation')
+enable_jump_table = compile_state_table(state_classes, 'enable_jump')
+enable_move_table = compile_state_table(state_classes, 'enable_move')
+hurtable_table = compile_state_table(state_classes, 'hurtable')
+attack_state_table = np.array([issubclass(state_classes.get(key, StateBase), StateAttack) for key in range(STATES.COUNT)], dtype=np.bool_)
+
+
+def get_state_keys(state_managers):
+    return np.fromiter((state_manager.state_key for state_manager in state_managers), dtype=np.intp, count=len(state_managers))
+
+
+def update_states(delta, state_managers, players, animation_meshes, on_grounds, key_flags, press_flags, state_keys=None):
+    # next state of every fighter in one gather, only the fighters which switch run the enter and exit callbacks.
+    # press_flags are the key flags which were not held on the frame before.
+    count = len(state_managers)
+    if state_keys is None:
+        state_keys = get_state_keys(state_managers)
+    animation_ends = np.fromiter((player.is_animation_end for player in players), dtype=np.intp, count=count)
+    cancels = np.zeros(count, dtype=np.intp)
+    for index in np.flatnonzero(attack_state_table[state_keys] & ((press_flags[:count] & (KEY_FLAG.PUNCH | KEY_FLAG.KICK)) != 0)):
+        state_manager = state_managers[index]
+        if state_manager.state.is_cancelable(state_manager.state_info, int(press_flags[index])):
+            cancels[index] = 1
+    table_index = (state_keys, on_grounds[:count].astype(np.intp), key_flags[:count] & KEY_FLAG.MASK, animation_ends, cancels)
+    next_state_keys = transition_table[table_index]
+
+    for index in np.flatnonzero((next_state_keys != state_keys) | reenter_table[table_index]):
+        state_manager = state_managers[index]
+        state_manager.state_info.set_info(delta, players[index], animation_meshes, bool(on_grounds[index]), int(key_flags[index]))
+        state_manager.set_state(int(next_state_keys[index]), state_manager.state_info)
+
+    for state_manager in state_managers:
+        state_manager.state_info.elapsed_time += delta
 
 
 class GameStateManager(StateMachine):
-    def __init__(self, *args, **kargs):
+    def __init__(self, move_set=None, *args, **kargs):
         StateMachine.__init__(self, *args, **kargs)
         self.delta = 0.0
         self.elapsed_time = 0.0
         self.state_info = StateInfo()
-        self.add_state(StateNone, STATES.NONE)
-        self.add_state(StateIdle, STATES.IDLE)
-        self.add_state(StateMove, STATES.MOVE)
-        self.add_state(StateJump, STATES.JUMP)
-        self.add_state(StateJumpKick, STATES.JUMP_KICK)
-        self.add_state(StatePunch, STATES.PUNCH)
-        self.add_state(StateKick, STATES.KICK)
+        self.move_set = move_set or get_move_set()
+        # set when the game computes the bone palettes itself, see AnimationBlender
+        self.animation_blender = None
+        for key, state_class in state_classes.items():
+            self.add_state(state_class, key)
 
         self.set_state(STATES.NONE)
 
-    def update_state(self, delta, player, animation_meshes, on_ground, key_flag):
+    def get_reachable_animations(self, key=None):
+        state = self.state_map[self.get_state_key() if key is None else key]
+        animations = set(state.animations)
+        for condition, transition in state.transition_rules:
+            animations.update(self.state_map[transition].animations)
+        if state.hurtable:
+            for hit_state in hit_states:
+                animations.update(self.state_map[hit_state].animations)
+        return animations
+
+    def restore_state(self, key):
+        # switch without on_exit/on_enter, the rollback restores everything the callbacks would touch
+        self.state_key = key
+        self.state = self.state_map[key]
+
+    def update_state(self, delta, player, animation_meshes, on_ground, key_flag, press_flag=KEY_FLAG.NONE):
         self.state_info.set_info(delta, player, animation_meshes, on_ground, key_flag)
-        StateMachine.update_state(self, self.state_info)
+        is_canceled = attack_state_table[self.state_key] and self.state.is_cancelable(self.state_info, press_flag)
+        table_index = (self.state_key, int(on_ground), key_flag & KEY_FLAG.MASK, int(player.is_animation_end), int(is_canceled))
+        next_state_key = transition_table[table_index]
+        if next_state_key != self.state_key or reenter_table[table_index]:
+            self.set_state(int(next_state_key), self.state_info)
         self.state_info.elapsed_time += delta
@@ -0,0 +1,285 @@
+import os
+import argparse
+import time
+
+from PyEngine3D.Utilities import TransformObject
+from GameClient.GameClient import GameClient
+from GameClient.FighterAI import FighterAI
+from GameClient.Input import *
+from GameClient.Resource import *
+from GameClient.AnimationLibrary import *
+from GameClient.MeshFormat import *
+from GameClient.SceneFormat import *
+from GameClient.CollisionFormat import *
+from GameClient.Profiler import *
+
+
+FIXED_DELTA = 1.0 / 60.0
+# the camera relative spawn of GameClient depends on the renderer's camera, start on the stage floor instead
+SPAWN_POS = (0.0, -1.99, -11.0)
+
+
+class HeadlessBoundBox:
+    def __init__(self, bound_min, bound_max):
+        self.bound_min = bound_min
+        self.bound_max = bound_max
+
+
+class HeadlessAnimation:
+    def __init__(self, name, animation_length):
+        self.name = name
+        self.animation_length = animation_length
+
+
+def create_headless_animation(mesh_name, animation_data):
+    return HeadlessAnimation(mesh_name, get_animation_length(animation_data.get('animation_datas', [])))
+
+
+class HeadlessActor:
+    def __init__(self, name, pos=None):
+        self.name = name
+        self.transform = TransformObject()
+        if pos is not None:
+            self.transform.set_pos(pos)
+        self.animation = None
+        self.animation_time = 0.0
+        self.animation_speed = 1.0
+        self.animation_loop = True
+        self.animation_start_time = 0.0
+        self.animation_end_time = 0.0
+        self.is_animation_end = False
+        self.bone_palette = None
+
+    def set_animation(self, animation, speed=1.0, loop=True, start_time=0.0, end_time=-1.0, blend_time=0.5, force=False, reset=True):
+        self.animation = animation
+        self.animation_speed = speed
+        self.animation_loop = loop
+        self.animation_start_time = start_time
+        self.animation_end_time = end_time if 0.0 <= end_time else animation.animation_length
+        self.animation_time = start_time
+        self.is_animation_end = False
+
+    def get_animation_state(self):
+        return (self.animation, self.animation_time, self.animation_speed, self.animation_loop,
+                self.animation_start_time, self.animation_end_time, self.is_animation_end)
+
+    def set_animation_state(self, animation_state):
+        (self.animation, self.animation_time, self.animation_speed, self.animation_loop,
+         self.animation_start_time, self.animation_end_time, self.is_animation_end) = animation_state
+
+    def update(self, delta):
+        self.transform.update_transform()
+
+        if self.animation is None or self.is_animation_end:
+            return
+
+        self.animation_time += delta * self.animation_speed
+        if self.animation_end_time <= self.animation_time:
+            if self.animation_loop:
+                length = max(self.animation_end_time - self.animation_start_time, delta)
+                self.animation_time = self.animation_start_time + (self.animation_time - self.animation_end_time) % length
+            else:
+                self.animation_time = self.animation_end_time
+                self.is_animation_end = True
+
+
+def upload_headless_bone_palette(actor, palette):
+    actor.bone_palette = palette
+
+
+class HeadlessCollisionActor(HeadlessActor):
+    def __init__(self, name, bound_boxes):
+        HeadlessActor.__init__(self, name)
+        self.geometry_bound_boxes = bound_boxes
+
+    def get_geometry_bound_boxes(self):
+        return self.geometry_bound_boxes
+
+
+def create_headless_resource(resource_name, ext, data):
+    # nothing to upload, the decoded data is the resource
+    return data
+
+
+class HeadlessResource:
+    def __init__(self):
+        self.data = None
+
+    def set_data(self, data):
+        self.data = data
+
+
+class HeadlessResourceLoader:
+    # registers every file below the resource folder like the engine's loaders do when it starts
+    def __init__(self, project_path, resource_path, ext):
+        self.resources = {}
+        root_path = os.path.join(project_path, resource_path)
+        for dirpath, dirnames, filenames in os.walk(root_path):
+            for filename in filenames:
+                name, file_ext = os.path.splitext(os.path.relpath(os.path.join(dirpath, filename), root_path))
+                if file_ext == ext:
+                    self.resources[name.replace(os.sep, '.')] = HeadlessResource()
+
+
+class HeadlessResourceManager:
+    def __init__(self, scene_manager, project_path=PROJECT_PATH):
+        self.scene_manager = scene_manager
+        self.project_path = project_path
+        self.animations = {}
+        self.mesh_loader = HeadlessResourceLoader(project_path, MESH_PATH, MESH_EXT)
+
+    def get_filepath(self, *paths):
+        return os.path.join(self.project_path, *paths)
+
+    def get_model(self, model_name):
+        return load_text_data(self.get_filepath('Models', model_name + '.model'))
+
+    def get_mesh(self, mesh_name):
+        # only the clip length of the animation meshes matters without a renderer
+        if mesh_name not in self.animations:
+            self.animations[mesh_name] = create_headless_animation(mesh_name, load_mesh_data(self.get_filepath('Meshes', mesh_name + '.mesh')))
+        return self.animations[mesh_name]
+
+    def get_mesh_data(self, mesh_name):
+        # the data the game client streamed in, the file when nothing was installed
+        resource = self.mesh_loader.resources.get(mesh_name)
+        if resource is not None and resource.data is not None:
+            return resource.data
+        return load_mesh_data(self.get_filepath('Meshes', mesh_name + '.mesh'))
+
+    def get_collision_bound_boxes(self, actor_data):
+        model_data = self.get_model(actor_data['model'])
+        mesh_data = self.get_mesh_data(model_data['mesh'])
+        return [HeadlessBoundBox(bound_min, bound_max) for bound_min, bound_max in zip(*get_world_bound_boxes(actor_data, mesh_data))]
+
+    def open_scene(self, scene_name):
+        scene_data = load_scene(self.get_filepath('Scenes', scene_name + '.scene'))
+        self.scene_manager.clear_scene()
+
+        for camera_data in scene_data.get('cameras', []):
+            camera = self.scene_manager.main_camera
+            camera.transform.set_pos(camera_data['pos'])
+            camera.transform.set_rotation(camera_data['rot'])
+            camera.transform.update_transform()
+
+        for actor_data in scene_data.get('collision_actors', []):
+            collision_actor = HeadlessCollisionActor(actor_data['name'], self.get_collision_bound_boxes(actor_data))
+            self.scene_manager.collision_actors.append(collision_actor)
+
+
+class HeadlessSceneManager:
+    def __init__(self):
+        self.main_camera = HeadlessActor('camera')
+        self.collision_actors = []
+        self.objects = {}
+
+    def clear_scene(self):
+        self.collision_actors = []
+        self.objects = {}
+
+    def add_object(self, model, pos):
+        name = '%s_%d' % (model['mesh'], len(self.objects))
+        actor = HeadlessActor(name, pos)
+        actor.transform.update_transform()
+        self.objects[name] = actor
+        return actor
+
+    def delete_object(self, name):
+        self.objects.pop(name, None)
+
+    def update(self, delta):
+        self.main_camera.update(delta)
+        for actor in self.objects.values():
+            actor.update(delta)
+
+
+class HeadlessCoreManager:
+    def __init__(self, project_path=PROJECT_PATH):
+        self.game_backend = None
+        self.scene_manager = HeadlessSceneManager()
+        self.resource_manager = HeadlessResourceManager(self.scene_manager, project_path)
+
+
+# steps GameClient at a fixed timestep from scripted input, without a window or any GL resource
+class HeadlessSimulation:
+    def __init__(self, input_source, delta=FIXED_DELTA, project_path=PROJECT_PATH, spawn_pos=SPAWN_POS, enemy_count=0, bone_palettes=False):
+        self.delta = delta
+        self.frame = 0
+        self.core_manager = HeadlessCoreManager(project_path)
+        self.game_client = GameClient()
+        self.game_client.input = input_source
+        self.game_client.project_path = project_path
+        self.game_client.animation_library = AnimationLibrary(create_headless_animation, self.core_manager.resource_manager.get_mesh, project_path=project_path)
+        # textures and material instances have nothing to install without a renderer
+        self.game_client.streamed_resource_exts = (MESH_EXT,)
+        self.game_client.create_resource = create_headless_resource
+        # a fixed number of decisions per frame instead of a time budget, a replay decides the same on every machine
+        self.game_client.fighter_ai = FighterAI(time_budget=None)
+        self.game_client.enemy_count = enemy_count
+        if bone_palettes:
+            self.game_client.use_bone_palettes = True
+            self.game_client.upload_bone_palette = upload_headless_bone_palette
+        self.game_client.initialize(self.core_manager)
+        self.game_client.wait_loading()
+        if spawn_pos is not None:
+            self.game_client.fighters.positions[self.game_client.player_index] = spawn_pos
+
+    def step(self):
+        delta = self.game_client.input.get_delta(self.delta)
+        with profiler.scope('frame'):
+            self.game_client.update(delta)
+            with profiler.scope('scene'):
+                self.core_manager.scene_manager.update(delta)
+        profiler.end_frame()
+        self.frame += 1
+
+    def run(self, frame_count):
+        for i in range(frame_count):
+            self.step()
+
+    def exit(self):
+        self.game_client.exit()
+
+
+def walk_and_punch_script(frame):
+    # walk in a square, jump every couple of seconds and throw punches and kicks in between
+    press_keys = (KEY_FLAG_W, KEY_FLAG_D, KEY_FLAG_S, KEY_FLAG_A)[(frame // 120) % 4]
+    jump = 0 == frame % 150
+    punch = 60 <= frame % 240 < 64
+    kick = 180 <= frame % 240 < 184
+    if punch or kick:
+        press_keys = KEY_FLAG_NONE
+    return press_keys, get_key_flag(press_keys, jump, punch, kick)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('frame_count', type=int, nargs='?', default=10000)
+    parser.add_argument('--record', help='write the input of every frame to an input log')
+    parser.add_argument('--replay', help='play an input log back instead of the scripted input')
+    parser.add_argument('--profile', help='write p50/p99/max of every profile scope to a json file')
+    parser.add_argument('--enemies', type=int, default=0, help='spawn this many enemies driven by the fighter ai')
+    parser.add_argument('--bone-palettes', action='store_true', help='skin the fighters from the pose tables and blend the clips of the player')
+    args = parser.parse_args()
+
+    if args.replay:
+        input_source = ReplayInput(args.replay)
+        frame_count = input_source.get_frame_count()
+    else:
+        input_source = ScriptedInput(walk_and_punch_script)
+        frame_count = args.frame_count
+
+    simulation = HeadlessSimulation(input_source, enemy_count=args.enemies, bone_palettes=args.bone_palettes)
+    if args.record:
+        simulation.game_client.start_recording(args.record)
+
+    profiler.enabled = args.profile is not None
+    start_time = time.perf_counter()
+    simulation.run(frame_count)
+    elapsed_time = time.perf_counter() - start_time
+    simulation.exit()
+    print("%d frames in %.3f sec, %.1f frames/sec" % (frame_count, elapsed_time, frame_count / elapsed_time))
+    print("player position", simulation.game_client.fighters.positions[simulation.game_client.player_index])
+    if args.profile:
+        profiler.save_statistics(args.profile)
+        profiler.print_statistics()
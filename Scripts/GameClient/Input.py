@@ -0,0 +1,140 @@
+import struct
+
+import numpy as np
+
+from GameClient.GameState import *
+from GameClient.Fighter import *
+
+
+def get_key_flag(press_keys, jump=False, punch=False, kick=False):
+    key_flag = KEY_FLAG.NONE
+
+    if press_keys in key_map:
+        key_flag |= KEY_FLAG.MOVE
+
+    if jump:
+        key_flag |= KEY_FLAG.JUMP
+
+    if punch:
+        key_flag |= KEY_FLAG.PUNCH
+
+    if kick:
+        key_flag |= KEY_FLAG.KICK
+
+    return key_flag
+
+
+class BackendInput:
+    def __init__(self, game_backend):
+        # the game backend pulls in the window system, keep it out of the headless import chain
+        from PyEngine3D.App.GameBackend import Keyboard
+        self.keyboard = Keyboard
+        self.game_backend = game_backend
+
+    def get_delta(self, delta):
+        return delta
+
+    def get_input(self, delta):
+        Keyboard = self.keyboard
+        keydown = self.game_backend.get_keyboard_pressed()
+        btn_left, btn_middle, btn_right = self.game_backend.get_mouse_pressed()
+
+        press_keys = 0
+
+        if keydown[Keyboard.W]:
+            press_keys |= KEY_FLAG_W
+        elif keydown[Keyboard.S]:
+            press_keys |= KEY_FLAG_S
+
+        if keydown[Keyboard.A]:
+            press_keys |= KEY_FLAG_A
+        elif keydown[Keyboard.D]:
+            press_keys |= KEY_FLAG_D
+
+        return press_keys, get_key_flag(press_keys, keydown[Keyboard.SPACE], btn_left, btn_right)
+
+
+# input from a list of (press_keys, key_flag) per frame or a function of the frame index
+class ScriptedInput:
+    def __init__(self, script, loop=False):
+        self.script = script
+        self.loop = loop
+        self.frame = 0
+
+    def get_delta(self, delta):
+        return delta
+
+    def get_input(self, delta):
+        frame = self.frame
+        self.frame += 1
+
+        if callable(self.script):
+            return self.script(frame)
+
+        if self.loop:
+            frame %= len(self.script)
+        elif len(self.script) <= frame:
+            return KEY_FLAG_NONE, KEY_FLAG.NONE
+        return self.script[frame]
+
+
+INPUT_LOG_MAGIC = b'FGTI'
+INPUT_LOG_VERSION = 1
+INPUT_LOG_HEADER = struct.Struct('<4sI')
+# delta stays float64 so that a replay runs the exact same arithmetic as the recorded frame
+INPUT_LOG_FRAME = struct.Struct('<dBB')
+INPUT_LOG_DTYPE = np.dtype([('delta', '<f8'), ('press_keys', 'u1'), ('key_flag', 'u1')])
+
+
+# records (delta, press_keys, key_flag) of every frame polled through another input source
+class InputRecorder:
+    def __init__(self, input_source, filepath):
+        self.input_source = input_source
+        self.file = open(filepath, 'wb')
+        self.file.write(INPUT_LOG_HEADER.pack(INPUT_LOG_MAGIC, INPUT_LOG_VERSION))
+        self.frame = 0
+
+    def get_delta(self, delta):
+        return self.input_source.get_delta(delta)
+
+    def get_input(self, delta):
+        press_keys, key_flag = self.input_source.get_input(delta)
+        self.file.write(INPUT_LOG_FRAME.pack(delta, press_keys, key_flag))
+        self.frame += 1
+        return press_keys, key_flag
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+# feeds the frames of an input log back, including the recorded frame delta
+class ReplayInput:
+    def __init__(self, filepath):
+        with open(filepath, 'rb') as f:
+            data = f.read()
+
+        magic, version = INPUT_LOG_HEADER.unpack_from(data)
+        if magic != INPUT_LOG_MAGIC or version != INPUT_LOG_VERSION:
+            raise ValueError("%s is not an input log" % filepath)
+
+        self.frames = np.frombuffer(data, dtype=INPUT_LOG_DTYPE, offset=INPUT_LOG_HEADER.size)
+        self.frame = 0
+
+    def get_frame_count(self):
+        return len(self.frames)
+
+    def is_end(self):
+        return len(self.frames) <= self.frame
+
+    def get_delta(self, delta):
+        if self.is_end():
+            return delta
+        return float(self.frames[self.frame]['delta'])
+
+    def get_input(self, delta):
+        if self.is_end():
+            return KEY_FLAG_NONE, KEY_FLAG.NONE
+        press_keys, key_flag = self.frames[self.frame][['press_keys', 'key_flag']].tolist()
+        self.frame += 1
+        return press_keys, key_flag
@@ -0,0 +1,176 @@
+import os
+import zlib
+
+import numpy as np
+
+from PyEngine3D.Utilities import TransformObject
+from GameClient.Resource import *
+from GameClient.MeshFormat import *
+
+
+# actors with fewer instances are left to the scene manager
+MIN_INSTANCE_COUNT = 2
+
+
+def get_frustum_planes(view_projection):
+    # row vector convention, clip = pos * view_projection, planes are (normal, distance) with inward normals
+    columns = view_projection.T
+    planes = np.array([columns[3] + columns[0],
+                       columns[3] - columns[0],
+                       columns[3] + columns[1],
+                       columns[3] - columns[1],
+                       columns[3] + columns[2],
+                       columns[3] - columns[2]], dtype=np.float32)
+    planes /= np.linalg.norm(planes[:, :3], axis=1)[:, np.newaxis]
+    return planes
+
+
+def get_instance_transforms(actor_data, seed=0):
+    # explicit instance lists win, the instances without one are scattered in the instance ranges
+    instance_count = actor_data.get('instance_count', 1)
+    if instance_count <= 1:
+        return np.zeros((1, 3), dtype=np.float32), np.zeros((1, 3), dtype=np.float32), np.ones((1, 3), dtype=np.float32)
+
+    random = np.random.default_rng(seed)
+    transforms = []
+    for key in ('instance_pos', 'instance_rot', 'instance_scale'):
+        value_range = actor_data[key]
+        min_value = np.array(value_range['min_value'], dtype=np.float32)
+        max_value = np.array(value_range['max_value'], dtype=np.float32)
+        # the scale range is uniform
+        values = min_value + (max_value - min_value) * random.random((instance_count, 3 if min_value.shape else 1), dtype=np.float32)
+        value_list = actor_data.get(key + '_list', [])[:instance_count]
+        if value_list:
+            values[:len(value_list)] = np.array(value_list, dtype=np.float32).reshape(len(value_list), -1)
+        transforms.append(np.broadcast_to(values, (instance_count, 3)))
+    return transforms
+
+
+# instance matrices of one geometry drawn with one material instance
+class InstanceBatch:
+    def __init__(self, mesh_name, geometry_index, material_instance_name, bound_center, bound_radius, capacity=16):
+        self.mesh_name = mesh_name
+        self.geometry_index = geometry_index
+        self.material_instance_name = material_instance_name
+        self.bound_center = np.array(bound_center, dtype=np.float32)
+        self.bound_radius = float(bound_radius)
+        self.count = 0
+        self.matrices = np.zeros((capacity, 4, 4), dtype=np.float32)
+        self.visible_matrices = np.zeros((capacity, 4, 4), dtype=np.float32)
+        self.visible_count = 0
+
+    def reserve(self, capacity):
+        if capacity <= len(self.matrices):
+            return
+        matrices = np.zeros((capacity, 4, 4), dtype=np.float32)
+        matrices[:self.count] = self.matrices[:self.count]
+        self.matrices = matrices
+        self.visible_matrices = np.zeros((capacity, 4, 4), dtype=np.float32)
+
+    def add_instances(self, matrices):
+        count = self.count + len(matrices)
+        if len(self.matrices) < count:
+            self.reserve(max(count, len(self.matrices) * 2))
+        self.matrices[self.count:count] = matrices
+        self.count = count
+
+    def get_visible_matrices(self):
+        return self.visible_matrices[:self.visible_count]
+
+
+# every instanced prop of the stage in one array per (mesh geometry, material instance), culled against the
+# camera frustum in one vectorized pass, only the visible matrices are handed to upload_instances.
+# the engine's renderer has no instance buffer to take them yet, the scene manager still draws every actor.
+class InstanceStore:
+    def __init__(self, upload_instances=None):
+        self.upload_instances = upload_instances
+        self.batches = {}
+        self.instance_count = 0
+        self.visible_count = 0
+        self.is_dirty = False
+        self.batch_list = []
+        self.batch_offsets = np.zeros(1, dtype=np.intp)
+        self.world_centers = np.zeros((0, 4), dtype=np.float32)
+        self.world_radii = np.zeros(0, dtype=np.float32)
+
+    def clear(self):
+        self.__init__(self.upload_instances)
+
+    def get_batch(self, mesh_name, geometry_index, material_instance_name, bound_center, bound_radius):
+        key = (mesh_name, geometry_index, material_instance_name)
+        if key not in self.batches:
+            self.batches[key] = InstanceBatch(mesh_name, geometry_index, material_instance_name, bound_center, bound_radius)
+        return self.batches[key]
+
+    def add_instances(self, mesh_name, geometry_index, material_instance_name, bound_center, bound_radius, matrices):
+        self.get_batch(mesh_name, geometry_index, material_instance_name, bound_center, bound_radius).add_instances(matrices)
+        self.instance_count += len(matrices)
+        self.is_dirty = True
+
+    def add_actor(self, actor_data, mesh_name, material_instance_names, geometry_bounds):
+        # geometry_bounds is a (bound_min, bound_max) per geometry of the mesh
+        transform = TransformObject()
+        transform.set_pos(actor_data['pos'])
+        transform.set_rotation(actor_data['rot'])
+        transform.set_scale(actor_data['scale'])
+        transform.update_transform()
+        actor_matrix = np.array(transform.matrix, dtype=np.float32)
+
+        positions, rotations, scales = get_instance_transforms(actor_data, seed=zlib.crc32(actor_data['name'].encode('utf-8')))
+        matrices = np.zeros((len(positions), 4, 4), dtype=np.float32)
+        # one transform object for all instances, it is only used to build the matrices with the engine's conventions
+        for index, (position, rotation, scale) in enumerate(zip(positions, rotations, scales)):
+            transform.set_pos(position)
+            transform.set_rotation(rotation)
+            transform.set_scale(scale)
+            transform.update_transform()
+            matrices[index][...] = transform.matrix
+        matrices = np.matmul(matrices, actor_matrix)
+
+        for geometry_index, (bound_min, bound_max) in enumerate(geometry_bounds):
+            material_instance_name = material_instance_names[min(geometry_index, len(material_instance_names) - 1)]
+            bound_center = (np.array(bound_min, dtype=np.float32) + np.array(bound_max, dtype=np.float32)) * 0.5
+            bound_radius = np.linalg.norm(np.array(bound_max, dtype=np.float32) - bound_center)
+            self.add_instances(mesh_name, geometry_index, material_instance_name, bound_center, bound_radius, matrices)
+
+    def add_scene(self, scene_data, project_path=PROJECT_PATH, min_instance_count=MIN_INSTANCE_COUNT):
+        for actor_data in scene_data.get('static_actors', []):
+            if actor_data.get('instance_count', 1) < min_instance_count:
+                continue
+            model_data = load_text_data(os.path.join(project_path, 'Models', actor_data['model'] + '.model'))
+            mesh_data = load_mesh_data(os.path.join(project_path, MESH_PATH, model_data['mesh'] + MESH_EXT))
+            geometry_bounds = [(geometry_data['bound_min'], geometry_data['bound_max']) for geometry_data in mesh_data['geometry_datas']]
+            self.add_actor(actor_data, model_data['mesh'], model_data['material_instances'], geometry_bounds)
+
+    def build(self):
+        # bounding spheres of every instance of every batch, in batch order
+        self.batch_list = [batch for batch in self.batches.values() if 0 < batch.count]
+        self.batch_offsets = np.cumsum([0] + [batch.count for batch in self.batch_list]).astype(np.intp)
+        centers = []
+        radii = []
+        for batch in self.batch_list:
+            matrices = batch.matrices[:batch.count]
+            centers.append(np.dot(np.append(batch.bound_center, 1.0), matrices))
+            # the largest axis scale of each instance grows its sphere
+            radii.append(np.linalg.norm(matrices[:, :3, :3], axis=2).max(axis=1) * batch.bound_radius)
+        self.world_centers = np.concatenate(centers).astype(np.float32) if centers else np.zeros((0, 4), dtype=np.float32)
+        self.world_radii = np.concatenate(radii).astype(np.float32) if radii else np.zeros(0, dtype=np.float32)
+        self.is_dirty = False
+
+    def update(self, view_projection):
+        if self.is_dirty:
+            self.build()
+
+        planes = get_frustum_planes(view_projection)
+        distances = np.dot(self.world_centers, planes.T)
+        visibles = np.all(-self.world_radii[:, np.newaxis] <= distances, axis=1)
+
+        self.visible_count = 0
+        for batch, start, end in zip(self.batch_list, self.batch_offsets[:-1], self.batch_offsets[1:]):
+            visible = visibles[start:end]
+            batch.visible_count = int(np.count_nonzero(visible))
+            np.compress(visible, batch.matrices[:batch.count], axis=0, out=batch.visible_matrices[:batch.visible_count])
+            self.visible_count += batch.visible_count
+            if self.upload_instances is not None:
+                self.upload_instances(batch, batch.get_visible_matrices())
+        return self.visible_count
@@ -0,0 +1,56 @@
+import os
+import sys
+import time
+
+from GameClient.Resource import *
+from GameClient.BinaryFormat import *
+
+
+MESH_PATH = 'Meshes'
+MESH_EXT = '.mesh'
+MESH_BINARY_EXT = '.bmesh'
+MESH_BINARY_MAGIC = b'FGTM'
+# the int lists of a mesh which are indices, every other number list holds floats
+mesh_int_keys = ('indices', 'bone_indicies')
+
+
+def get_mesh_binary_filepath(filepath):
+    return os.path.splitext(filepath)[0] + MESH_BINARY_EXT
+
+
+def save_mesh_binary(filepath, mesh_data):
+    save_binary_data(filepath, MESH_BINARY_MAGIC, mesh_data, int_keys=mesh_int_keys)
+
+
+def load_mesh_binary(filepath):
+    return load_binary_data(filepath, MESH_BINARY_MAGIC)
+
+
+def load_mesh_data(filepath):
+    # prefer the converted mesh unless the gzip pickle was exported after it
+    binary_filepath = get_mesh_binary_filepath(filepath)
+    if os.path.exists(binary_filepath) and (not os.path.exists(filepath) or os.path.getmtime(filepath) <= os.path.getmtime(binary_filepath)):
+        return load_mesh_binary(binary_filepath)
+    return load_resource_data(filepath)
+
+
+def convert_mesh(filepath):
+    binary_filepath = get_mesh_binary_filepath(filepath)
+    save_mesh_binary(binary_filepath, load_resource_data(filepath))
+    return binary_filepath
+
+
+def convert_meshes(project_path=PROJECT_PATH):
+    mesh_path = os.path.join(project_path, MESH_PATH)
+    for filename in sorted(os.listdir(mesh_path)):
+        if os.path.splitext(filename)[1] != MESH_EXT:
+            continue
+        filepath = os.path.join(mesh_path, filename)
+        binary_filepath = convert_mesh(filepath)
+        print("%-44s %10d -> %10d bytes" % (os.path.relpath(binary_filepath, project_path), os.path.getsize(filepath), os.path.getsize(binary_filepath)))
+
+
+if __name__ == '__main__':
+    start_time = time.perf_counter()
+    convert_meshes(*sys.argv[1:2])
+    print("done in %.3f sec" % (time.perf_counter() - start_time))
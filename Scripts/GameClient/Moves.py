@@ -0,0 +1,95 @@
+import os
+import math
+
+import numpy as np
+
+from GameClient.Resource import *
+
+
+MOVE_PATH = 'Moves'
+MOVE_EXT = '.moves'
+MOVE_FRAME_RATE = 60.0
+
+
+def get_window_frames(window, frame_rate):
+    # [start_time, end_time) of a segment in frames, None is an empty window
+    if window is None:
+        return 0, 0
+    return int(math.floor(window[0] * frame_rate + 0.5)), int(math.floor(window[1] * frame_rate + 0.5))
+
+
+# one move and its combo chain, every segment is a slice of the same clip
+class Move:
+    def __init__(self, name, move_data, frame_rate):
+        self.name = name
+        self.animation = move_data['animation']
+        self.button = move_data['button']
+        self.combo_window = move_data['combo_window']
+        self.speed = move_data.get('speed', 1.0)
+        self.blend_time = move_data.get('blend_time', 0.1)
+        self.segments = move_data['segments']
+        self.combo_count = len(self.segments)
+        self.start_times = np.array([segment['start_time'] for segment in self.segments], dtype=np.float32)
+        self.end_times = np.array([segment['end_time'] for segment in self.segments], dtype=np.float32)
+        # [bone, radius] spheres which hit during the active frames, a knockdown sends the defender to the floor
+        self.hitboxes = [segment.get('hitboxes', []) for segment in self.segments]
+        self.knockdowns = np.array([segment.get('knockdown', False) for segment in self.segments], dtype=np.bool_)
+
+        # per frame flags of every segment, the last frame of each segment is past all windows
+        self.frame_offsets = np.zeros(self.combo_count + 1, dtype=np.intp)
+        active_frames = []
+        cancel_frames = []
+        for index, segment in enumerate(self.segments):
+            active = get_window_frames(segment.get('active'), frame_rate)
+            cancel = get_window_frames(segment.get('cancel'), frame_rate)
+            frame_count = max(active[1], cancel[1]) + 1
+            if 0.0 <= segment['end_time']:
+                frame_count = max(frame_count, int(math.ceil((segment['end_time'] - segment['start_time']) * frame_rate)) + 1)
+            frames = np.arange(frame_count)
+            active_frames.append((active[0] <= frames) & (frames < active[1]))
+            cancel_frames.append((cancel[0] <= frames) & (frames < cancel[1]))
+            self.frame_offsets[index + 1] = self.frame_offsets[index] + frame_count
+        self.active_frames = np.concatenate(active_frames)
+        self.cancel_frames = np.concatenate(cancel_frames)
+        self.has_cancel = bool(np.any(self.cancel_frames))
+
+
+# moves of a character compiled from Moves/<name>.moves, the per frame logic only indexes the arrays
+class MoveSet:
+    def __init__(self, move_set_data):
+        self.frame_rate = move_set_data.get('frame_rate', MOVE_FRAME_RATE)
+        # [bone, radius] spheres every fighter can be hit on
+        self.hurtboxes = move_set_data.get('hurtboxes', [])
+        self.moves = {name: Move(name, move_data, self.frame_rate) for name, move_data in move_set_data['moves'].items()}
+
+    def get_frame_index(self, move, segment, move_time):
+        start = move.frame_offsets[segment]
+        end = move.frame_offsets[segment + 1]
+        return start + min(max(0, int(move_time * self.frame_rate)), end - 1 - start)
+
+    def is_active(self, move, segment, move_time):
+        return bool(move.active_frames[self.get_frame_index(move, segment, move_time)])
+
+    def is_cancelable(self, move, segment, move_time):
+        return bool(move.cancel_frames[self.get_frame_index(move, segment, move_time)])
+
+    def get_volume_bone_names(self):
+        # every bone a hurtbox or hitbox is attached to
+        bone_names = [bone_name for bone_name, radius in self.hurtboxes]
+        for move in self.moves.values():
+            for hitboxes in move.hitboxes:
+                for bone_name, radius in hitboxes:
+                    if bone_name not in bone_names:
+                        bone_names.append(bone_name)
+        return bone_names
+
+
+move_sets = {}
+
+
+def get_move_set(name='player', project_path=PROJECT_PATH):
+    # compiled once per character
+    key = (name, project_path)
+    if key not in move_sets:
+        move_sets[key] = MoveSet(load_text_data(os.path.join(project_path, MOVE_PATH, name + MOVE_EXT)))
+    return move_sets[key]
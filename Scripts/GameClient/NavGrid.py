@@ -0,0 +1,387 @@
+import os
+import sys
+import math
+import time
+import heapq
+import hashlib
+import argparse
+from collections import OrderedDict
+
+import numpy as np
+
+from GameClient.Resource import *
+from GameClient.BinaryFormat import *
+from GameClient.SceneFormat import *
+from GameClient.Collision import *
+from GameClient.CollisionFormat import *
+
+
+NAV_EXT = '.nav'
+NAV_BINARY_MAGIC = b'FGTN'
+NAV_CELL_SIZE = 0.5
+# flow fields toward this many goals are kept
+NAV_FLOW_CACHE_SIZE = 4
+# a cached flow field serves every goal this many cells around the goal it was searched for
+NAV_FLOW_GOAL_RADIUS = 3
+# a flow field covers the cells this far from its goal, in world units
+NAV_FLOW_RANGE = 40.0
+# cells a flow field search expands between two looks at the clock
+NAV_SEARCH_CHUNK = 64
+# find_path gives this back while the flow field toward the goal is still searched
+NAV_PATH_PENDING = object()
+
+# dx, dz, cost of the 8 neighbors, the orthogonal ones first
+nav_directions = ((1, 0, 1.0), (-1, 0, 1.0), (0, 1, 1.0), (0, -1, 1.0),
+                  (1, 1, math.sqrt(2.0)), (1, -1, math.sqrt(2.0)), (-1, 1, math.sqrt(2.0)), (-1, -1, math.sqrt(2.0)))
+
+
+def get_nav_filepath(project_path, scene_name):
+    # baked next to the scene it comes from
+    return os.path.join(project_path, SCENE_PATH, scene_name + NAV_EXT)
+
+
+def get_collision_hash(bound_mins, bound_maxs, cell_size=NAV_CELL_SIZE):
+    # the nav grid is only as old as the collision set and the settings it is baked from
+    sha1 = hashlib.sha1()
+    sha1.update(np.ascontiguousarray(bound_mins, dtype=np.float32).tobytes())
+    sha1.update(np.ascontiguousarray(bound_maxs, dtype=np.float32).tobytes())
+    sha1.update(repr((cell_size, BOUND_BOX_OFFSET)).encode('utf-8'))
+    return sha1.hexdigest()
+
+
+def get_cell_range(lower, upper, origin, cell_size, size, center):
+    # cells whose center is inside [lower, upper], or which overlap it at all
+    if center:
+        start = math.ceil((lower - origin) / cell_size - 0.5)
+        end = math.floor((upper - origin) / cell_size - 0.5) + 1
+    else:
+        start = math.floor((lower - origin) / cell_size)
+        end = math.ceil((upper - origin) / cell_size)
+    return max(0, start), min(size, end)
+
+
+def bake_nav_grid(bound_mins, bound_maxs, cell_size=NAV_CELL_SIZE):
+    # The fighters collide as points which step onto anything up to BOUND_BOX_OFFSET higher than their feet.
+    # The top of a box is walkable where no box is in the way of the feet standing on it, a cell keeps the
+    # lowest walkable top over its center and cells without one get inf.
+    bound_mins = np.asarray(bound_mins, dtype=np.float32).reshape(-1, 3)
+    bound_maxs = np.asarray(bound_maxs, dtype=np.float32).reshape(-1, 3)
+    if 0 == len(bound_mins):
+        origin = np.zeros(2, dtype=np.float32)
+        heights = np.full((0, 0), np.inf, dtype=np.float32)
+    else:
+        origin = bound_mins[:, [0, 2]].min(axis=0)
+        width, depth = np.maximum(1, np.ceil((bound_maxs[:, [0, 2]].max(axis=0) - origin) / cell_size)).astype(np.int32).tolist()
+        heights = np.full((depth, width), np.inf, dtype=np.float32)
+
+        for index in range(len(bound_mins)):
+            x_start, x_end = get_cell_range(bound_mins[index, 0], bound_maxs[index, 0], origin[0], cell_size, width, True)
+            z_start, z_end = get_cell_range(bound_mins[index, 2], bound_maxs[index, 2], origin[1], cell_size, depth, True)
+            if x_end <= x_start or z_end <= z_start:
+                continue
+
+            top = bound_maxs[index, 1]
+            walkable = np.ones((z_end - z_start, x_end - x_start), dtype=np.bool_)
+            blocking = np.flatnonzero((bound_mins[:, 1] < top + BOUND_BOX_OFFSET) & (top + BOUND_BOX_OFFSET < bound_maxs[:, 1]))
+            for other in blocking:
+                other_x_start, other_x_end = get_cell_range(bound_mins[other, 0], bound_maxs[other, 0], origin[0], cell_size, width, False)
+                other_z_start, other_z_end = get_cell_range(bound_mins[other, 2], bound_maxs[other, 2], origin[1], cell_size, depth, False)
+                walkable[max(0, other_z_start - z_start):max(0, other_z_end - z_start), max(0, other_x_start - x_start):max(0, other_x_end - x_start)] = False
+            region = heights[z_start:z_end, x_start:x_end]
+            region[...] = np.minimum(region, np.where(walkable, top, np.inf))
+
+    return dict(collision_hash=get_collision_hash(bound_mins, bound_maxs, cell_size),
+                cell_size=cell_size,
+                origin=origin.astype(np.float32),
+                heights=heights)
+
+
+def save_nav_grid(filepath, nav_data):
+    save_binary_data(filepath, NAV_BINARY_MAGIC, nav_data, pack_lists=False)
+
+
+def load_nav_data(filepath):
+    return load_binary_data(filepath, NAV_BINARY_MAGIC)
+
+
+def create_nav_grid(nav_data):
+    return NavGrid(nav_data['heights'], nav_data['origin'], nav_data['cell_size'])
+
+
+def load_nav_grid(project_path, scene_name, bound_mins, bound_maxs):
+    # None when there is nothing baked for the scene or it was baked from another collision set, the caller bakes it again
+    filepath = get_nav_filepath(project_path, scene_name)
+    if not os.path.exists(filepath):
+        return None
+    nav_data = load_nav_data(filepath)
+    if nav_data['collision_hash'] != get_collision_hash(bound_mins, bound_maxs, nav_data['cell_size']):
+        return None
+    return create_nav_grid(nav_data)
+
+
+def bake_nav_grids(project_path=PROJECT_PATH, force=False):
+    # from the baked collision of every scene, bake_collisions runs first
+    scene_path = os.path.join(project_path, SCENE_PATH)
+    for filename in sorted(os.listdir(scene_path)):
+        scene_name, ext = os.path.splitext(filename)
+        collision_filepath = get_collision_filepath(project_path, scene_name)
+        if ext != SCENE_EXT or not os.path.exists(collision_filepath):
+            continue
+        collision_data = load_collision(collision_filepath)
+        filepath = get_nav_filepath(project_path, scene_name)
+        if not force and os.path.exists(filepath) and \
+                load_nav_data(filepath)['collision_hash'] == get_collision_hash(collision_data['bound_mins'], collision_data['bound_maxs']):
+            continue
+        nav_data = bake_nav_grid(collision_data['bound_mins'], collision_data['bound_maxs'])
+        save_nav_grid(filepath, nav_data)
+        heights = nav_data['heights']
+        print("%-40s %4d x %-4d cells %7d walkable" % (os.path.relpath(filepath, project_path), heights.shape[1], heights.shape[0], np.count_nonzero(np.isfinite(heights))))
+
+
+# Dijkstra out from the goal along the moves reversed, it stops after any cell and goes on later.
+# next_cells of the cells it did not reach stay -1.
+class FlowFieldSearch:
+    def __init__(self, nav_grid, goal_cell, max_distance):
+        self.nav_grid = nav_grid
+        self.goal_cell = goal_cell
+        self.max_distance = max_distance
+        self.next_cells = np.full(nav_grid.width * nav_grid.depth, -1, dtype=np.int32)
+        self.next_cells[goal_cell] = goal_cell
+        self.distances = {goal_cell: 0.0}
+        self.queue = [(0.0, goal_cell)]
+        self.expanded_count = 0
+
+    def is_done(self):
+        return 0 == len(self.queue)
+
+    def expand(self, expanded_count):
+        # until expanded_count cells are expanded in total or every cell in range is
+        moves, offsets, costs = self.nav_grid.moves, self.nav_grid.offsets, self.nav_grid.costs
+        next_cells, distances, queue = self.next_cells, self.distances, self.queue
+        cell_count = len(next_cells)
+        max_distance = self.max_distance
+        while queue and self.expanded_count < expanded_count:
+            distance, cell = heapq.heappop(queue)
+            if distances[cell] < distance:
+                continue
+            self.expanded_count += 1
+            for direction in range(8):
+                neighbor = cell - offsets[direction]
+                if 0 <= neighbor < cell_count and moves[direction][neighbor]:
+                    neighbor_distance = distance + costs[direction]
+                    if neighbor_distance <= max_distance and neighbor_distance < distances.get(neighbor, np.inf):
+                        distances[neighbor] = neighbor_distance
+                        next_cells[neighbor] = cell
+                        heapq.heappush(queue, (neighbor_distance, neighbor))
+
+
+# 8 connected walkable cells with A* between two cells and flow fields toward a goal cell.
+# A flow field is one search every fighter walking to the same goal shares, its next_cells lead each cell
+# one step along a shortest path to the goal.
+class NavGrid:
+    def __init__(self, heights, origin, cell_size=NAV_CELL_SIZE):
+        self.heights = np.asarray(heights, dtype=np.float32)
+        self.origin = np.asarray(origin, dtype=np.float32)
+        self.cell_size = float(cell_size)
+        self.inv_cell_size = 1.0 / self.cell_size
+        self.depth, self.width = self.heights.shape
+        # goal cell to the cells expanded for it so far, most recently used last. A field is ready once that
+        # covers its whole search, what a rollback restores, see get_state.
+        self.flow_fields = OrderedDict()
+        # goal cell to its search, kept a while after the goal left flow_fields for a rollback to bring it back
+        self.flow_searches = OrderedDict()
+        self.flow_search_count = 0
+
+        # the move from a cell to its neighbor in each direction, up to BOUND_BOX_OFFSET higher and down any height,
+        # diagonal moves when both orthogonal moves are possible
+        heights = self.heights
+        walkable = np.isfinite(heights)
+        moves = []
+        for dx, dz, cost in nav_directions:
+            target_heights = np.full(heights.shape, np.inf, dtype=np.float32)
+            target_heights[max(0, -dz):self.depth - max(0, dz), max(0, -dx):self.width - max(0, dx)] = \
+                heights[max(0, dz):self.depth + min(0, dz), max(0, dx):self.width + min(0, dx)]
+            with np.errstate(invalid='ignore'):
+                move = walkable & np.isfinite(target_heights) & (target_heights - heights <= BOUND_BOX_OFFSET)
+            if dx and dz:
+                move &= moves[nav_directions.index((dx, 0, 1.0))] & moves[nav_directions.index((0, dz, 1.0))]
+                move &= np.roll(moves[nav_directions.index((0, dz, 1.0))], -dx, axis=1) & np.roll(moves[nav_directions.index((dx, 0, 1.0))], -dz, axis=0)
+            moves.append(move)
+        self.walkable = walkable.ravel().tolist()
+        # python lists, the searches look at one cell at a time
+        self.moves = [move.ravel().tolist() for move in moves]
+        self.offsets = [dz * self.width + dx for dx, dz, cost in nav_directions]
+        self.costs = [cost for dx, dz, cost in nav_directions]
+
+    def get_cell(self, position):
+        x = math.floor((position[0] - self.origin[0]) * self.inv_cell_size)
+        z = math.floor((position[2] - self.origin[1]) * self.inv_cell_size)
+        if 0 <= x < self.width and 0 <= z < self.depth:
+            return z * self.width + x
+        return -1
+
+    def get_walkable_cell(self, position):
+        # the cell of position, or the nearest walkable neighbor of it for a fighter pressed against a wall
+        cell = self.get_cell(position)
+        if cell < 0 or self.walkable[cell]:
+            return cell
+        x, z = cell % self.width, cell // self.width
+        best_cell = -1
+        best_distance = np.inf
+        for dx, dz, cost in nav_directions:
+            if 0 <= x + dx < self.width and 0 <= z + dz < self.depth:
+                neighbor = cell + dz * self.width + dx
+                center = self.get_position(neighbor)
+                distance = (center[0] - position[0]) ** 2 + (center[2] - position[2]) ** 2
+                if self.walkable[neighbor] and distance < best_distance:
+                    best_cell = neighbor
+                    best_distance = distance
+        return best_cell
+
+    def get_position(self, cell):
+        x, z = cell % self.width, cell // self.width
+        return np.array([self.origin[0] + (x + 0.5) * self.cell_size, self.heights[z, x], self.origin[1] + (z + 0.5) * self.cell_size], dtype=np.float32)
+
+    def get_distance(self, cell, other_cell):
+        # octile distance in cells, the A* heuristic
+        dx = abs(cell % self.width - other_cell % self.width)
+        dz = abs(cell // self.width - other_cell // self.width)
+        return max(dx, dz) + (math.sqrt(2.0) - 1.0) * min(dx, dz)
+
+    def find_cells(self, start_cell, goal_cell):
+        # A*, the cells after start_cell up to goal_cell or None when goal_cell is not reachable
+        if start_cell < 0 or goal_cell < 0 or not self.walkable[start_cell] or not self.walkable[goal_cell]:
+            return None
+        moves, offsets, costs = self.moves, self.offsets, self.costs
+        distances = {start_cell: 0.0}
+        parents = {start_cell: -1}
+        queue = [(self.get_distance(start_cell, goal_cell), start_cell)]
+        while queue:
+            estimate, cell = heapq.heappop(queue)
+            if cell == goal_cell:
+                cells = []
+                while cell != start_cell:
+                    cells.append(cell)
+                    cell = parents[cell]
+                return cells[::-1]
+            distance = distances[cell]
+            if distance + self.get_distance(cell, goal_cell) < estimate:
+                continue
+            for direction in range(8):
+                if moves[direction][cell]:
+                    neighbor = cell + offsets[direction]
+                    neighbor_distance = distance + costs[direction]
+                    if neighbor_distance < distances.get(neighbor, np.inf):
+                        distances[neighbor] = neighbor_distance
+                        parents[neighbor] = cell
+                        heapq.heappush(queue, (neighbor_distance + self.get_distance(neighbor, goal_cell), neighbor))
+        return None
+
+    def search_flow_field(self, goal_cell, max_distance):
+        # a whole search at once, next_cells of the cells it did not reach stay -1
+        search = FlowFieldSearch(self, goal_cell, max_distance)
+        search.expand(sys.maxsize)
+        return search.next_cells
+
+    def get_flow_search(self, goal_cell):
+        if goal_cell in self.flow_searches:
+            self.flow_searches.move_to_end(goal_cell)
+            return self.flow_searches[goal_cell]
+
+        search = FlowFieldSearch(self, goal_cell, NAV_FLOW_RANGE * self.inv_cell_size)
+        self.flow_searches[goal_cell] = search
+        self.flow_search_count += 1
+        for cached_goal_cell in list(self.flow_searches):
+            if len(self.flow_searches) <= NAV_FLOW_CACHE_SIZE * 2:
+                break
+            if cached_goal_cell not in self.flow_fields:
+                del self.flow_searches[cached_goal_cell]
+        return search
+
+    def get_flow_field(self, goal_cell, deadline=None, max_cells=None):
+        # next_cells of the field of a cached goal close enough to goal_cell, None while its search goes on.
+        # The search goes on until deadline or for max_cells more cells, to its end without either.
+        goal_x, goal_z = goal_cell % self.width, goal_cell // self.width
+        key = goal_cell
+        for cached_goal_cell in reversed(self.flow_fields):
+            if max(abs(cached_goal_cell % self.width - goal_x), abs(cached_goal_cell // self.width - goal_z)) <= NAV_FLOW_GOAL_RADIUS:
+                key = cached_goal_cell
+                break
+        if key not in self.flow_fields:
+            self.flow_fields[key] = 0
+            if NAV_FLOW_CACHE_SIZE < len(self.flow_fields):
+                self.flow_fields.popitem(last=False)
+        self.flow_fields.move_to_end(key)
+
+        # a search which ran ahead before a rollback is only paid off again, one which was dropped catches up first
+        search = self.get_flow_search(key)
+        expanded_count = self.flow_fields[key]
+        search.expand(expanded_count)
+        cell_count = 0
+        while not (search.is_done() and search.expanded_count <= expanded_count):
+            if (max_cells is not None and max_cells <= cell_count) or (deadline is not None and deadline <= time.perf_counter()):
+                break
+            chunk = NAV_SEARCH_CHUNK if max_cells is None else min(NAV_SEARCH_CHUNK, max_cells - cell_count)
+            expanded_count += chunk
+            cell_count += chunk
+            search.expand(expanded_count)
+        self.flow_fields[key] = expanded_count
+        if search.is_done() and search.expanded_count <= expanded_count:
+            return search.next_cells
+        return None
+
+    def get_state(self):
+        return list(self.flow_fields.items())
+
+    def set_state(self, state):
+        self.flow_fields = OrderedDict(state)
+
+    def get_waypoints(self, start_cell, cells):
+        # the cells where the path turns and its last cell
+        waypoints = []
+        previous_cell = start_cell
+        for i, cell in enumerate(cells):
+            if i + 1 == len(cells) or cells[i + 1] - cell != cell - previous_cell:
+                waypoints.append(self.get_position(cell))
+            previous_cell = cell
+        return waypoints
+
+    def find_path(self, start, goal, deadline=None, max_cells=None):
+        # the FighterAI find_path hook, waypoints from the shared flow field toward goal, the last one is left out
+        # since the fighter walks straight at its target after the path. None when there is no path and
+        # NAV_PATH_PENDING when the search of the field did not finish within deadline or max_cells.
+        start_cell = self.get_walkable_cell(start)
+        goal_cell = self.get_walkable_cell(goal)
+        if start_cell < 0 or goal_cell < 0:
+            return None
+        next_cells = self.get_flow_field(goal_cell, deadline, max_cells)
+        if next_cells is None:
+            return NAV_PATH_PENDING
+        if next_cells[start_cell] < 0:
+            return None
+
+        cells = []
+        cell = start_cell
+        while next_cells[cell] != cell:
+            cell = int(next_cells[cell])
+            cells.append(cell)
+        return self.get_waypoints(start_cell, cells[:-1])
+
+    def find_path_astar(self, start, goal):
+        # the same waypoints from a search of its own
+        start_cell = self.get_walkable_cell(start)
+        cells = self.find_cells(start_cell, self.get_walkable_cell(goal))
+        if cells is None:
+            return None
+        return self.get_waypoints(start_cell, cells[:-1])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('project_path', nargs='?', default=PROJECT_PATH)
+    parser.add_argument('--force', action='store_true', help='bake every scene again')
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    bake_nav_grids(args.project_path, args.force)
+    print("done in %.3f sec" % (time.perf_counter() - start_time))
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+
+import numpy as np
+
+
+# frames kept in the ring buffer and scopes it has room for, both fixed so recording never allocates
+PROFILE_FRAME_COUNT = 600
+PROFILE_SCOPE_COUNT = 32
+PROFILE_GRAPH_FRAME_COUNT = 240
+FRAME_BUDGET = 1.0 / 60.0
+PROFILE_PERCENTILES = (50.0, 99.0)
+
+# one per scope of the graph, in the order of its names
+graph_colors = ((1.0, 0.3, 0.3, 1.0),
+                (0.3, 1.0, 0.3, 1.0),
+                (0.3, 0.5, 1.0, 1.0),
+                (1.0, 1.0, 0.3, 1.0),
+                (1.0, 0.3, 1.0, 1.0),
+                (0.3, 1.0, 1.0, 1.0),
+                (1.0, 0.6, 0.2, 1.0),
+                (0.7, 0.7, 0.7, 1.0),
+                (0.6, 0.3, 1.0, 1.0),
+                (0.6, 1.0, 0.6, 1.0),
+                (1.0, 0.7, 0.7, 1.0),
+                (0.2, 0.6, 0.6, 1.0))
+budget_color = (1.0, 1.0, 1.0, 0.5)
+
+
+class NullScope:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+null_scope = NullScope()
+
+
+class ProfileScope:
+    __slots__ = ('profiler', 'name', 'index', 'start_time')
+
+    def __init__(self, profiler, name, index):
+        self.profiler = profiler
+        self.name = name
+        self.index = index
+        self.start_time = 0.0
+
+    def __enter__(self):
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # a scope entered twice in a frame adds up
+        profiler = self.profiler
+        profiler.samples[self.index, profiler.sample_index] += time.perf_counter() - self.start_time
+        return False
+
+
+# seconds spent in every named scope of the last frames, one column per frame, recording is off until enabled
+class Profiler:
+    def __init__(self, frame_count=PROFILE_FRAME_COUNT, scope_count=PROFILE_SCOPE_COUNT):
+        self.enabled = False
+        self.scopes = {}
+        self.scope_list = []
+        self.samples = np.zeros((scope_count, frame_count), dtype=np.float64)
+        self.sample_index = 0
+        self.recorded_frame_count = 0
+
+    def clear(self):
+        self.samples[...] = 0.0
+        self.sample_index = 0
+        self.recorded_frame_count = 0
+
+    def scope(self, name):
+        if not self.enabled:
+            return null_scope
+        scope = self.scopes.get(name)
+        if scope is None:
+            if len(self.samples) <= len(self.scope_list):
+                raise ValueError("no room for the profile scope %s, %d scopes are in use" % (name, len(self.scope_list)))
+            scope = ProfileScope(self, name, len(self.scope_list))
+            self.scopes[name] = scope
+            self.scope_list.append(scope)
+        return scope
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        frame_count = self.samples.shape[1]
+        self.sample_index = (self.sample_index + 1) % frame_count
+        self.samples[:, self.sample_index] = 0.0
+        # the current column is being recorded
+        self.recorded_frame_count = min(self.recorded_frame_count + 1, frame_count - 1)
+
+    def get_samples(self, frame_count=None):
+        # finished frames, oldest first
+        frame_count = self.recorded_frame_count if frame_count is None else min(frame_count, self.recorded_frame_count)
+        indices = np.arange(self.sample_index - frame_count, self.sample_index) % self.samples.shape[1]
+        return self.samples[:len(self.scope_list), indices]
+
+    def get_statistics(self):
+        # milliseconds over the frames each scope ran in
+        statistics = {}
+        for scope, samples in zip(self.scope_list, self.get_samples()):
+            samples = samples[0.0 < samples] * 1000.0
+            if 0 == len(samples):
+                continue
+            percentiles = np.percentile(samples, PROFILE_PERCENTILES)
+            statistics[scope.name] = dict(p50=float(percentiles[0]),
+                                          p99=float(percentiles[1]),
+                                          max=float(samples.max()),
+                                          frame_count=len(samples))
+        return statistics
+
+    def save_statistics(self, filepath):
+        dirname = os.path.dirname(filepath)
+        if dirname:
+            os.makedirs(dirname, exist_ok=True)
+        with open(filepath, 'w') as f:
+            json.dump(dict(frame_count=self.recorded_frame_count, scopes=self.get_statistics()), f, indent=1)
+
+    def print_statistics(self):
+        print("%-24s %10s %10s %10s" % ("scope", "p50 ms", "p99 ms", "max ms"))
+        for name, statistic in self.get_statistics().items():
+            print("%-24s %10.3f %10.3f %10.3f" % (name, statistic['p50'], statistic['p99'], statistic['max']))
+
+    def draw_graph(self, draw_line, x, y, width, height, names=None, frame_count=PROFILE_GRAPH_FRAME_COUNT, budget=FRAME_BUDGET):
+        # stacked lines of the last frames in screen space, the frame budget is at half the height
+        # draw_line is called with (pos0, pos1, color)
+        if names is None:
+            names = [scope.name for scope in self.scope_list]
+        if len(graph_colors) < len(names):
+            raise ValueError("%d profile scopes in the graph, there are colors for %d" % (len(names), len(graph_colors)))
+        # stacked in the order of names, a scope keeps its color when another one did not run yet
+        colors = [graph_colors[index] for index, name in enumerate(names) if name in self.scopes]
+        scope_indices = [self.scopes[name].index for name in names if name in self.scopes]
+        samples = self.get_samples(frame_count)[scope_indices]
+        if 0 == samples.shape[1]:
+            return
+        scale = height * 0.5 / budget
+        xs = x + np.arange(samples.shape[1], dtype=np.float32) * (width / max(1, frame_count - 1))
+        ys = y + np.minimum(np.cumsum(samples, axis=0) * scale, height)
+        for color, line_ys in zip(colors, ys):
+            for x0, y0, x1, y1 in zip(xs[:-1], line_ys[:-1], xs[1:], line_ys[1:]):
+                draw_line((x0, y0), (x1, y1), color)
+        draw_line((x, y + height * 0.5), (x + width, y + height * 0.5), budget_color)
+
+
+profiler = Profiler()
@@ -0,0 +1,67 @@
+import os
+import ast
+import gzip
+import pickle
+from collections import OrderedDict
+
+import numpy as np
+
+
+PROJECT_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+
+def get_project_filepath(*paths):
+    return os.path.join(PROJECT_PATH, *paths)
+
+
+def load_text_data(filepath):
+    with open(filepath, 'r') as f:
+        return ast.literal_eval(f.read())
+
+
+def parse_scene_node(node):
+    # literals, array(..., dtype=...) and OrderedDict(...) calls only, nothing in a scene file is executed
+    if isinstance(node, ast.Constant):
+        return node.value
+    elif isinstance(node, ast.Dict):
+        return {parse_scene_node(key): parse_scene_node(value) for key, value in zip(node.keys, node.values)}
+    elif isinstance(node, ast.List):
+        return [parse_scene_node(item) for item in node.elts]
+    elif isinstance(node, ast.Tuple):
+        return tuple(parse_scene_node(item) for item in node.elts)
+    elif isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd)):
+        value = parse_scene_node(node.operand)
+        return -value if isinstance(node.op, ast.USub) else value
+    elif isinstance(node, ast.Name) and node.id in ('inf', 'nan'):
+        return float(node.id)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'array' and 1 == len(node.args):
+        dtype = None
+        for keyword in node.keywords:
+            if keyword.arg != 'dtype' or not isinstance(keyword.value, ast.Name):
+                raise ValueError("unsupported argument of array at line %d" % node.lineno)
+            dtype = np.dtype(keyword.value.id)
+        return np.array(parse_scene_node(node.args[0]), dtype=dtype)
+    elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id == 'OrderedDict' and 1 == len(node.args) and not node.keywords:
+        # the macros of the material instances
+        return OrderedDict(parse_scene_node(node.args[0]))
+    raise ValueError("unsupported %s at line %d" % (type(node).__name__, getattr(node, 'lineno', 0)))
+
+
+def parse_scene_text(text):
+    return parse_scene_node(ast.parse(text, mode='eval').body)
+
+
+def load_scene_data(filepath):
+    # scenes are pprint'ed dicts which contain numpy reprs
+    with open(filepath, 'r') as f:
+        return parse_scene_text(f.read())
+
+
+def load_resource_data(filepath):
+    with gzip.open(filepath, 'rb') as f:
+        return pickle.load(f)
+
+
+def save_resource_data(filepath, data):
+    with gzip.open(filepath, 'wb') as f:
+        pickle.dump(data, f, protocol=pickle.HIGHEST_PROTOCOL)
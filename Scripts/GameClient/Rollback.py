@@ -0,0 +1,188 @@
+import numpy as np
+
+from GameClient.GameState import *
+from GameClient.Fighter import *
+
+
+ROLLBACK_FRAMES = 16
+
+# combo counters live on the state items, not on the state manager
+COMBO_STATES = (STATES.PUNCH, STATES.KICK, STATES.JUMP_KICK)
+
+snapshot_dtype = np.dtype([('position', np.float32, 3),
+                           ('velocity', np.float32, 3),
+                           ('yaw', np.float32),
+                           ('on_ground', np.bool_),
+                           ('press_keys', np.int32),
+                           ('key_flag', np.int32),
+                           ('last_key_flag', np.int32),
+                           ('state', np.int32),
+                           ('elapsed_time', np.float64),
+                           ('combo', np.int32, len(COMBO_STATES)),
+                           ('combo_end_time', np.float64, len(COMBO_STATES)),
+                           ('move_start_time', np.float64, len(COMBO_STATES)),
+                           ('animation', np.int32),
+                           ('animation_time', np.float64),
+                           ('animation_speed', np.float64),
+                           ('animation_loop', np.bool_),
+                           ('animation_start_time', np.float64),
+                           ('animation_end_time', np.float64),
+                           ('is_animation_end', np.bool_)])
+
+
+# preallocated ring of simulation snapshots, one row of fighters per frame
+class SnapshotBuffer:
+    def __init__(self, fighter_count, ring_size=ROLLBACK_FRAMES):
+        self.ring_size = ring_size
+        self.frames = np.full(ring_size, -1, dtype=np.int64)
+        self.snapshots = np.zeros((ring_size, fighter_count), dtype=snapshot_dtype)
+        self.animations = [None]
+        self.animation_indices = {id(None): 0}
+        # the fighter ai writes the input of its fighters from its own state, with the nav grid's flow field searches
+        self.ai_states = [None] * ring_size
+
+    def get_animation_index(self, animation):
+        key = id(animation)
+        if key not in self.animation_indices:
+            self.animation_indices[key] = len(self.animations)
+            self.animations.append(animation)
+        return self.animation_indices[key]
+
+    def has_frame(self, frame):
+        return self.frames[frame % self.ring_size] == frame
+
+    def save(self, frame, fighters, fighter_ai=None, nav_grid=None):
+        slot = frame % self.ring_size
+        count = fighters.count
+        snapshot = self.snapshots[slot]
+        snapshot['position'][:count] = fighters.positions[:count]
+        snapshot['velocity'][:count] = fighters.velocities[:count]
+        snapshot['yaw'][:count] = fighters.yaws[:count]
+        snapshot['on_ground'][:count] = fighters.on_grounds[:count]
+        snapshot['press_keys'][:count] = fighters.press_keys[:count]
+        snapshot['key_flag'][:count] = fighters.key_flags[:count]
+        snapshot['last_key_flag'][:count] = fighters.last_key_flags[:count]
+
+        for index, (actor, state_manager) in enumerate(zip(fighters.actors, fighters.state_managers)):
+            row = snapshot[index]
+            row['state'] = state_manager.get_state_key()
+            row['elapsed_time'] = state_manager.state_info.elapsed_time
+            for i, key in enumerate(COMBO_STATES):
+                state = state_manager.state_map[key]
+                row['combo'][i] = state.combo
+                row['combo_end_time'][i] = state.combo_end_time
+                row['move_start_time'][i] = state.move_start_time
+
+            if hasattr(actor, 'get_animation_state'):
+                animation, animation_time, animation_speed, animation_loop, start_time, end_time, is_animation_end = actor.get_animation_state()
+                row['animation'] = self.get_animation_index(animation)
+                row['animation_time'] = animation_time
+                row['animation_speed'] = animation_speed
+                row['animation_loop'] = animation_loop
+                row['animation_start_time'] = start_time
+                row['animation_end_time'] = end_time
+                row['is_animation_end'] = is_animation_end
+        if fighter_ai is not None:
+            self.ai_states[slot] = (fighter_ai.get_state(), None if nav_grid is None else nav_grid.get_state())
+        self.frames[slot] = frame
+
+    def restore(self, frame, fighters, fighter_ai=None, nav_grid=None):
+        if not self.has_frame(frame):
+            raise IndexError("frame %d is not in the rollback buffer" % frame)
+
+        count = fighters.count
+        snapshot = self.snapshots[frame % self.ring_size]
+        fighters.positions[:count] = snapshot['position'][:count]
+        fighters.velocities[:count] = snapshot['velocity'][:count]
+        fighters.yaws[:count] = snapshot['yaw'][:count]
+        fighters.on_grounds[:count] = snapshot['on_ground'][:count]
+        fighters.press_keys[:count] = snapshot['press_keys'][:count]
+        fighters.key_flags[:count] = snapshot['key_flag'][:count]
+        fighters.last_key_flags[:count] = snapshot['last_key_flag'][:count]
+
+        for index, (actor, state_manager) in enumerate(zip(fighters.actors, fighters.state_managers)):
+            row = snapshot[index]
+            state_manager.restore_state(int(row['state']))
+            state_manager.state_info.elapsed_time = float(row['elapsed_time'])
+            for i, key in enumerate(COMBO_STATES):
+                state = state_manager.state_map[key]
+                state.combo = int(row['combo'][i])
+                state.combo_end_time = float(row['combo_end_time'][i])
+                state.move_start_time = float(row['move_start_time'][i])
+
+            if hasattr(actor, 'set_animation_state'):
+                actor.set_animation_state((self.animations[row['animation']], float(row['animation_time']),
+                                           float(row['animation_speed']), bool(row['animation_loop']),
+                                           float(row['animation_start_time']), float(row['animation_end_time']),
+                                           bool(row['is_animation_end'])))
+            actor.transform.set_yaw(fighters.yaws[index])
+            actor.transform.set_pos(fighters.positions[index])
+
+        if fighter_ai is not None:
+            ai_state, nav_state = self.ai_states[frame % self.ring_size]
+            fighter_ai.set_state(ai_state)
+            if nav_grid is not None:
+                nav_grid.set_state(nav_state)
+
+
+# GGPO style rollback on top of a simulation with step(), frame and game_client, e.g. HeadlessSimulation.
+# The session is the input source of the game client, inputs of every fighter are given per frame.
+# The fighter ai overwrites the inputs of its fighters, the snapshots keep its state so it gives the same ones again
+# as long as it runs without a time budget like in HeadlessSimulation.
+class RollbackSession:
+    def __init__(self, simulation, ring_size=ROLLBACK_FRAMES):
+        self.simulation = simulation
+        self.game_client = simulation.game_client
+        self.fighters = self.game_client.fighters
+        self.snapshots = SnapshotBuffer(self.fighters.count, ring_size)
+        self.inputs = np.zeros((ring_size, self.fighters.count, 2), dtype=np.int32)
+        self.delta = simulation.delta
+        self.player_input = (KEY_FLAG_NONE, KEY_FLAG.NONE)
+        self.game_client.input = self
+
+    def get_frame(self):
+        return self.simulation.frame
+
+    def get_delta(self, delta):
+        return self.delta
+
+    def get_input(self, delta):
+        return self.player_input
+
+    def step(self, inputs):
+        frame = self.simulation.frame
+        self.snapshots.save(frame, self.fighters, self.game_client.fighter_ai, self.game_client.nav_grid)
+        self.inputs[frame % self.snapshots.ring_size] = inputs
+
+        for index, (press_keys, key_flag) in enumerate(inputs):
+            self.fighters.set_input(index, press_keys, key_flag)
+        self.player_input = tuple(inputs[self.game_client.player_index])
+        self.simulation.step()
+
+    def set_inputs(self, frame, inputs):
+        self.inputs[frame % self.snapshots.ring_size] = inputs
+
+    def advance(self, inputs):
+        # inputs is a (fighter_count, 2) array of press_keys and key_flag
+        self.step(np.asarray(inputs, dtype=np.int32))
+
+    def rollback(self, frame, corrected_inputs=None):
+        # restore the state at the beginning of frame and resimulate up to the current frame
+        current_frame = self.simulation.frame
+        if current_frame - frame > self.snapshots.ring_size or not self.snapshots.has_frame(frame):
+            raise IndexError("cannot roll back %d frames" % (current_frame - frame))
+
+        if corrected_inputs is not None:
+            self.set_inputs(frame, corrected_inputs)
+
+        self.restore(frame)
+        self.resimulate(current_frame - frame)
+
+    def restore(self, frame):
+        self.snapshots.restore(frame, self.fighters, self.game_client.fighter_ai, self.game_client.nav_grid)
+        self.simulation.frame = frame
+
+    def resimulate(self, frame_count):
+        for i in range(frame_count):
+            frame = self.simulation.frame
+            self.step(self.inputs[frame % self.snapshots.ring_size].copy())
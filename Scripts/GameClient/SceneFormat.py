@@ -0,0 +1,154 @@
+import os
+import time
+import pprint
+import argparse
+
+import numpy as np
+
+from GameClient.Resource import *
+from GameClient.BinaryFormat import *
+
+
+SCENE_PATH = 'Scenes'
+SCENE_EXT = '.scene'
+SCENE_BINARY_EXT = '.bscene'
+SCENE_BINARY_MAGIC = b'FGTS'
+# the width the editor saves scenes with, keeps the text of a round trip identical
+SCENE_TEXT_WIDTH = 140
+ACTOR_TRANSFORMS = 'actor_transforms'
+
+actor_groups = ('static_actors', 'collision_actors', 'skeleton_actors')
+transform_keys = ('pos', 'rot', 'scale')
+instance_keys = ('instance_pos_list', 'instance_rot_list', 'instance_scale_list')
+
+
+def is_float_vector(value):
+    return isinstance(value, list) and 3 == len(value) and all(type(item) is float for item in value)
+
+
+def is_packable_actor(actor_data):
+    # only float vectors go to the arrays, anything else would not come back as the same text
+    return all(is_float_vector(actor_data.get(key)) for key in transform_keys) and \
+        all(isinstance(actor_data.get(key), list) and all(is_float_vector(item) for item in actor_data[key]) for key in instance_keys)
+
+
+def pack_actor_transforms(actor_datas):
+    actor_count = len(actor_datas)
+    transforms = dict(transforms=np.array([[actor_data[key] for key in transform_keys] for actor_data in actor_datas], dtype=np.float64).reshape(actor_count, 3, 3),
+                      instance_counts=np.array([[len(actor_data[key]) for key in instance_keys] for actor_data in actor_datas], dtype=np.int64).reshape(actor_count, 3))
+    for key in instance_keys:
+        instances = [instance for actor_data in actor_datas for instance in actor_data[key]]
+        transforms[key] = np.array(instances, dtype=np.float64).reshape(len(instances), 3)
+
+    excluded_keys = set(transform_keys + instance_keys)
+    actor_datas = [{key: value for key, value in actor_data.items() if key not in excluded_keys} for actor_data in actor_datas]
+    return actor_datas, transforms
+
+
+def unpack_actor_transforms(actor_datas, transforms):
+    actor_datas = [dict(actor_data) for actor_data in actor_datas]
+    for actor_data, actor_transform in zip(actor_datas, transforms['transforms'].tolist()):
+        actor_data.update(zip(transform_keys, actor_transform))
+
+    for key, instance_counts in zip(instance_keys, transforms['instance_counts'].T):
+        instances = transforms[key].tolist()
+        offset = 0
+        for actor_data, instance_count in zip(actor_datas, instance_counts.tolist()):
+            actor_data[key] = instances[offset:offset + instance_count]
+            offset += instance_count
+    return actor_datas
+
+
+def pack_scene_data(scene_data):
+    # transforms of every actor group go to (actor count, pos/rot/scale, xyz) and (instance count, xyz) arrays
+    scene_data = dict(scene_data)
+    actor_transforms = {}
+    for actor_group in actor_groups:
+        actor_datas = scene_data.get(actor_group)
+        if actor_datas and all(is_packable_actor(actor_data) for actor_data in actor_datas):
+            scene_data[actor_group], actor_transforms[actor_group] = pack_actor_transforms(actor_datas)
+    scene_data[ACTOR_TRANSFORMS] = actor_transforms
+    return scene_data
+
+
+def unpack_scene_data(scene_data):
+    scene_data = dict(scene_data)
+    for actor_group, transforms in scene_data.pop(ACTOR_TRANSFORMS).items():
+        scene_data[actor_group] = unpack_actor_transforms(scene_data[actor_group], transforms)
+    return scene_data
+
+
+def save_scene_binary(filepath, scene_data):
+    save_binary_data(filepath, SCENE_BINARY_MAGIC, pack_scene_data(scene_data), pack_lists=False)
+
+
+def load_scene_binary(filepath, unpack=True):
+    # unpack=False leaves the transforms as arrays in scene_data['actor_transforms'], for loaders which place instances in bulk
+    scene_data = load_binary_data(filepath, SCENE_BINARY_MAGIC)
+    return unpack_scene_data(scene_data) if unpack else scene_data
+
+
+def format_scene_text(scene_data):
+    return pprint.pformat(scene_data, width=SCENE_TEXT_WIDTH) + '\n'
+
+
+def save_scene_text(filepath, scene_data):
+    with open(filepath, 'w') as f:
+        f.write(format_scene_text(scene_data))
+
+
+def get_scene_binary_filepath(filepath):
+    return os.path.splitext(filepath)[0] + SCENE_BINARY_EXT
+
+
+def load_scene(filepath):
+    # prefer the packed scene unless the text was saved after it
+    binary_filepath = get_scene_binary_filepath(filepath)
+    if os.path.exists(binary_filepath) and (not os.path.exists(filepath) or os.path.getmtime(filepath) <= os.path.getmtime(binary_filepath)):
+        return load_scene_binary(binary_filepath)
+    return load_scene_data(filepath)
+
+
+def convert_scene(filepath):
+    binary_filepath = get_scene_binary_filepath(filepath)
+    save_scene_binary(binary_filepath, load_scene_data(filepath))
+
+    with open(filepath, 'r') as f:
+        text = f.read()
+    if format_scene_text(load_scene_binary(binary_filepath)) != text:
+        print("%s does not round trip to the same text, it was not saved with width %d" % (filepath, SCENE_TEXT_WIDTH))
+    return binary_filepath
+
+
+def get_average_load_time(function, filepath, repeat=10):
+    # until the arrays are in memory, see read_arrays
+    start_time = time.perf_counter()
+    for i in range(repeat):
+        read_arrays(function(filepath))
+    return (time.perf_counter() - start_time) / repeat
+
+
+def convert_scenes(project_path=PROJECT_PATH, to_text=False):
+    scene_path = os.path.join(project_path, SCENE_PATH)
+    for filename in sorted(os.listdir(scene_path)):
+        name, ext = os.path.splitext(filename)
+        if to_text and ext == SCENE_BINARY_EXT:
+            # back to text for diffs and merges
+            filepath = os.path.join(scene_path, name + SCENE_EXT)
+            save_scene_text(filepath, load_scene_binary(os.path.join(scene_path, filename)))
+            print("%s" % os.path.relpath(filepath, project_path))
+        elif not to_text and ext == SCENE_EXT:
+            filepath = os.path.join(scene_path, filename)
+            binary_filepath = convert_scene(filepath)
+            print("%-40s %8d -> %8d bytes, load %.3f -> %.3f ms" % (os.path.relpath(binary_filepath, project_path),
+                                                                   os.path.getsize(filepath), os.path.getsize(binary_filepath),
+                                                                   get_average_load_time(load_scene_data, filepath) * 1000.0,
+                                                                   get_average_load_time(load_scene_binary, binary_filepath) * 1000.0))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('project_path', nargs='?', default=PROJECT_PATH)
+    parser.add_argument('--text', action='store_true', help='write the .scene text of every .bscene')
+    args = parser.parse_args()
+    convert_scenes(args.project_path, args.text)
@@ -0,0 +1,316 @@
+import os
+import sys
+import json
+import time
+import hashlib
+
+import numpy as np
+
+from GameClient.Resource import *
+from GameClient.BinaryFormat import *
+
+
+TEXTURE_PATH = 'Textures'
+TEXTURE_EXT = '.texture'
+TEXTURE_CACHE_PATH = os.path.join('Cache', 'Textures')
+TEXTURE_MANIFEST = 'manifest.json'
+COMPRESSED_TEXTURE_EXT = '.ctex'
+COMPRESSED_TEXTURE_MAGIC = b'FGTX'
+# bump when the encoder output changes, every cached texture is encoded again
+TEXTURE_ENCODER_VERSION = 1
+BLOCK_SIZE = 4
+
+compressed_formats = {'RGB': ('BC1', 'GL_COMPRESSED_RGB_S3TC_DXT1_EXT'),
+                      'RGBA': ('BC3', 'GL_COMPRESSED_RGBA_S3TC_DXT5_EXT')}
+
+bc1_block_dtype = np.dtype([('color0', '<u2'), ('color1', '<u2'), ('indices', '<u4')])
+bc4_block_dtype = np.dtype([('alpha0', 'u1'), ('alpha1', 'u1'), ('indices', 'u1', 6)])
+bc3_block_dtype = np.dtype([('alpha', bc4_block_dtype), ('color', bc1_block_dtype)])
+
+
+def get_blocks(image):
+    # (height, width, channels) to (block count, 16, channels), partial blocks repeat their edge pixels
+    height, width, channels = image.shape
+    pad_height = -height % BLOCK_SIZE
+    pad_width = -width % BLOCK_SIZE
+    if pad_height or pad_width:
+        image = np.pad(image, ((0, pad_height), (0, pad_width), (0, 0)), mode='edge')
+    block_rows = image.shape[0] // BLOCK_SIZE
+    block_cols = image.shape[1] // BLOCK_SIZE
+    blocks = image.reshape(block_rows, BLOCK_SIZE, block_cols, BLOCK_SIZE, channels).swapaxes(1, 2)
+    return blocks.reshape(block_rows * block_cols, BLOCK_SIZE * BLOCK_SIZE, channels)
+
+
+def to_rgb565(colors):
+    quantized = np.rint(np.clip(colors, 0.0, 255.0) * (np.array([31.0, 63.0, 31.0]) / 255.0)).astype(np.uint16)
+    return (quantized[:, 0] << 11) | (quantized[:, 1] << 5) | quantized[:, 2]
+
+
+def from_rgb565(colors):
+    r = (colors >> 11) & 31
+    g = (colors >> 5) & 63
+    b = colors & 31
+    return np.stack([(r << 3) | (r >> 2), (g << 2) | (g >> 4), (b << 3) | (b >> 2)], axis=-1).astype(np.float32)
+
+
+def encode_bc1_blocks(blocks):
+    # endpoints on the principal axis of every block, then the nearest of the four palette colors per pixel
+    blocks = blocks.astype(np.float32)
+    mean = blocks.mean(axis=1)
+    centered = blocks - mean[:, np.newaxis]
+    covariance = np.einsum('nki,nkj->nij', centered, centered)
+    axis = np.ones((len(blocks), 3), dtype=np.float32)
+    for i in range(4):
+        axis = np.einsum('nij,nj->ni', covariance, axis)
+        axis /= np.maximum(np.linalg.norm(axis, axis=1), 1e-8)[:, np.newaxis]
+    projections = np.einsum('nki,ni->nk', centered, axis)
+
+    color0 = to_rgb565(mean + axis * projections.max(axis=1)[:, np.newaxis])
+    color1 = to_rgb565(mean + axis * projections.min(axis=1)[:, np.newaxis])
+    # color0 > color1 selects the four color mode
+    swap = color0 < color1
+    color0, color1 = np.where(swap, color1, color0), np.where(swap, color0, color1)
+
+    endpoint0 = from_rgb565(color0)
+    endpoint1 = from_rgb565(color1)
+    palette = np.stack([endpoint0, endpoint1, (endpoint0 * 2.0 + endpoint1) / 3.0, (endpoint0 + endpoint1 * 2.0) / 3.0], axis=1)
+    distances = np.square(blocks[:, :, np.newaxis, :] - palette[:, np.newaxis, :, :]).sum(axis=-1)
+    indices = np.argmin(distances, axis=-1).astype(np.uint32)
+    indices[color0 == color1] = 0
+
+    encoded = np.empty(len(blocks), dtype=bc1_block_dtype)
+    encoded['color0'] = color0
+    encoded['color1'] = color1
+    encoded['indices'] = np.bitwise_or.reduce(indices << (np.arange(16, dtype=np.uint32) * 2), axis=1)
+    return encoded
+
+
+def encode_bc4_blocks(values):
+    values = values.astype(np.float32)
+    alpha0 = values.max(axis=1)
+    alpha1 = values.min(axis=1)
+    # alpha0 > alpha1 selects the eight value mode, interpolated values are the codes 2 to 7
+    weights = np.array([0.0, 7.0, 1.0, 2.0, 3.0, 4.0, 5.0, 6.0], dtype=np.float32) / 7.0
+    palette = alpha0[:, np.newaxis] + (alpha1 - alpha0)[:, np.newaxis] * weights
+    indices = np.argmin(np.abs(values[:, :, np.newaxis] - palette[:, np.newaxis, :]), axis=-1).astype(np.uint64)
+    indices[alpha0 == alpha1] = 0
+    bits = np.bitwise_or.reduce(indices << (np.arange(16, dtype=np.uint64) * 3), axis=1)
+
+    encoded = np.empty(len(values), dtype=bc4_block_dtype)
+    encoded['alpha0'] = alpha0
+    encoded['alpha1'] = alpha1
+    encoded['indices'] = bits.astype('<u8').view(np.uint8).reshape(-1, 8)[:, :6]
+    return encoded
+
+
+def encode_image(image, texture_format):
+    blocks = get_blocks(image)
+    if texture_format == 'BC3':
+        encoded = np.empty(len(blocks), dtype=bc3_block_dtype)
+        encoded['alpha'] = encode_bc4_blocks(blocks[:, :, 3])
+        encoded['color'] = encode_bc1_blocks(blocks[:, :, :3])
+    else:
+        encoded = encode_bc1_blocks(blocks)
+    return encoded.view(np.uint8)
+
+
+def generate_mipmaps(image):
+    # box filtered chain down to 1x1, each level from the previous one like glGenerateMipmap
+    mipmaps = [image]
+    level = image.astype(np.float32)
+    while 1 < level.shape[0] or 1 < level.shape[1]:
+        if level.shape[0] % 2 or level.shape[1] % 2:
+            level = np.pad(level, ((0, level.shape[0] % 2), (0, level.shape[1] % 2), (0, 0)), mode='edge')
+        height, width, channels = level.shape
+        if 1 < height:
+            level = (level[0::2] + level[1::2]) * 0.5
+        if 1 < width:
+            level = (level[:, 0::2] + level[:, 1::2]) * 0.5
+        mipmaps.append(np.rint(level).astype(np.uint8))
+    return mipmaps
+
+
+def get_constant_name(value):
+    # keep the GL enums by name, the cache must not depend on PyOpenGL
+    return getattr(value, 'name', value)
+
+
+def compress_texture(texture_name, texture_data, source_hash=''):
+    texture_format, internal_format = compressed_formats[texture_data['image_mode']]
+    channels = len(texture_data['image_mode'])
+    image = np.asarray(texture_data['data'], dtype=np.uint8).reshape(texture_data['height'], texture_data['width'], channels)
+
+    mip_levels = []
+    for mipmap in generate_mipmaps(image):
+        mip_levels.append(dict(width=mipmap.shape[1], height=mipmap.shape[0], data=encode_image(mipmap, texture_format)))
+
+    return dict(name=texture_name,
+                texture_type=texture_data['texture_type'],
+                width=texture_data['width'],
+                height=texture_data['height'],
+                image_mode=texture_data['image_mode'],
+                texture_format=texture_format,
+                internal_format=internal_format,
+                min_filter=get_constant_name(texture_data['min_filter']),
+                mag_filter=get_constant_name(texture_data['mag_filter']),
+                wrap=get_constant_name(texture_data['wrap']),
+                source_hash=source_hash,
+                mip_levels=mip_levels)
+
+
+def is_compressible(texture_data):
+    return texture_data['texture_type'] == 'Texture2D' and texture_data['image_mode'] in compressed_formats
+
+
+def get_source_hash(filepath):
+    sha1 = hashlib.sha1(b'%d' % TEXTURE_ENCODER_VERSION)
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def save_compressed_texture_data(filepath, compressed_data):
+    save_binary_data(filepath, COMPRESSED_TEXTURE_MAGIC, compressed_data)
+
+
+def load_compressed_texture_data(filepath):
+    return load_binary_data(filepath, COMPRESSED_TEXTURE_MAGIC)
+
+
+# compressed textures live in Cache/Textures named by the hash of their source, the manifest maps texture names to
+# hashes so the game never hashes sources and the compressor skips the ones which did not change
+class TextureCache:
+    def __init__(self, project_path=PROJECT_PATH):
+        self.project_path = project_path
+        self.cache_path = os.path.join(project_path, TEXTURE_CACHE_PATH)
+        self.manifest_filepath = os.path.join(self.cache_path, TEXTURE_MANIFEST)
+        self.manifest = {}
+        if os.path.exists(self.manifest_filepath):
+            with open(self.manifest_filepath, 'r') as f:
+                self.manifest = json.load(f)
+
+    def save_manifest(self):
+        os.makedirs(self.cache_path, exist_ok=True)
+        with open(self.manifest_filepath, 'w') as f:
+            json.dump(self.manifest, f, indent=1, sort_keys=True)
+
+    def get_source_filepath(self, texture_name):
+        return os.path.join(self.project_path, TEXTURE_PATH, texture_name + TEXTURE_EXT)
+
+    def get_cache_filepath(self, source_hash):
+        return os.path.join(self.cache_path, source_hash + COMPRESSED_TEXTURE_EXT)
+
+    def get_texture_names(self):
+        texture_path = os.path.join(self.project_path, TEXTURE_PATH)
+        texture_names = []
+        for dirpath, dirnames, filenames in os.walk(texture_path):
+            for filename in filenames:
+                if os.path.splitext(filename)[1] == TEXTURE_EXT:
+                    filepath = os.path.relpath(os.path.join(dirpath, filename), texture_path)
+                    texture_names.append(os.path.splitext(filepath)[0].replace(os.sep, '/'))
+        return sorted(texture_names)
+
+    def get_filepath(self, texture_name):
+        # None when the texture was never compressed or its source changed since
+        entry = self.manifest.get(texture_name)
+        if entry is None or entry['source_hash'] is None:
+            return None
+        source_filepath = self.get_source_filepath(texture_name)
+        if os.path.exists(source_filepath):
+            stat = os.stat(source_filepath)
+            if stat.st_size != entry['source_size'] or stat.st_mtime != entry['source_mtime']:
+                return None
+        filepath = self.get_cache_filepath(entry['source_hash'])
+        return filepath if os.path.exists(filepath) else None
+
+    def load(self, texture_name):
+        filepath = self.get_filepath(texture_name)
+        return None if filepath is None else load_compressed_texture_data(filepath)
+
+    def update(self, texture_name):
+        # returns the cached file, or None for textures which stay uncompressed, and whether it was encoded now
+        source_filepath = self.get_source_filepath(texture_name)
+        stat = os.stat(source_filepath)
+        entry = self.manifest.get(texture_name)
+        if entry is not None and stat.st_size == entry['source_size'] and stat.st_mtime == entry['source_mtime']:
+            if entry['source_hash'] is None:
+                return None, False
+            source_hash = entry['source_hash']
+        else:
+            source_hash = get_source_hash(source_filepath)
+
+        if os.path.exists(self.get_cache_filepath(source_hash)):
+            self.manifest[texture_name] = dict(source_hash=source_hash, source_size=stat.st_size, source_mtime=stat.st_mtime)
+            return self.get_cache_filepath(source_hash), False
+
+        texture_data = load_resource_data(source_filepath)
+        if not is_compressible(texture_data):
+            self.manifest[texture_name] = dict(source_hash=None, source_size=stat.st_size, source_mtime=stat.st_mtime)
+            return None, False
+
+        os.makedirs(self.cache_path, exist_ok=True)
+        filepath = self.get_cache_filepath(source_hash)
+        save_compressed_texture_data(filepath, compress_texture(texture_name, texture_data, source_hash))
+        self.manifest[texture_name] = dict(source_hash=source_hash, source_size=stat.st_size, source_mtime=stat.st_mtime)
+        return filepath, True
+
+    def remove_unused(self):
+        used_filenames = set(entry['source_hash'] + COMPRESSED_TEXTURE_EXT for entry in self.manifest.values() if entry['source_hash'] is not None)
+        for filename in os.listdir(self.cache_path):
+            if os.path.splitext(filename)[1] == COMPRESSED_TEXTURE_EXT and filename not in used_filenames:
+                os.remove(os.path.join(self.cache_path, filename))
+
+
+def get_uncompressed_size(texture_data):
+    # full rgb(a) image plus the runtime mip chain, what the texture takes in memory today
+    return texture_data['data'].nbytes * 4 // 3
+
+
+def measure_load_time(function, filepath):
+    # until the pixels are in memory, a mapped file is only read by read_arrays
+    start_time = time.perf_counter()
+    data = function(filepath)
+    read_arrays(data)
+    return data, time.perf_counter() - start_time
+
+
+def compress_textures(project_path=PROJECT_PATH):
+    texture_cache = TextureCache(project_path)
+    total_source_size = total_memory_size = total_compressed_size = 0
+    total_source_time = total_compressed_time = 0.0
+    encode_count = 0
+
+    print("%-40s %10s %10s %10s %10s %10s" % ('texture', 'source', 'memory', 'compressed', 'load ms', 'cache ms'))
+    for texture_name in texture_cache.get_texture_names():
+        filepath, encoded = texture_cache.update(texture_name)
+        texture_cache.save_manifest()
+        if filepath is None:
+            print("%-40s skipped, not an RGB or RGBA Texture2D" % texture_name)
+            continue
+        encode_count += int(encoded)
+
+        source_filepath = texture_cache.get_source_filepath(texture_name)
+        texture_data, source_time = measure_load_time(load_resource_data, source_filepath)
+        compressed_data, compressed_time = measure_load_time(load_compressed_texture_data, filepath)
+        memory_size = get_uncompressed_size(texture_data)
+        compressed_size = sum(mip_level['data'].nbytes for mip_level in compressed_data['mip_levels'])
+
+        total_source_size += os.path.getsize(source_filepath)
+        total_memory_size += memory_size
+        total_compressed_size += compressed_size
+        total_source_time += source_time
+        total_compressed_time += compressed_time
+        print("%-40s %10d %10d %10d %10.3f %10.3f%s" % (texture_name, os.path.getsize(source_filepath), memory_size, compressed_size,
+                                                        source_time * 1000.0, compressed_time * 1000.0, ' *' if encoded else ''))
+
+    texture_cache.remove_unused()
+    print("total: %d encoded, %d -> %d bytes in memory (%d saved), %d bytes on disk, load %.3f -> %.3f sec" %
+          (encode_count, total_memory_size, total_compressed_size, total_memory_size - total_compressed_size,
+           total_source_size, total_source_time, total_compressed_time))
+
+
+if __name__ == '__main__':
+    start_time = time.perf_counter()
+    compress_textures(*sys.argv[1:2])
+    print("done in %.3f sec" % (time.perf_counter() - start_time))
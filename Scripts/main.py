@@ -2,21 +2,65 @@ import numpy as np
 
 from PyEngine3D.Common import logger
 from PyEngine3D.Utilities import Singleton
+from PyEngine3D.App.GameBackend import Keyboard
 from GameClient import GameClient
+from GameClient.Profiler import profiler
+
+
+# the stages of a frame which do not contain each other, stacked in the profiler graph
+profile_graph_scopes = ('input', 'ai', 'movement', 'collision', 'state', 'combat', 'transform', 'camera', 'instances', 'animations', 'streaming')
 
 
 class ScriptManager(Singleton):
     def __init__(self):
         self.game_client = None
+        self.debug_line_manager = None
+        # P turns the profiler and its graph on and off
+        self.profile_key = Keyboard.P
+        self.is_profile_key_down = False
+        # skin the fighters from the shared bone palettes of the pose tables, off until it is checked against the renderer
+        self.use_bone_palettes = False
 
     def initialize(self, core_manager):
         logger.info("ScriptManager::initialize")
 
         self.game_client = GameClient()
+        self.game_client.loading_progress_callback = self.on_loading_progress
+        if self.use_bone_palettes:
+            self.game_client.use_bone_palettes = True
+            self.game_client.upload_bone_palette = self.upload_bone_palette
         self.game_client.initialize(core_manager)
+        self.debug_line_manager = getattr(core_manager, 'debug_line_manager', None)
+
+    def on_loading_progress(self, name, finish_count, request_count):
+        logger.info("Loading %s (%d/%d)" % (name, finish_count, request_count))
+
+    def upload_bone_palette(self, actor, palette):
+        # into the buffer the renderer binds as bone_matrices, the last one stays as prev_bone_matrices for the velocity
+        animation_buffer = actor.animation_buffers[0]
+        actor.prev_animation_buffers[0][...] = animation_buffer
+        animation_buffer[...] = palette
 
     def exit(self):
         self.game_client.exit()
 
+    def draw_profile_line(self, pos0, pos1, color):
+        self.debug_line_manager.draw_debug_line_2d(pos0, pos1, color)
+
+    def update_profile_toggle(self):
+        # once per press, recording starts over each time it is turned on
+        is_key_down = bool(self.game_client.game_backend.get_keyboard_pressed()[self.profile_key])
+        if is_key_down and not self.is_profile_key_down:
+            profiler.enabled = not profiler.enabled
+            profiler.clear()
+            logger.info("Profiler %s" % ("on" if profiler.enabled else "off"))
+        self.is_profile_key_down = is_key_down
+
     def update(self, delta):
-        self.game_client.update(delta)
+        self.update_profile_toggle()
+        with profiler.scope('frame'):
+            self.game_client.update(delta)
+        profiler.end_frame()
+
+        if profiler.enabled and self.debug_line_manager is not None:
+            profiler.draw_graph(self.draw_profile_line, 10.0, 10.0, 480.0, 160.0, names=profile_graph_scopes)